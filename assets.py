@@ -0,0 +1,184 @@
+"""Module containing the static asset pipeline for hole calc. Running this module as a script
+copies every file in static/ to static/dist/ under a content-hashed filename, writes gzip and
+brotli compressed variants next to it and emits a manifest mapping original to hashed names.
+
+The flask app reads the manifest through asset_url() in templates and serves the hashed files
+with send_asset(), which picks a precompressed variant based on the Accept-Encoding header.
+
+Assets generated by the app itself, such as data exported for scripts, are registered with
+add_generated() when the app starts. They are fingerprinted and compressed in memory, and
+served by send_asset() in the same way as built files."""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+from flask import Response, request, send_from_directory, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    # brotli is only needed at build time, the app can serve .br files without it
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+# URL prefix that hashed assets are served from, see the hashed_asset route in main.py
+ASSET_URL_PATH = '/assets/'
+# files with these extensions are text and may reference other static files by URL
+TEXT_EXTENSIONS = ('.css', '.js', '.xml', '.svg')
+# formats that are already compressed are not worth compressing again
+COMPRESSIBLE_EXTENSIONS = TEXT_EXTENSIONS + ('.ico', '.json')
+# (Accept-Encoding token, file suffix) in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# content and compressed variants of generated assets, by hashed name, see add_generated()
+_generated = {}
+
+
+def hashed_name(rel_path: str, content: bytes) -> str:
+    """Insert the first 8 hex digits of the sha256 hash of content before the file extension,
+    ex: "styles.css" becomes "styles.1a2b3c4d.css"
+    """
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:8]}{ext}"
+
+
+def _write(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _write_compressed(path: str, content: bytes):
+    """Write gzip and brotli variants of content next to path, if they are smaller"""
+    # mtime=0 keeps gzip output reproducible between builds
+    compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed['.br'] = brotli.compress(content, quality=11)
+    for suffix, data in compressed.items():
+        if len(data) < len(content):
+            _write(path + suffix, data)
+
+
+def build(static_dir: str = STATIC_DIR, build_dir: str = BUILD_DIR) -> dict:
+    """Fingerprint and precompress every file under static_dir into build_dir.
+
+    :param static_dir: directory containing source static files
+    :param build_dir: output directory, removed and recreated on every build
+    :returns: manifest dictionary mapping source paths relative to static_dir (ex:
+    "fonts/SpaceGrotesk.woff2") to hashed paths relative to build_dir
+    """
+    if brotli is None:
+        logging.warning("brotli module not installed, skipping .br variants")
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        # don't descend into a previous build output
+        dirnames[:] = [d for d in dirnames
+                       if os.path.abspath(os.path.join(dirpath, d)) != os.path.abspath(build_dir)]
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            sources.append(os.path.relpath(full_path, static_dir).replace(os.sep, '/'))
+    # binary files are hashed first, so text files referencing them can be rewritten
+    sources.sort(key=lambda p: (p.endswith(TEXT_EXTENSIONS), p))
+    manifest = {}
+    for rel_path in sources:
+        with open(os.path.join(static_dir, rel_path), 'rb') as f:
+            content = f.read()
+        if rel_path.endswith(TEXT_EXTENSIONS):
+            for source, target in manifest.items():
+                content = content.replace(f"/static/{source}".encode(),
+                                          f"{ASSET_URL_PATH}{target}".encode())
+        target = hashed_name(rel_path, content)
+        out_path = os.path.join(build_dir, target)
+        _write(out_path, content)
+        if rel_path.endswith(COMPRESSIBLE_EXTENSIONS):
+            _write_compressed(out_path, content)
+        manifest[rel_path] = target
+        logging.debug(f"Built asset {rel_path} -> {target}")
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    logging.info(f"Built {len(manifest)} static assets into {build_dir}")
+    return manifest
+
+
+def load_manifest(build_dir: str = BUILD_DIR) -> dict:
+    """Load the manifest written by build(). Returns an empty dictionary if assets have not been
+    built, in which case templates fall back to the unversioned files in static/"""
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logging.info("No static asset manifest found, serving unversioned static files")
+        return {}
+
+
+def add_generated(rel_path: str, content: bytes) -> str:
+    """Register an asset generated by the app, returning its hashed path to add to the
+    manifest. Compressed variants are kept if they are smaller, as for built assets."""
+    target = hashed_name(rel_path, content)
+    variants = {None: content, 'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+    _generated[target] = {token: data for token, data in variants.items()
+                          if token is None or len(data) < len(content)}
+    return target
+
+
+def _send_generated(filename: str):
+    variants = _generated[filename]
+    encoding = next((token for token, _ in ENCODINGS
+                     if request.accept_encodings[token] and token in variants), None)
+    response = Response(variants[encoding],
+                        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.headers['Vary'] = 'Accept-Encoding'
+    # the hashed name identifies the content, so it serves as the entity tag
+    response.set_etag(filename + (f'-{encoding}' if encoding else ''))
+    return response.make_conditional(request)
+
+
+def send_asset(filename: str, build_dir: str = None):
+    """Flask response for a hashed asset, using a precompressed variant when the client's
+    Accept-Encoding header allows it. Hashed filenames never change content, so responses are
+    marked as cacheable for a year."""
+    if filename in _generated:
+        return _send_generated(filename)
+    build_dir = build_dir or BUILD_DIR
+    if filename == MANIFEST_NAME or filename.endswith(tuple(s for _, s in ENCODINGS)):
+        abort(404)
+    asset_path = safe_join(build_dir, filename)
+    if asset_path is None:
+        abort(404)
+    encoding = None
+    send_name = filename
+    for token, suffix in ENCODINGS:
+        if request.accept_encodings[token] and os.path.isfile(asset_path + suffix):
+            encoding = token
+            send_name = filename + suffix
+            break
+    # mimetype must come from the original filename, not the .gz/.br variant
+    mimetype = None
+    if encoding is not None:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(build_dir, send_name, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    build(*sys.argv[1:3])
@@ -0,0 +1,321 @@
+"""Module containing an append-only audit log of every calculation, for quality traceability.
+
+Each calculation is stored as a fixed-width binary record of RECORD_SIZE bytes: its time, kind,
+units, numeric inputs, tolerance classes and signs, results, error message and client address.
+Routes add records with AuditLog.record(), which only puts them on a queue. A background thread
+in each worker process takes records off the queue and appends them to the log in batches, with
+one write of an O_APPEND file descriptor per batch, so records from several workers are never
+interleaved. The rows of background jobs are calculated outside of requests, by the job runner,
+which writes the records of each chunk of rows itself with a LogWriter, see jobs.py.
+
+The log is a 64 byte header followed by the records, and is read back by memory mapping it as a
+numpy structured array, see read_log(). Records are in the order they were written, which is the
+order of their times give or take the time they waited on a queue, so scans of a time range
+binary search the time column, allowing ORDER_SLACK seconds of disorder, and only filter the
+records in between. Scans by result walk the file in blocks of SCAN_BLOCK records.
+
+The inputs and results used by each kind of calculation, unused ones are NaN:
+- hole_size: pin 1, 2 and 3 diameters; bore diameter
+- hole_size_limits: pin 1, 2 and 3 nominal diameters, with their classes and signs; min and
+  max bore diameters
+- remaining_pin: pin 1 and 2 diameters, bore diameter; pin 3 diameter
+- pin_size: pin nominal diameter, with its class and sign; min and max pin diameters
+- optimize: pin 1, 2 and 3 diameters, bore tolerance plus and minus; nominal bore diameter
+- roundness: number of readings; minimum zone diameter and roundness
+- gauge_set: number of sizes, smallest and largest size, number of classes and of signs
+- bore_map: no longer recorded, its code is kept so later codes are unchanged
+- job: number of rows and kind of the rows, as its code in KINDS, of a submitted background
+  job; each row is recorded as a calculation of its kind when the job runner calculates it,
+  without a client address
+
+Configuration keys read from the flask app config:
+- AUDIT_LOG_ENABLED: record calculations
+- AUDIT_LOG_PATH: path of the log file
+- AUDIT_LOG_FLUSH_INTERVAL: longest time in seconds records wait on the queue before a write
+- AUDIT_LOG_BATCH_SIZE: maximum number of records in one write
+"""
+
+import atexit
+import csv
+import fcntl
+import ipaddress
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import numpy as np
+from flask import current_app
+
+DEFAULT_PATH = 'holecalc-audit.log'
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 4096
+MAGIC = b'HCAUDIT1'
+HEADER_SIZE = 64
+INPUTS = 6
+RECORD = np.dtype([
+    ('time', '<f8'),  # unix time in seconds
+    ('inputs', '<f8', (INPUTS,)),
+    ('result', '<f8', (2,)),
+    ('kind', 'u1'),  # index in KINDS plus one
+    ('units', 'u1'),  # index in UNITS plus one
+    ('classes', 'u1', (3,)),  # index in CLASSES plus one, 0 if none
+    ('signs', 'i1', (3,)),  # 1 for plus, -1 for minus, 0 if none
+    ('client', 'u1', (16,)),  # IPv6 address, IPv4 addresses are mapped to IPv6
+    ('error', 'S48'),  # UTF-8 error message, truncated
+])
+RECORD_SIZE = RECORD.itemsize
+# codes stored in the log are indexes in these, so new values may only be appended
+KINDS = ('hole_size', 'hole_size_limits', 'remaining_pin', 'pin_size', 'optimize', 'roundness',
+         'gauge_set', 'bore_map', 'job')
+UNITS = ('in', 'mm')
+CLASSES = ('XX', 'X', 'Y', 'Z', 'ZZ')
+# greatest number of seconds a record may be written after a later record
+ORDER_SLACK = 60.0
+# records filtered at a time by scans
+SCAN_BLOCK = 1 << 20
+CSV_COLUMNS = (('time', 'kind', 'units') + tuple(f'input{i}' for i in range(1, INPUTS + 1)) +
+               ('class1', 'sign1', 'class2', 'sign2', 'class3', 'sign3', 'result1', 'result2',
+                'error', 'client'))
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _client_bytes(address: str) -> bytes:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return bytes(16)
+    if ip.version == 4:
+        ip = ipaddress.IPv6Address(b'\0' * 10 + b'\xff\xff' + ip.packed)
+    return ip.packed
+
+
+def _client_text(packed: bytes) -> str:
+    if not any(packed):
+        return ''
+    ip = ipaddress.IPv6Address(packed)
+    return str(ip.ipv4_mapped or ip)
+
+
+def make_record(kind: str, units: str, inputs: tuple, result: tuple = (), error: str = None,
+                classes: tuple = (), signs: tuple = (), client: str = None,
+                timestamp: float = None) -> tuple:
+    """Record of a calculation as a tuple of RECORD fields. Inputs and results are Decimals,
+    numbers or strings, signs are "+" or "-"."""
+    values = [_float(v) for v in inputs]
+    results = [_float(v) for v in result]
+    return (time.time() if timestamp is None else timestamp,
+            values + [math.nan] * (INPUTS - len(values)),
+            results + [math.nan] * (2 - len(results)),
+            KINDS.index(kind) + 1,
+            UNITS.index(units) + 1 if units in UNITS else 0,
+            [CLASSES.index(c) + 1 if c in CLASSES else 0 for c in classes] +
+            [0] * (3 - len(classes)),
+            [1 if s == '+' else -1 for s in signs] + [0] * (3 - len(signs)),
+            list(_client_bytes(client or '')),
+            (error or '').encode()[:RECORD['error'].itemsize])
+
+
+class LogWriter:
+    """Appends batches of records to a log file, creating it with its header if needed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # the header is written once, under a lock so no worker appends records before it
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.write(fd, MAGIC.ljust(HEADER_SIZE, b'\0'))
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self.fd = fd
+
+    def write(self, records: list):
+        data = np.array(records, dtype=RECORD).tobytes()
+        written = os.write(self.fd, data)
+        if written != len(data):
+            raise OSError(f"Short write of {written} of {len(data)} bytes to {self.path}")
+
+    def close(self):
+        os.close(self.fd)
+
+
+class AuditLog:
+    """Flask extension queueing a record of each calculation, written to the log by a background
+    thread in each worker process"""
+
+    def __init__(self, app=None, client_func=None):
+        self.app = None
+        self.client_func = client_func
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['auditlog'] = self
+        atexit.register(self.close)
+
+    def record(self, kind: str, units: str, inputs: tuple, result: tuple = (), error: str = None,
+               classes: tuple = (), signs: tuple = ()):
+        """Queue a record of a calculation made by the current request, see make_record()"""
+        if not current_app.config.get('AUDIT_LOG_ENABLED', False):
+            return
+        client = self.client_func() if self.client_func is not None else None
+        self._start().put(make_record(kind, units, inputs, result, error, classes, signs,
+                                      client))
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until the records queued so far have been written, returns whether they were"""
+        if self._queue is None or self._pid != os.getpid():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Write the records queued so far and stop the background thread, which is started
+        again by the next record"""
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                return
+            stopped = threading.Event()
+            self._queue.put(stopped)
+            self._queue.put(None)
+            self._queue = self._pid = None
+        stopped.wait(10.0)
+
+    def _start(self) -> queue.SimpleQueue:
+        # the thread is started lazily, and again in each forked worker
+        with self._lock:
+            if self._pid != os.getpid():
+                config = self.app.config
+                self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._run, name='audit-log', daemon=True,
+                    args=(self._queue, config.get('AUDIT_LOG_PATH', DEFAULT_PATH),
+                          config.get('AUDIT_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                          config.get('AUDIT_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE))).start()
+            return self._queue
+
+    @staticmethod
+    def _run(records: queue.SimpleQueue, path: str, interval: float, batch_size: int):
+        writer = None
+        while True:
+            batch = [records.get()]
+            if batch[0] is None:
+                if writer is not None:
+                    writer.close()
+                return
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(records.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            waiting = [r for r in batch if isinstance(r, threading.Event)]
+            batch = [r for r in batch if not isinstance(r, threading.Event)]
+            if batch:
+                try:
+                    writer = writer or LogWriter(path)
+                    writer.write(batch)
+                except OSError:
+                    logging.exception(f"Could not write {len(batch)} records to audit log {path}")
+                if time.time() - batch[0][0] > ORDER_SLACK:
+                    logging.warning(f"Audit log records waited over {ORDER_SLACK} seconds to be "
+                                    f"written, time scans may miss them")
+            for event in waiting:
+                event.set()
+
+
+def read_log(path: str) -> np.ndarray:
+    """Memory map the complete records of a log as a read-only structured array of RECORD"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an audit log")
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+    if count == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def scan(records: np.ndarray, start: float = None, end: float = None, kind: str = None,
+         units: str = None, min_result: float = None, max_result: float = None):
+    """Iterate over the records matching all of the given filters, as arrays of up to
+    SCAN_BLOCK records in log order.
+
+    :param start: Earliest time of records, as unix time
+    :param end: Latest time of records, as unix time
+    :param kind: Kind of calculation, one of KINDS
+    :param units: Units of calculations, one of UNITS
+    :param min_result: Records with a result below this are left out, as are those without
+    results. A record with two results is kept if either is in range.
+    :param max_result: Records with a result above this are left out
+    """
+    times = records['time']
+    # binary search is valid for records out of order by at most ORDER_SLACK seconds
+    first = 0 if start is None else int(np.searchsorted(times, start - ORDER_SLACK))
+    last = len(records) if end is None else int(np.searchsorted(times, end + ORDER_SLACK,
+                                                                side='right'))
+    for offset in range(first, last, SCAN_BLOCK):
+        block = records[offset:min(offset + SCAN_BLOCK, last)]
+        mask = np.ones(len(block), dtype=bool)
+        if start is not None:
+            mask &= block['time'] >= start
+        if end is not None:
+            mask &= block['time'] <= end
+        if kind is not None:
+            mask &= block['kind'] == KINDS.index(kind) + 1
+        if units is not None:
+            mask &= block['units'] == UNITS.index(units) + 1
+        if min_result is not None or max_result is not None:
+            result = block['result']
+            in_range = ~np.isnan(result)
+            if min_result is not None:
+                in_range &= result >= min_result
+            if max_result is not None:
+                in_range &= result <= max_result
+            mask &= in_range.any(axis=1)
+        if mask.any():
+            yield block[mask]
+
+
+def _number_text(values: np.ndarray) -> list:
+    # repr gives the shortest text that reads back as the same float, '' for NaN
+    return [['' if v != v else repr(v) for v in row] for row in values.tolist()]
+
+
+def write_csv(blocks, file) -> int:
+    """Write arrays of records to a text file as CSV with CSV_COLUMNS, returns the number of
+    records written. Times are ISO 8601 UTC."""
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    kinds = ('',) + KINDS
+    units = ('',) + UNITS
+    classes = ('',) + CLASSES
+    signs = {0: '', 1: '+', -1: '-'}
+    for block in blocks:
+        times = np.datetime_as_string((block['time'] * 1e6).astype('datetime64[us]'), unit='us')
+        inputs = _number_text(block['inputs'])
+        results = _number_text(block['result'])
+        for i, record in enumerate(block.tolist()):
+            pins = []
+            for tol_class, sign in zip(record[5], record[6]):
+                pins += [classes[tol_class], signs[sign]]
+            writer.writerow([times[i] + 'Z', kinds[record[3]], units[record[4]]] + inputs[i] +
+                            pins + results[i] +
+                            [record[8].decode(errors='replace'), _client_text(bytes(record[7]))])
+        count += len(block)
+    return count
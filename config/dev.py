@@ -7,3 +7,11 @@ TESTING = False
 SECRET_KEY = os.environ.get('SECRET_KEY') or 'some-placeholder-key'
 WTF_CSRF_ENABLED = False
 DEBUG = True
+RATELIMIT_ENABLED = False
+RESULT_CACHE_ENABLED = False
+SERVER_TIMING_LOG = True
+WARMUP_ENABLED = False
+JOBS_ENABLED = False
+MEMPROFILE_ENABLED = False
+AUDIT_LOG_ENABLED = False
+PARALLEL_ENABLED = False
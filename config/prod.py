@@ -9,3 +9,51 @@ if not SECRET_KEY:
 TESTING = False
 WTF_CSRF_ENABLED = True
 HASH_ROUNDS = 1
+# number of reverse proxies in front of gunicorn appending to X-Forwarded-For, see client_ip()
+PROXY_TRUSTED_HOPS = 1
+# admission control, see ratelimit.py
+RATELIMIT_ENABLED = True
+RATELIMIT_STATE_FILE = '/dev/shm/holecalc-ratelimit'
+RATELIMIT_MAX_CONCURRENT = 16
+# (burst, requests per second) per client, per route
+RATELIMIT_DEFAULT = (20, 2.0)
+RATELIMIT_ROUTES = {}
+# result cache shared between gunicorn workers, see resultcache.py
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_FILE = '/dev/shm/holecalc-results'
+RESULT_CACHE_SLOTS = 16384
+# relative cost of gauge pins in each tolerance class, used by the tolerance class optimizer
+TOLERANCE_CLASS_COSTS = {'XX': 4.0, 'X': 2.5, 'Y': 1.6, 'Z': 1.3, 'ZZ': 1.0}
+# Server-Timing response header with per-stage request durations, see timing.py
+SERVER_TIMING_ENABLED = True
+SERVER_TIMING_LOG = False
+# warm up each gunicorn worker before it accepts requests, see warmup.py
+WARMUP_ENABLED = True
+# background jobs for large calculation batches, see jobs.py
+JOBS_ENABLED = True
+JOBS_DATABASE = os.environ.get('JOBS_DATABASE', '/app/data/holecalc-jobs.sqlite')
+JOBS_PROCESSES = 2
+JOBS_CHUNK_SIZE = 1000
+JOBS_MAX_ROWS = 1000000
+JOBS_RETENTION = 7 * 24 * 3600
+# per-worker memory profiling with reports in /dev/shm, see memprofile.py
+MEMPROFILE_ENABLED = True
+MEMPROFILE_DIR = '/dev/shm'
+MEMPROFILE_INTERVAL = 600
+MEMPROFILE_SAMPLE_RATE = 0.002
+MEMPROFILE_FRAMES = 1
+MEMPROFILE_TOP = 25
+MEMPROFILE_TOKEN = os.environ.get('ADMIN_TOKEN')
+# append-only log of every calculation for traceability, see auditlog.py
+AUDIT_LOG_ENABLED = True
+AUDIT_LOG_PATH = os.environ.get('AUDIT_LOG', '/app/data/holecalc-audit.log')
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+AUDIT_LOG_BATCH_SIZE = 4096
+# process pool for large calculations within a request, see parallel.py
+PARALLEL_ENABLED = True
+# each worker has its own pool, so by default every pool has a share of the CPUs. Read from the
+# same environment variable as the number of workers in gunicorn_conf.py
+PARALLEL_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 4))
+PARALLEL_THRESHOLD = 1 << 18
+PARALLEL_CHUNK = 1 << 16
+PARALLEL_DIR = '/dev/shm'
@@ -8,3 +8,12 @@ TESTING = True
 WTF_CSRF_ENABLED = False
 HASH_ROUNDS = 1
 DEBUG = False
+PROXY_TRUSTED_HOPS = 1
+RATELIMIT_ENABLED = False
+RESULT_CACHE_ENABLED = False
+SERVER_TIMING_LOG = False
+WARMUP_ENABLED = False
+JOBS_ENABLED = False
+MEMPROFILE_ENABLED = False
+AUDIT_LOG_ENABLED = False
+PARALLEL_ENABLED = False
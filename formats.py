@@ -0,0 +1,170 @@
+"""Module containing the encodings of bulk calculation results, chosen by content negotiation on
+the request's Accept header. Results are encoded one chunk at a time, so they can be streamed.
+
+- application/json: one JSON object, with the results as a list
+- application/x-ndjson: one JSON result per line
+- application/msgpack: the same object as JSON, as MessagePack. msgpack is in the Pipfile, but
+  the format is left out rather than failing where it is not installed.
+- application/vnd.holecalc.columns: columnar, with every number of the results in a column of
+  little-endian float64 values, and every error in a column of little-endian int32 codes.
+  Readers can map the columns straight into arrays with no per-result objects.
+
+The columnar format starts with the magic bytes b'HCCOLS1\\n', followed by a header and then a
+batch per chunk of results. The header and each batch start with a little-endian uint32 length
+of a UTF-8 JSON object, padded with spaces so the data that follows is 8 byte aligned. The
+header object holds "id", "kind", "rows" (the total number of results), "float_columns" and
+"error_columns" (lists of column names). A batch object holds "rows", its number of results, and
+"errors", the messages its error codes refer to. It is followed by each float column of the
+batch, then each error column, padded with zero bytes to a multiple of 8 bytes. A missing number
+is NaN, and a missing error is -1. read_columns() decodes the format.
+"""
+
+import json
+import struct
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    # without msgpack the MessagePack format is not offered
+    msgpack = None
+
+JSON = 'application/json'
+NDJSON = 'application/x-ndjson'
+MSGPACK = 'application/msgpack'
+COLUMNS = 'application/vnd.holecalc.columns'
+COLUMNS_MAGIC = b'HCCOLS1\n'
+CIRCLE_COLUMNS = tuple(f'circle{i}_{k}' for i in (1, 2, 3) for k in 'xyr')
+
+
+def offered() -> list:
+    """Formats that can be encoded, in order of preference when the client accepts any"""
+    return [JSON, NDJSON] + ([MSGPACK] if msgpack is not None else []) + [COLUMNS]
+
+
+def _number(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _hole(result: dict) -> list:
+    """Numbers of a hole size or remaining pin result: the result and its circles"""
+    circles = result.get('circles') or ()
+    numbers = [_number(result['result'])]
+    for circle in circles:
+        numbers.extend((circle['x'], circle['y'], circle['r']))
+    return numbers + [np.nan] * (1 + len(CIRCLE_COLUMNS) - len(numbers))
+
+
+def _hole_layout(result: dict) -> tuple:
+    return _hole(result), [result['error']]
+
+
+def _limits_layout(result: list) -> tuple:
+    return _hole(result[0]) + _hole(result[1]), [result[0]['error'], result[1]['error']]
+
+
+def _pin_size_layout(result: dict) -> tuple:
+    limits = result['result'] or (None, None)
+    return [_number(limits[0]), _number(limits[1])], [result['error']]
+
+
+_HOLE_COLUMNS = ('result',) + CIRCLE_COLUMNS
+# job kind: (float columns, error columns, numbers and errors of one result)
+LAYOUTS = {
+    'hole_size': (_HOLE_COLUMNS, ('error',), _hole_layout),
+    'remaining_pin': (_HOLE_COLUMNS, ('error',), _hole_layout),
+    'hole_size_limits': (tuple('min_' + c for c in _HOLE_COLUMNS) +
+                         tuple('max_' + c for c in _HOLE_COLUMNS),
+                         ('min_error', 'max_error'), _limits_layout),
+    'pin_size': (('min', 'max'), ('error',), _pin_size_layout),
+}
+
+
+def _padded_json(value: dict) -> bytes:
+    """uint32 length and JSON text, padded so the next byte is 8 byte aligned"""
+    text = json.dumps(value).encode()
+    text += b' ' * (-(len(text) + 4) % 8)
+    return struct.pack('<I', len(text)) + text
+
+
+def _columns_batch(kind: str, results: list) -> bytes:
+    float_columns, error_columns, layout = LAYOUTS[kind]
+    numbers = np.empty((len(float_columns), len(results)), dtype='<f8')
+    codes = np.full((len(error_columns), len(results)), -1, dtype='<i4')
+    errors = {}
+    for i, result in enumerate(results):
+        values, messages = layout(result)
+        numbers[:, i] = values
+        for j, message in enumerate(messages):
+            if message is not None:
+                codes[j, i] = errors.setdefault(message, len(errors))
+    data = numbers.tobytes() + codes.tobytes()
+    return (_padded_json({'rows': len(results), 'errors': list(errors)}) + data +
+            b'\0' * (-len(data) % 8))
+
+
+def encode(mimetype: str, job: dict, chunks):
+    """Iterate over the encoding of a finished job's results as bytes, from an iterable of the
+    JSON array text of each chunk of results"""
+    if mimetype == JSON:
+        yield json.dumps({'id': job['id'], 'kind': job['kind']})[:-1].encode() + b', "results": ['
+        for i, chunk in enumerate(chunks):
+            # each chunk is a JSON array, joined into one by removing its brackets
+            yield (b',' if i else b'') + chunk[1:-1].encode()
+        yield b']}'
+    elif mimetype == NDJSON:
+        for chunk in chunks:
+            yield ''.join(json.dumps(result) + '\n' for result in json.loads(chunk)).encode()
+    elif mimetype == MSGPACK:
+        packer = msgpack.Packer()
+        yield (packer.pack_map_header(3) + packer.pack('id') + packer.pack(job['id']) +
+               packer.pack('kind') + packer.pack(job['kind']) + packer.pack('results') +
+               packer.pack_array_header(job['total']))
+        for chunk in chunks:
+            yield b''.join(packer.pack(result) for result in json.loads(chunk))
+    elif mimetype == COLUMNS:
+        float_columns, error_columns, _ = LAYOUTS[job['kind']]
+        yield COLUMNS_MAGIC + _padded_json({
+            'id': job['id'], 'kind': job['kind'], 'rows': job['total'],
+            'float_columns': list(float_columns), 'error_columns': list(error_columns)})
+        for chunk in chunks:
+            yield _columns_batch(job['kind'], json.loads(chunk))
+    else:
+        raise ValueError(f"Unknown format {mimetype}")
+
+
+def _read_json(data: bytes, offset: int) -> tuple:
+    length, = struct.unpack_from('<I', data, offset)
+    offset += 4
+    return json.loads(data[offset:offset + length]), offset + length
+
+
+def read_columns(data: bytes) -> tuple:
+    """Decode the columnar format, returning its header, a dictionary of column name to numpy
+    array, and the list of error messages that the error column codes refer to"""
+    if not data.startswith(COLUMNS_MAGIC):
+        raise ValueError("Not in the columnar results format")
+    header, offset = _read_json(data, len(COLUMNS_MAGIC))
+    float_columns, error_columns = header['float_columns'], header['error_columns']
+    batches = {name: [] for name in float_columns + error_columns}
+    errors = {}
+    while offset < len(data):
+        batch, offset = _read_json(data, offset)
+        rows = batch['rows']
+        numbers = np.frombuffer(data, dtype='<f8', count=len(float_columns) * rows,
+                                offset=offset).reshape(len(float_columns), rows)
+        offset += numbers.nbytes
+        codes = np.frombuffer(data, dtype='<i4', count=len(error_columns) * rows,
+                              offset=offset).reshape(len(error_columns), rows)
+        offset += codes.nbytes + (-codes.nbytes % 8)
+        # map the batch's error codes to codes into the list of all errors, -1 stays -1
+        mapping = np.array([errors.setdefault(e, len(errors)) for e in batch['errors']] + [-1],
+                           dtype='<i4')
+        for name, column in zip(float_columns, numbers):
+            batches[name].append(column)
+        for name, column in zip(error_columns, codes):
+            batches[name].append(mapping[column])
+    columns = {name: np.concatenate(parts) if parts else
+               np.empty(0, dtype='<i4' if name in error_columns else '<f8')
+               for name, parts in batches.items()}
+    return header, columns, list(errors)
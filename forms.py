@@ -1,9 +1,14 @@
 """Module that defines forms used in hole calc's three pin, reverse and pin size calculators.
  Forms are composed here using WTForms and Flask-WTF"""
 
+from decimal import Decimal, InvalidOperation
+import re
 from flask_wtf import FlaskForm
-from wtforms import DecimalField, RadioField, SelectField, SubmitField
-from wtforms.validators import DataRequired, NumberRange
+from wtforms import DecimalField, RadioField, SelectField, SelectMultipleField, SubmitField, \
+    TextAreaField
+from wtforms.validators import DataRequired, InputRequired, NumberRange, Optional, \
+    ValidationError
+from wtforms.widgets import CheckboxInput, ListWidget
 
 
 class PinSizeDecimal(DecimalField):
@@ -128,3 +133,150 @@ class PinSizeForm(FlaskForm):
         ]
     )
     calculate = SubmitField('Calculate')
+
+
+class OptimizeForm(FlaskForm):
+    """Defines input form for tolerance class optimizer"""
+    pin1 = PinSizeDecimal(1)
+    pin2 = PinSizeDecimal(2)
+    pin3 = PinSizeDecimal(3)
+    tolerance_plus = DecimalField(
+        label='Bore +',
+        validators=[InputRequired(), NumberRange(min=0, message="Tolerance cannot be negative")]
+    )
+    tolerance_minus = DecimalField(
+        label='Bore -',
+        validators=[InputRequired(), NumberRange(min=0, message="Tolerance cannot be negative")]
+    )
+    units = SelectField(
+        label='Units',
+        choices=[
+            ('in', 'IN'),
+            ('mm', 'MM')
+        ]
+    )
+    precision = SelectField(
+        label='Precision',
+        choices=[
+            ('0.001', '0.001'),
+            ('0.0001', '0.0001'),
+            ('0.00001', '0.00001'),
+            ('0.000001', '0.000001'),
+        ],
+        default='0.00001'
+    )
+    calculate = SubmitField('Optimize')
+
+
+def parse_readings(text: str) -> list:
+    """Split roundness readings entered one per line, as four numbers separated by spaces or
+    commas, into a list of (pin1, pin2, pin3, angle) tuples of strings"""
+    readings = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        values = [v for v in re.split(r'[\s,;]+', line) if v]
+        if not values:
+            continue
+        try:
+            [Decimal(v) for v in values]
+        except InvalidOperation:
+            raise ValidationError(f"Line {number} is not numbers")
+        if len(values) != 4:
+            raise ValidationError(f"Line {number} needs pin 1, pin 2, pin 3 and angle")
+        readings.append(tuple(values))
+    return readings
+
+
+class RoundnessForm(FlaskForm):
+    """Defines input form for bore roundness evaluation"""
+    readings = TextAreaField(label='Readings', validators=[DataRequired()])
+    units = SelectField(
+        label='Units',
+        choices=[
+            ('in', 'IN'),
+            ('mm', 'MM')
+        ]
+    )
+    precision = SelectField(
+        label='Precision',
+        choices=[
+            ('0.001', '0.001'),
+            ('0.0001', '0.0001'),
+            ('0.00001', '0.00001'),
+            ('0.000001', '0.000001'),
+        ],
+        default='0.0001'
+    )
+    calculate = SubmitField('Evaluate')
+
+    def validate_readings(self, field):
+        if not parse_readings(field.data):
+            raise ValidationError("Enter at least one reading")
+
+
+def parse_sizes(text: str) -> list:
+    """Split nominal gage sizes separated by spaces, commas or new lines into a list of
+    strings"""
+    sizes = [v for v in re.split(r'[\s,;]+', text) if v]
+    for number, size in enumerate(sizes, start=1):
+        try:
+            Decimal(size)
+        except InvalidOperation:
+            raise ValidationError(f"Size {number} is not a number")
+    return sizes
+
+
+class MultiCheckboxField(SelectMultipleField):
+    """Defines a multiple selection shown as a list of checkboxes"""
+    widget = ListWidget(prefix_label=False)
+    option_widget = CheckboxInput()
+
+
+class GaugeSetForm(FlaskForm):
+    """Defines input form for gage set limits, from a list or a range of sizes"""
+    sizes = TextAreaField(label='Sizes')
+    start = DecimalField(label='From', validators=[Optional()])
+    stop = DecimalField(label='To', validators=[Optional()])
+    step = DecimalField(label='Step', validators=[Optional()])
+    classes = MultiCheckboxField(
+        label='Classes',
+        choices=[
+            ('XX', 'XX'),
+            ('X', 'X'),
+            ('Y', 'Y'),
+            ('Z', 'Z'),
+            ('ZZ', 'ZZ'),
+        ],
+        default=['ZZ'],
+        validators=[DataRequired(message="Select at least one class")]
+    )
+    signs = MultiCheckboxField(
+        label='Signs',
+        choices=[
+            ('+', '+'),
+            ('-', '-')
+        ],
+        default=['+', '-'],
+        validators=[DataRequired(message="Select at least one sign")]
+    )
+    units = SelectField(
+        label='Units',
+        choices=[
+            ('in', 'IN'),
+            ('mm', 'MM')
+        ]
+    )
+    output = RadioField(
+        label='Output',
+        choices=[
+            ('html', 'Printable sheet'),
+            ('csv', 'CSV')
+        ],
+        default='html'
+    )
+    calculate = SubmitField('Generate')
+
+    def validate_sizes(self, field):
+        if parse_sizes(field.data or ''):
+            return
+        if None in (self.start.data, self.stop.data, self.step.data):
+            raise ValidationError("Enter sizes or a size range")
@@ -1,4 +1,34 @@
 # Configuration file for Gunicorn. Included because the base docker image was timing out workers
-workers = 4  # Define the number of processes to be opened for processing requests at the same time
+import os
+
+# Define the number of processes to be opened for processing requests at the same time. Also read
+# by PARALLEL_WORKERS in config/prod.py
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
 timeout = 1000
 worker_tmp_dir = "/dev/shm"
+
+
+def child_exit(server, worker):
+    """Release rate limit slots held by a worker that has exited, see ratelimit.py"""
+    import ratelimit
+    ratelimit.release_worker(worker.pid)
+
+
+def post_worker_init(worker):
+    """Warm up the worker before it accepts requests, see warmup.py"""
+    import warmup
+    warmup.run(worker.wsgi)
+
+
+def when_ready(server):
+    """Start the background job runner, see jobs.py"""
+    import jobs
+    server.job_runner = jobs.start_runner()
+
+
+def on_exit(server):
+    """Stop the background job runner, its current job resumes when it is started again"""
+    runner = getattr(server, 'job_runner', None)
+    if runner is not None:
+        runner.terminate()
+        runner.wait()
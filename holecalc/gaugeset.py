@@ -0,0 +1,169 @@
+"""Module containing the limits of a whole set of gauge pins at once, for certification sheets.
+
+A gauge set is every combination of a list of nominal diameters with tolerance classes and
+signs. All diameters are scaled to integers in units of the smallest decimal place used by the
+sizes or by the tolerance table, so the tolerance of every size is found with one search of the
+table's size ranges, and the limits are exact, as with the Decimal arithmetic of
+pin_tolerance_limits().
+"""
+
+from decimal import Decimal, InvalidOperation
+import logging
+import numpy as np
+from holecalc.holecalc import TOL_CLASSES, TOL_TABLE_IN, TOL_TABLE_MM
+
+# maximum number of nominal sizes in one set, each giving a row per class and sign
+MAX_SIZES = 10000
+MAX_DECIMALS = 9
+TOL_TABLES = {'in': TOL_TABLE_IN, 'mm': TOL_TABLE_MM}
+# sizes at or below these have no tolerance class, as in pin_tolerance_limits()
+LOWER_LIMITS = {'in': Decimal(".0010"), 'mm': Decimal("0.254")}
+# display precision of gauge limits, as on the gage size calculator
+PRECISION = {'in': "0.000001", 'mm': "0.0001"}
+SIGNS = ('+', '-')
+OUT_OF_RANGE = 'Diameter not within tolerance class limits'
+
+
+def _decimals(value: Decimal) -> int:
+    return max(0, -value.as_tuple().exponent)
+
+
+def _scaled(values: list, decimals: int) -> np.ndarray:
+    """Scale Decimal values to int64 in units of 10^-decimals. Values far outside the tolerance
+    table are clipped, they are out of range either way."""
+    limit = 10 ** 6 * 10 ** decimals
+    return np.array([max(-limit, min(limit, int(v.scaleb(decimals)))) for v in values],
+                    dtype=np.int64)
+
+
+def size_range(start: str, stop: str, step: str) -> list:
+    """Nominal sizes from start to stop inclusive, every step, as strings.
+
+    :raises ValueError: if the range is empty or has more than MAX_SIZES sizes
+    """
+    try:
+        start, stop, step = Decimal(start), Decimal(stop), Decimal(step)
+    except InvalidOperation:
+        raise ValueError("Size range must be numbers")
+    if not all(v.is_finite() for v in (start, stop, step)):
+        raise ValueError("Size range must be numbers")
+    if step <= 0 or stop < start:
+        raise ValueError("Size range must have a positive step and end after its start")
+    count = int((stop - start) / step) + 1
+    if count > MAX_SIZES:
+        raise ValueError(f"Size range has more than {MAX_SIZES} sizes")
+    return [str(start + step * i) for i in range(count)]
+
+
+def gauge_set_limits(sizes: list, classes: list, signs: list, units: str = "in") -> dict:
+    """Calculate the minimum and maximum diameters of every combination of nominal size,
+    tolerance class and sign in a gauge set. Errors are returned as descriptive text, as in
+    pin_size_wrapper(). Sizes outside the tolerance table are not an error of the whole set,
+    they are marked in "valid".
+
+    :param sizes: List of strings representing decimal nominal diameters, ex: ["0.25", "0.26"]
+    :param classes: List of tolerance classes, ex: ["XX", "ZZ"]
+    :param signs: List of "+" and "-" signs
+    :param units: Str containing "in" or "mm", designating the units of measurement
+    :returns: Dictionary containing "result" and "error" keys. result value is a dictionary with
+    the "sizes", "classes", "signs" and "units" of the set, "decimals", the number of decimal
+    places the limits are scaled by, "valid", a boolean array of whether each size is within the
+    tolerance table, and "min" and "max", integer arrays of shape (sizes, classes, signs) of the
+    scaled limits.
+    """
+    try:
+        if units not in TOL_TABLES:
+            raise ValueError(f"Invalid units specified: {units}")
+        for tol_class in classes:
+            if tol_class not in TOL_CLASSES:
+                raise ValueError(f"Invalid tolerance class specified: {tol_class}")
+        for sign in signs:
+            if sign not in SIGNS:
+                raise ValueError(f"Invalid tolerance sign specified: {sign}")
+        if not classes or not signs:
+            raise ValueError("Select at least one tolerance class and sign")
+        if not 0 < len(sizes) <= MAX_SIZES:
+            raise ValueError(f"Enter from 1 to {MAX_SIZES} sizes")
+        try:
+            nominals = [Decimal(s) for s in sizes]
+        except (InvalidOperation, TypeError):
+            raise ValueError("Sizes must be numbers")
+        if not all(n.is_finite() for n in nominals):
+            raise ValueError("Sizes must be numbers")
+    except ValueError as e:
+        logging.warning(f"ValueError when calculating gauge set limits: {str(e)}")
+        return {'result': None, 'error': str(e)}
+    table = TOL_TABLES[units]
+    bounds = [Decimal(r) for r in table]
+    tolerances = [t[c] for t in table.values() for c in classes]
+    decimals = max(_decimals(v) for v in nominals + bounds + tolerances)
+    if decimals > MAX_DECIMALS:
+        return {'result': None, 'error': f"Sizes can have at most {MAX_DECIMALS} decimal places"}
+    nominal = _scaled(nominals, decimals)
+    bound = _scaled(bounds, decimals)
+    tolerance = _scaled(tolerances, decimals).reshape(len(bounds), len(classes))
+    # the first size range whose upper bound is at least the nominal size, for all sizes at once
+    row = np.searchsorted(bound, nominal, side='left')
+    valid = (nominal > _scaled([LOWER_LIMITS[units]], decimals)[0]) & (nominal <= bound[-1])
+    tol = tolerance[np.minimum(row, len(bounds) - 1)][:, :, None]
+    plus = np.array([s == '+' for s in signs])[None, None, :]
+    low = nominal[:, None, None] - np.where(plus, 0, tol)
+    high = nominal[:, None, None] + np.where(plus, tol, 0)
+    logging.debug(f"Calculated gauge set limits for {len(sizes)} sizes, {len(classes)} "
+                  f"classes and {len(signs)} signs, {np.count_nonzero(~valid)} out of range")
+    return {'result': {'sizes': [str(n) for n in nominals], 'classes': list(classes),
+                       'signs': list(signs), 'units': units, 'decimals': decimals,
+                       'valid': valid, 'min': low, 'max': high},
+            'error': None}
+
+
+def tolerance_table() -> dict:
+    """The tolerance tables of both units, for calculating gauge limits elsewhere, such as in the
+    browser. Decimal values are strings, so they are exact.
+
+    :returns: Dictionary with the "standard" the tables are from, the tolerance "classes", the
+    "rounding" of limits to their precision, and "units", a dictionary of units to a dictionary
+    with the "lower" limit sizes must be above, the display "precision" of limits, and "ranges",
+    a list of [largest size, dictionary of class to tolerance] pairs in order of size.
+    """
+    return {'standard': 'ASME B89.1.5-1998',
+            'classes': list(TOL_CLASSES),
+            'rounding': 'half_up',
+            'units': {units: {'lower': str(LOWER_LIMITS[units]),
+                              'precision': PRECISION[units],
+                              'ranges': [[size, {c: str(t) for c, t in tolerances.items()}]
+                                         for size, tolerances in table.items()]}
+                      for units, table in TOL_TABLES.items()}}
+
+
+def _quantize(values: np.ndarray, decimals: int, places: int) -> np.ndarray:
+    """Round scaled integers to places decimal places, half up as the decimal context does"""
+    if decimals <= places:
+        return values * 10 ** (places - decimals)
+    step = 10 ** (decimals - places)
+    return (values + step // 2) // step
+
+
+def _format(value: int, places: int) -> str:
+    sign = '-' if value < 0 else ''
+    whole, fraction = divmod(abs(value), 10 ** places)
+    return f"{sign}{whole}.{fraction:0{places}d}" if places else f"{sign}{whole}"
+
+
+def format_rows(result: dict, precision: str = None):
+    """Iterate over the rows of a gauge_set_limits() result, one per size, class and sign, as
+    (nominal, class, sign, min, max, error) tuples of strings. Limits are rounded to precision,
+    by default PRECISION of the result's units, and are empty for sizes out of range.
+    """
+    places = _decimals(Decimal(precision or PRECISION[result['units']]))
+    low = _quantize(result['min'], result['decimals'], places)
+    high = _quantize(result['max'], result['decimals'], places)
+    for size, valid, size_low, size_high in zip(result['sizes'], result['valid'].tolist(),
+                                                low.tolist(), high.tolist()):
+        for tol_class, class_low, class_high in zip(result['classes'], size_low, size_high):
+            for sign, pin_low, pin_high in zip(result['signs'], class_low, class_high):
+                if valid:
+                    yield (size, tol_class, sign, _format(pin_low, places),
+                           _format(pin_high, places), '')
+                else:
+                    yield size, tol_class, sign, '', '', OUT_OF_RANGE
@@ -0,0 +1,148 @@
+"""Module containing the geometry of three mutually tangent pins inside a bore. Provides scalar
+functions for single calculations and batch functions that operate on numpy arrays of pin radii,
+for generating many diagrams or evaluating many pin combinations at once.
+
+The code used to calculate the circle positions is based on that used in Ludger Sandig's
+apollon, see https://github.com/lsandig/apollon/blob/master/apollon.py. Thanks to Ludger.
+"""
+
+from cmath import sqrt as csqrt
+import numpy as np
+
+
+class Circle:
+    """A circle represented by center point coordinates and radius"""
+    __slots__ = ('x', 'y', 'r')
+
+    def __init__(self, x: float, y: float, r: float):
+        self.x = x  # center x position
+        self.y = y  # center y position
+        self.r = r  # radius
+
+    def __repr__(self):
+        return f"Circle(x={self.x}, y={self.y}, r={self.r})"
+
+
+def tangent_circles(r1: float, r2: float, r3: float) -> tuple:
+    """From the radii of three mutually tangent circles, calculate the center of each circle and
+    the center and radius of the circle enclosing and tangent to all three. Circle 1 is centered
+    on the origin and circle 2 on the positive x axis.
+
+    :returns: Tuple of four Circle objects, the three pins followed by the enclosing circle
+    """
+    # curvatures and complex center points of the three pins
+    k1 = 1 / r1
+    k2 = 1 / r2
+    k3 = 1 / r3
+    m1 = 0j
+    m2 = (r1 + r2) + 0j
+    m3x = (r1 * r1 + r1 * r3 + r1 * r2 - r2 * r3) / (r1 + r2)
+    m3y = csqrt((r1 + r3) * (r1 + r3) - m3x * m3x)
+    m3 = m3x + m3y * 1j
+    # Descartes' theorem for the curvature of the enclosing circle, and the complex Descartes
+    # theorem for its center
+    k4 = -2 * csqrt(k1 * k2 + k2 * k3 + k1 * k3) + k1 + k2 + k3
+    m4 = (-2 * csqrt(k1 * m1 * k2 * m2 + k2 * m2 * k3 * m3 + k1 * m1 * k3 * m3)
+          + k1 * m1 + k2 * m2 + k3 * m3) / k4
+    return (Circle(0.0, 0.0, r1),
+            Circle(r1 + r2, 0.0, r2),
+            Circle(m3x, m3y.real, r3),
+            Circle(m4.real, m4.imag, abs(1 / k4)))
+
+
+def center_positions(r1: float, r2: float, r3: float) -> tuple:
+    """Calculate the pin positions used to draw the calculator diagrams. Coordinates are
+    transformed so the enclosing circle center is at the origin, and all dimensions are on a
+    scale of 0-1 where the maximum value of 1 is scaled to the diameter of the enclosing circle.
+
+    :returns: Tuple of three dictionaries with "x", "y" and "r" keys, one for each pin
+    """
+    c1, c2, c3, outer = tangent_circles(r1, r2, r3)
+    outer_radius = outer.r
+    scale_factor = 1 / (outer_radius * 2)
+    return tuple({'x': abs(((c.x - outer.x) - outer_radius) * scale_factor),
+                  'y': abs(((c.y - outer.y) - outer_radius) * scale_factor),
+                  'r': c.r / outer_radius}
+                 for c in (c1, c2, c3))
+
+
+def tangent_circles_batch(r1, r2, r3) -> tuple:
+    """Batch version of tangent_circles().
+
+    :param r1: array of radii of circle 1
+    :param r2: array of radii of circle 2
+    :param r3: array of radii of circle 3
+    :returns: Tuple of x, y and r arrays, each of shape (n, 4) with a row per set of radii and
+    columns for the three pins followed by the enclosing circle. Rows for radii that do not
+    describe three tangent circles inside a fourth contain NaN.
+    """
+    r1, r2, r3 = (np.ravel(a) for a in np.broadcast_arrays(
+        np.asarray(r1, dtype=np.float64), np.asarray(r2, dtype=np.float64),
+        np.asarray(r3, dtype=np.float64)))
+    n = r1.size
+    x = np.empty((n, 4))
+    y = np.empty((n, 4))
+    r = np.empty((n, 4))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k1 = 1 / r1
+        k2 = 1 / r2
+        k3 = 1 / r3
+        m2 = r1 + r2
+        m3x = (r1 * r1 + r1 * r3 + r1 * r2 - r2 * r3) / (r1 + r2)
+        m3y = np.sqrt((r1 + r3) * (r1 + r3) - m3x * m3x)
+        m3 = m3x + m3y * 1j
+        # m1 is zero, so the terms containing it drop out of the complex Descartes theorem
+        k4 = -2 * np.sqrt(k1 * k2 + k2 * k3 + k1 * k3) + k1 + k2 + k3
+        m4 = (-2 * np.sqrt((k2 * m2 * k3) * m3) + k2 * m2 + k3 * m3) / k4
+        x[:, 0] = 0.0
+        x[:, 1] = m2
+        x[:, 2] = m3x
+        x[:, 3] = m4.real
+        y[:, 0] = 0.0
+        y[:, 1] = 0.0
+        y[:, 2] = m3y
+        y[:, 3] = m4.imag
+        r[:, 0] = r1
+        r[:, 1] = r2
+        r[:, 2] = r3
+        r[:, 3] = np.abs(1 / k4)
+    invalid = ~(k4 < 0) | np.isnan(m3y)
+    x[invalid] = np.nan
+    y[invalid] = np.nan
+    r[invalid] = np.nan
+    return x, y, r
+
+
+def center_positions_batch(r1, r2, r3) -> tuple:
+    """Batch version of center_positions().
+
+    :returns: Tuple of x, y and r arrays, each of shape (n, 3) with a row per set of radii and
+    a column per pin, in the normalized diagram coordinates used by center_positions()
+    """
+    x, y, r = tangent_circles_batch(r1, r2, r3)
+    outer_radius = r[:, 3:]
+    scale_factor = 1 / (outer_radius * 2)
+    return (np.ascontiguousarray(np.abs(((x[:, :3] - x[:, 3:]) - outer_radius) * scale_factor)),
+            np.ascontiguousarray(np.abs(((y[:, :3] - y[:, 3:]) - outer_radius) * scale_factor)),
+            np.ascontiguousarray(r[:, :3] / outer_radius))
+
+
+def enclosing_diameter_batch(r1, r2, r3):
+    """Diameter of the circle enclosing and tangent to three mutually tangent circles, for
+    arrays of radii. Cheaper than tangent_circles_batch() when only the diameter is needed, and
+    the radii are broadcast against each other without being flattened, so a grid of diameters
+    can be calculated from one dimensional arrays of radii.
+
+    :returns: Array of diameters in the broadcast shape of the radii, containing NaN where the
+    radii do not describe three tangent circles inside a fourth
+    """
+    r1, r2, r3 = (np.asarray(a, dtype=np.float64) for a in (r1, r2, r3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k1 = 1 / r1
+        k2 = 1 / r2
+        k3 = 1 / r3
+        k4 = -2 * np.sqrt(k1 * k2 + k2 * k3 + k1 * k3) + k1 + k2 + k3
+        diameter = -2 / k4
+    # k4 is negative for an enclosing circle, NaN comparisons are false
+    valid = (k4 < 0) & (r1 > 0) & (r2 > 0) & (r3 > 0)
+    return np.where(valid, diameter, np.nan)
@@ -4,7 +4,7 @@
 from decimal import Decimal, getcontext, InvalidOperation
 import logging
 from math import acos, cos, radians, degrees, sqrt
-from cmath import sqrt as csqrt
+from holecalc.geometry import center_positions
 
 # set precision for decimal math
 getcontext().prec = 12
@@ -65,6 +65,156 @@ def calculate_hole_size(pin1: str, pin2: str, pin3: str) -> dict:
             'error': None}
 
 
+# gauge pin tolerance classes from tightest to loosest
+TOL_CLASSES = ('XX', 'X', 'Y', 'Z', 'ZZ')
+# gauge pin tolerances by tolerance class, keyed by the largest nominal diameter each applies to.
+# Tolerance class information from ASME B89.1.5-1998
+TOL_TABLE_IN = {
+    "0.825": {
+        'XX': Decimal("0.000020"),
+        'X': Decimal("0.000040"),
+        'Y': Decimal("0.000070"),
+        'Z': Decimal("0.000100"),
+        'ZZ': Decimal("0.000200")
+    },
+    "1.510": {
+        'XX': Decimal("0.000030"),
+        'X': Decimal("0.000060"),
+        'Y': Decimal("0.000090"),
+        'Z': Decimal("0.000120"),
+        'ZZ': Decimal("0.000240")
+    },
+    "2.510": {
+        'XX': Decimal("0.000040"),
+        'X': Decimal("0.000080"),
+        'Y': Decimal("0.000120"),
+        'Z': Decimal("0.000160"),
+        'ZZ': Decimal("0.000320")
+    },
+    "4.510": {
+        'XX': Decimal("0.000050"),
+        'X': Decimal("0.000100"),
+        'Y': Decimal("0.000150"),
+        'Z': Decimal("0.000200"),
+        'ZZ': Decimal("0.000400")
+    },
+    "6.510": {
+        'XX': Decimal("0.000065"),
+        'X': Decimal("0.000130"),
+        'Y': Decimal("0.000190"),
+        'Z': Decimal("0.000250"),
+        'ZZ': Decimal("0.000500")
+    },
+    "9.010": {
+        'XX': Decimal("0.000080"),
+        'X': Decimal("0.000160"),
+        'Y': Decimal("0.000240"),
+        'Z': Decimal("0.000320"),
+        'ZZ': Decimal("0.000640")
+    },
+    "12.010": {
+        'XX': Decimal("0.000100"),
+        'X': Decimal("0.000200"),
+        'Y': Decimal("0.000300"),
+        'Z': Decimal("0.000400"),
+        'ZZ': Decimal("0.000800")
+    },
+    "15.010": {
+        'XX': Decimal("0.000150"),
+        'X': Decimal("0.000300"),
+        'Y': Decimal("0.000450"),
+        'Z': Decimal("0.000600"),
+        'ZZ': Decimal("0.001200")
+    },
+    "18.010": {
+        'XX': Decimal("0.000200"),
+        'X': Decimal("0.000400"),
+        'Y': Decimal("0.000600"),
+        'Z': Decimal("0.000800"),
+        'ZZ': Decimal("0.001600")
+    },
+    "21.010": {
+        'XX': Decimal("0.000250"),
+        'X': Decimal("0.000500"),
+        'Y': Decimal("0.000750"),
+        'Z': Decimal("0.001000"),
+        'ZZ': Decimal("0.002000")
+    }
+}
+TOL_TABLE_MM = {
+    "20.96": {
+        'XX': Decimal("0.00051"),
+        'X': Decimal("0.00102"),
+        'Y': Decimal("0.00178"),
+        'Z': Decimal("0.00254"),
+        'ZZ': Decimal("0.00508")
+    },
+    "38.35": {
+        'XX': Decimal("0.00076"),
+        'X': Decimal("0.00152"),
+        'Y': Decimal("0.00229"),
+        'Z': Decimal("0.00305"),
+        'ZZ': Decimal("0.00610")
+    },
+    "63.75": {
+        'XX': Decimal("0.00102"),
+        'X': Decimal("0.00203"),
+        'Y': Decimal("0.00305"),
+        'Z': Decimal("0.00406"),
+        'ZZ': Decimal("0.00813")
+    },
+    "114.55": {
+        'XX': Decimal("0.00127"),
+        'X': Decimal("0.00254"),
+        'Y': Decimal("0.00381"),
+        'Z': Decimal("0.00508"),
+        'ZZ': Decimal("0.01016")
+    },
+    "165.35": {
+        'XX': Decimal("0.00165"),
+        'X': Decimal("0.00330"),
+        'Y': Decimal("0.00483"),
+        'Z': Decimal("0.00635"),
+        'ZZ': Decimal("0.01270")
+    },
+    "228.85": {
+        'XX': Decimal("0.00203"),
+        'X': Decimal("0.00406"),
+        'Y': Decimal("0.00610"),
+        'Z': Decimal("0.00813"),
+        'ZZ': Decimal("0.01626")
+    },
+    "305.05": {
+        'XX': Decimal("0.00254"),
+        'X': Decimal("0.00508"),
+        'Y': Decimal("0.00762"),
+        'Z': Decimal("0.01016"),
+        'ZZ': Decimal("0.02032")
+    },
+    "381.25": {
+        'XX': Decimal("0.00381"),
+        'X': Decimal("0.00762"),
+        'Y': Decimal("0.01143"),
+        'Z': Decimal("0.01524"),
+        'ZZ': Decimal("0.03048")
+    },
+    "457.45": {
+        'XX': Decimal("0.00508"),
+        'X': Decimal("0.01016"),
+        'Y': Decimal("0.01524"),
+        'Z': Decimal("0.02032"),
+        'ZZ': Decimal("0.04064")
+    },
+    "533.65": {
+        'XX': Decimal("0.00635"),
+        'X': Decimal("0.01270"),
+        'Y': Decimal("0.01905"),
+        'Z': Decimal("0.02540"),
+        'ZZ': Decimal("0.05080")
+    }
+}
+
+
 def pin_tolerance_limits(nominal: str, tol_class: str, is_plus: bool, units: str = "in"):
     """Return the minimum and maximum diameter of a gauge pin, given the nominal size in units,
     the tolerance class of the gauge, and whether it is a plus or minus pin.
@@ -76,7 +226,7 @@ def pin_tolerance_limits(nominal: str, tol_class: str, is_plus: bool, units: str
     nominal_dia = Decimal(nominal)
     if units not in ("in", "mm"):
         raise ValueError(f"Invalid units specified: {units}")
-    elif tol_class not in ('XX', 'X', 'Y', 'Z', 'ZZ'):
+    elif tol_class not in TOL_CLASSES:
         raise ValueError(f"Invalid tolerance class specified: {tol_class}")
     # tolerance classes for gauge pins have upper and lower bounds, if nominal dimension is outside
     # these bounds, return None
@@ -85,157 +235,13 @@ def pin_tolerance_limits(nominal: str, tol_class: str, is_plus: bool, units: str
         return None
     elif (nominal_dia <= Decimal("0.254") or nominal_dia > Decimal("533.65")) and units == "mm":
         return None
-    tol_table_in = {
-        "0.825": {
-            'XX': Decimal("0.000020"),
-            'X': Decimal("0.000040"),
-            'Y': Decimal("0.000070"),
-            'Z': Decimal("0.000100"),
-            'ZZ': Decimal("0.000200")
-        },
-        "1.510": {
-            'XX': Decimal("0.000030"),
-            'X': Decimal("0.000060"),
-            'Y': Decimal("0.000090"),
-            'Z': Decimal("0.000120"),
-            'ZZ': Decimal("0.000240")
-        },
-        "2.510": {
-            'XX': Decimal("0.000040"),
-            'X': Decimal("0.000080"),
-            'Y': Decimal("0.000120"),
-            'Z': Decimal("0.000160"),
-            'ZZ': Decimal("0.000320")
-        },
-        "4.510": {
-            'XX': Decimal("0.000050"),
-            'X': Decimal("0.000100"),
-            'Y': Decimal("0.000150"),
-            'Z': Decimal("0.000200"),
-            'ZZ': Decimal("0.000400")
-        },
-        "6.510": {
-            'XX': Decimal("0.000065"),
-            'X': Decimal("0.000130"),
-            'Y': Decimal("0.000190"),
-            'Z': Decimal("0.000250"),
-            'ZZ': Decimal("0.000500")
-        },
-        "9.010": {
-            'XX': Decimal("0.000080"),
-            'X': Decimal("0.000160"),
-            'Y': Decimal("0.000240"),
-            'Z': Decimal("0.000320"),
-            'ZZ': Decimal("0.000640")
-        },
-        "12.010": {
-            'XX': Decimal("0.000100"),
-            'X': Decimal("0.000200"),
-            'Y': Decimal("0.000300"),
-            'Z': Decimal("0.000400"),
-            'ZZ': Decimal("0.000800")
-        },
-        "15.010": {
-            'XX': Decimal("0.000150"),
-            'X': Decimal("0.000300"),
-            'Y': Decimal("0.000450"),
-            'Z': Decimal("0.000600"),
-            'ZZ': Decimal("0.001200")
-        },
-        "18.010": {
-            'XX': Decimal("0.000200"),
-            'X': Decimal("0.000400"),
-            'Y': Decimal("0.000600"),
-            'Z': Decimal("0.000800"),
-            'ZZ': Decimal("0.001600")
-        },
-        "21.010": {
-            'XX': Decimal("0.000250"),
-            'X': Decimal("0.000500"),
-            'Y': Decimal("0.000750"),
-            'Z': Decimal("0.001000"),
-            'ZZ': Decimal("0.002000")
-        }
-    }
-    tol_table_mm = {
-        "20.96": {
-            'XX': Decimal("0.00051"),
-            'X': Decimal("0.00102"),
-            'Y': Decimal("0.00178"),
-            'Z': Decimal("0.00254"),
-            'ZZ': Decimal("0.00508")
-        },
-        "38.35": {
-            'XX': Decimal("0.00076"),
-            'X': Decimal("0.00152"),
-            'Y': Decimal("0.00229"),
-            'Z': Decimal("0.00305"),
-            'ZZ': Decimal("0.00610")
-        },
-        "63.75": {
-            'XX': Decimal("0.00102"),
-            'X': Decimal("0.00203"),
-            'Y': Decimal("0.00305"),
-            'Z': Decimal("0.00406"),
-            'ZZ': Decimal("0.00813")
-        },
-        "114.55": {
-            'XX': Decimal("0.00127"),
-            'X': Decimal("0.00254"),
-            'Y': Decimal("0.00381"),
-            'Z': Decimal("0.00508"),
-            'ZZ': Decimal("0.01016")
-        },
-        "165.35": {
-            'XX': Decimal("0.00165"),
-            'X': Decimal("0.00330"),
-            'Y': Decimal("0.00483"),
-            'Z': Decimal("0.00635"),
-            'ZZ': Decimal("0.01270")
-        },
-        "228.85": {
-            'XX': Decimal("0.00203"),
-            'X': Decimal("0.00406"),
-            'Y': Decimal("0.00610"),
-            'Z': Decimal("0.00813"),
-            'ZZ': Decimal("0.01626")
-        },
-        "305.05": {
-            'XX': Decimal("0.00254"),
-            'X': Decimal("0.00508"),
-            'Y': Decimal("0.00762"),
-            'Z': Decimal("0.01016"),
-            'ZZ': Decimal("0.02032")
-        },
-        "381.25": {
-            'XX': Decimal("0.00381"),
-            'X': Decimal("0.00762"),
-            'Y': Decimal("0.01143"),
-            'Z': Decimal("0.01524"),
-            'ZZ': Decimal("0.03048")
-        },
-        "457.45": {
-            'XX': Decimal("0.00508"),
-            'X': Decimal("0.01016"),
-            'Y': Decimal("0.01524"),
-            'Z': Decimal("0.02032"),
-            'ZZ': Decimal("0.04064")
-        },
-        "533.65": {
-            'XX': Decimal("0.00635"),
-            'X': Decimal("0.01270"),
-            'Y': Decimal("0.01905"),
-            'Z': Decimal("0.02540"),
-            'ZZ': Decimal("0.05080")
-        }
-    }
     if units == "in":
-        for r, t in tol_table_in.items():
+        for r, t in TOL_TABLE_IN.items():
             if nominal_dia <= Decimal(r):
                 tolerance = t[tol_class]
                 break
     else:
-        for r, t in tol_table_mm.items():
+        for r, t in TOL_TABLE_MM.items():
             if nominal_dia <= Decimal(r):
                 tolerance = t[tol_class]
                 break
@@ -292,69 +298,10 @@ def calculate_center_positions(pin1: float, pin2: float, pin3: float) -> tuple:
     calculate the x,y coordinates of each circle center relative to the center 0,0
     of the circumscribing circle with diameter of hole_dia.
 
-    The code used to calculate the circle positions is based on that used in Ludger Sandig's
-    apollon, see https://github.com/lsandig/apollon/blob/master/apollon.py. Thanks to Ludger.
+    Thin wrapper around geometry.center_positions(), which takes pin radii. For many sets of
+    pins at once use geometry.center_positions_batch().
     """
-
-    class Circle(object):
-        """
-        A circle represented by center point coordinates and radius.
-        """
-
-        def __init__(self, mx, my, r):
-            """
-            @param mx: x center coordinate
-            @type mx: int or float
-            @param my: y center coordinate
-            @type my: int or float
-            @param r: radius
-            @type r: int or float
-            """
-            self.r = r  # radius
-            self.x = mx  # center x position
-            self.y = my  # center y position
-            self.k = 1 / r  # circle curvature
-            self.m = (mx + my * 1j)  # complex number representing the center point
-
-    # calculate pin radii
-    r1 = pin1 / 2
-    r2 = pin2 / 2
-    r3 = pin3 / 2
-
-    # create Circle instances based on the three pins
-    circle1 = Circle(0, 0, r1)
-    circle2 = Circle(r1 + r2, 0, r2)
-    m3x = (r1 * r1 + r1 * r3 + r1 * r2 - r2 * r3) / (r1 + r2)
-    m3y = csqrt((r1 + r3) * (r1 + r3) - m3x * m3x)
-    circle3 = Circle(m3x, m3y, r3)
-    cur1 = circle1.k
-    cur2 = circle2.k
-    cur3 = circle3.k
-    m1 = circle1.m
-    m2 = circle2.m
-    m3 = circle3.m
-    # calculate radius and position of enclosing circle and create Circle instance
-    cur4 = -2 * csqrt(cur1 * cur2 + cur2 * cur3 + cur1 * cur3) + cur1 + cur2 + cur3
-    m4 = (-2 * csqrt(cur1 * m1 * cur2 * m2 + cur2 * m2 * cur3 * m3 + cur1 * m1 * cur3 * m3)
-          + cur1 * m1 + cur2 * m2 + cur3 * m3) / cur4
-    circle4 = Circle(m4.real, m4.imag, abs(1 / cur4))
-
-    # Transform circle coordinates so enclosing_circle center is at the x,y origin and
-    # all dimensions/coordinates are on a scale of 0-1 where the maximum value of 1 is
-    # scaled to the radius of the outer circle
-    outer_radius = circle4.r
-    scale_factor = 1 / (outer_radius*2)
-    x1 = abs(((circle1.x.real - circle4.x.real) - outer_radius) * scale_factor)
-    y1 = abs(((circle1.y.real - circle4.y.real) - outer_radius) * scale_factor)
-    x2 = abs(((circle2.x.real - circle4.x.real) - outer_radius) * scale_factor)
-    y2 = abs(((circle2.y.real - circle4.y.real) - outer_radius) * scale_factor)
-    x3 = abs(((circle3.x.real - circle4.x.real) - outer_radius) * scale_factor)
-    y3 = abs(((circle3.y.real - circle4.y.real) - outer_radius) * scale_factor)
-    return (
-        {'x': x1, 'y': y1, 'r': r1 / outer_radius},
-        {'x': x2, 'y': y2, 'r': r2 / outer_radius},
-        {'x': x3, 'y': y3, 'r': r3 / outer_radius}
-    )
+    return center_positions(pin1 / 2, pin2 / 2, pin3 / 2)
 
 
 def calculate_remaining_pin(bore_dia: str, pin1: str, pin2: str, ) -> dict:
@@ -0,0 +1,111 @@
+"""Module containing an optimizer that picks gauge pin tolerance classes for measuring a bore.
+
+Tighter tolerance classes narrow the range of bore diameters three pins can describe, but cost
+more. Given three nominal pin diameters and the allowed deviation of the bore from its nominal
+diameter, every combination of tolerance class and sign for the three pins (5³ classes × 2³
+signs) is evaluated in a single batch geometry calculation, and the cheapest combinations that
+keep the bore within the allowed deviation are returned.
+"""
+
+from decimal import Decimal, InvalidOperation
+import itertools
+import logging
+import numpy as np
+from holecalc.geometry import tangent_circles_batch
+from holecalc.holecalc import pin_tolerance_limits, TOL_CLASSES
+
+# relative cost of a gauge pin in each tolerance class
+DEFAULT_CLASS_COSTS = {'XX': 4.0, 'X': 2.5, 'Y': 1.6, 'Z': 1.3, 'ZZ': 1.0}
+# tolerance class and sign (True for plus) options for a single pin
+PIN_OPTIONS = tuple(itertools.product(TOL_CLASSES, (True, False)))
+# index of the option used by each pin, for every combination, shape (3, 1000)
+COMBINATIONS = np.indices((len(PIN_OPTIONS),) * 3).reshape(3, -1)
+
+
+def _decimal(value) -> Decimal:
+    """Convert a float to a Decimal rounded to the precision of the decimal context"""
+    return +Decimal(repr(float(value)))
+
+
+def _error(message: str) -> dict:
+    return {'result': None, 'nominal': None, 'error': message}
+
+
+def optimize_tolerance_classes(pin1: str, pin2: str, pin3: str, tolerance_plus: str,
+                               tolerance_minus: str = None, units: str = "in",
+                               costs: dict = None, limit: int = 10) -> dict:
+    """Find the cheapest tolerance classes and signs for three gauge pins, such that the bore
+    they measure is known to within the given tolerance of its nominal diameter. Errors are
+    returned as descriptive text, as in calculate_hole_size().
+
+    :param pin1: String representing decimal nominal diameter of first pin, ex: "1.000"
+    :param pin2: Same for second pin
+    :param pin3: Same for third pin
+    :param tolerance_plus: String representing how far the bore may be above nominal
+    :param tolerance_minus: String representing how far the bore may be below nominal, defaults
+    to tolerance_plus
+    :param units: Str containing "in" or "mm", designating the units of measurement
+    :param costs: Dictionary of tolerance class to relative cost, overriding DEFAULT_CLASS_COSTS
+    :param limit: Maximum number of combinations to return
+    :returns: Dictionary containing "result", "nominal" and "error" keys. result value is a
+    list of combinations ordered by cost then bore range, each a dictionary with "classes" and
+    "plus" tuples giving the class and sign of each pin, "cost", and the Decimal "min" and "max"
+    bore diameters. nominal value is the Decimal nominal bore diameter.
+    """
+    try:
+        weights = dict(DEFAULT_CLASS_COSTS, **(costs or {}))
+        if set(weights) != set(TOL_CLASSES):
+            invalid = sorted(set(weights) - set(TOL_CLASSES))
+            raise ValueError(f"Invalid tolerance class in costs: {', '.join(invalid)}")
+        try:
+            option_costs = np.array([float(weights[c]) for c, _ in PIN_OPTIONS])
+        except (ValueError, TypeError):
+            raise ValueError("Tolerance class costs must be numbers")
+        plus = float(Decimal(tolerance_plus))
+        minus = plus if tolerance_minus is None else float(Decimal(tolerance_minus))
+        if plus < 0 or minus < 0:
+            raise ValueError("Tolerance cannot be negative")
+        pins = (pin1, pin2, pin3)
+        limits = [[pin_tolerance_limits(p, c, is_plus, units) for c, is_plus in PIN_OPTIONS]
+                  for p in pins]
+        nominal = [float(Decimal(p)) for p in pins]
+    except (ValueError, TypeError, InvalidOperation) as e:
+        logging.debug(str(e))
+        return _error(str(e) if isinstance(e, ValueError) else 'Cannot optimize, check inputs')
+    if any(None in pin_limits for pin_limits in limits):
+        return _error('Diameter not within tolerance class limits')
+    # diameter limits of each pin for each option, shape (3, 10, 2)
+    bounds = np.array([[[float(d) for d in option] for option in pin_limits]
+                       for pin_limits in limits])
+    # the bore is not monotonic in every pin diameter (a small pin between two large ones
+    # pushes them apart), so its limits are found at the corners of the range of pin diameters.
+    # All eight corners of every combination, and the nominal bore, in one calculation
+    n = COMBINATIONS.shape[1]
+    corners = np.array(list(itertools.product((0, 1), repeat=3)))
+    diameters = np.concatenate(
+        [bounds[np.arange(3)[:, None], COMBINATIONS, corner[:, None]] for corner in corners]
+        + [np.array(nominal)[:, None]], axis=1)
+    _, _, r = tangent_circles_batch(*(diameters / 2))
+    bores = r[:, 3] * 2
+    nominal_bore = bores[-1]
+    corner_bores = bores[:-1].reshape(len(corners), n)
+    min_bore, max_bore = corner_bores.min(axis=0), corner_bores.max(axis=0)
+    if np.isnan(nominal_bore):
+        return _error('Cannot calculate hole dimension, check pin values')
+    # allow for floating point error, so pins at the nominal limit of their class still pass
+    epsilon = nominal_bore * 1e-9
+    fits = (min_bore >= nominal_bore - minus - epsilon) & \
+        (max_bore <= nominal_bore + plus + epsilon)
+    cost = option_costs[COMBINATIONS].sum(axis=0)
+    order = np.lexsort((max_bore - min_bore, cost))
+    order = order[fits[order]][:limit]
+    logging.debug(f"{np.count_nonzero(fits)} tolerance class combinations fit the tolerance")
+    if order.size == 0:
+        return _error('No combination of tolerance classes meets the tolerance')
+    result = [{'classes': tuple(PIN_OPTIONS[o][0] for o in COMBINATIONS[:, i]),
+               'plus': tuple(PIN_OPTIONS[o][1] for o in COMBINATIONS[:, i]),
+               'cost': round(float(cost[i]), 6),
+               'min': _decimal(min_bore[i]),
+               'max': _decimal(max_bore[i])}
+              for i in order]
+    return {'result': result, 'nominal': _decimal(nominal_bore), 'error': None}
@@ -0,0 +1,163 @@
+"""Module containing the evaluation of bore roundness from several three pin readings.
+
+Each reading is a set of three pins placed in the bore at an angular position, given as the
+angle of pin 1 from the reference direction. The points where the pins touch the bore are
+found from the geometry of the reading, centered on the circle through them and rotated to the
+reading's angle. All readings' contact points are then fitted with reference circles:
+
+- least squares: the circle minimizing the sum of squared radial deviations of the points
+- minimum zone: the center of two concentric circles enclosing all points with the smallest
+  radial separation, the roundness of the bore
+- maximum inscribed: the largest circle with no points inside it, the largest pin or plug that
+  fits the bore
+
+All readings are calculated in one batch, and each fit evaluates many candidate centers against
+every point at once, so sessions of hundreds of readings are evaluated interactively.
+"""
+
+from decimal import Decimal, InvalidOperation
+import logging
+import numpy as np
+from holecalc.geometry import tangent_circles_batch
+
+MAX_READINGS = 1000
+# Gauss-Newton iterations refining the algebraic least squares circle
+LSQ_ITERATIONS = 10
+# candidate centers along each axis of the grids searched by the zone fits
+GRID_SIZE = 15
+# fits stop when the grid spacing is this fraction of the bore radius
+GRID_TOLERANCE = 1e-13
+GRID_MAX_ITERATIONS = 200
+
+
+def _decimal(value) -> Decimal:
+    """Convert a float to a Decimal rounded to the precision of the decimal context"""
+    return +Decimal(repr(float(value)))
+
+
+def contact_points(pins: np.ndarray, angles: np.ndarray) -> tuple:
+    """Points where the pins of each reading touch the bore.
+
+    :param pins: Array of shape (n, 3) of the pin diameters of each reading
+    :param angles: Array of n angles in degrees, the position of pin 1 of each reading
+    :returns: Tuple of x and y arrays of shape (n, 3), centered on each reading's bore, and the
+    array of n bore diameters. Rows of readings that do not describe a bore contain NaN.
+    """
+    x, y, r = tangent_circles_batch(pins[:, 0] / 2, pins[:, 1] / 2, pins[:, 2] / 2)
+    dx = x[:, :3] - x[:, 3:]
+    dy = y[:, :3] - y[:, 3:]
+    # each contact point lies on the bore, on the line from its center through the pin center
+    scale = r[:, 3:] / np.hypot(dx, dy)
+    px = dx * scale
+    py = dy * scale
+    rotation = np.radians(angles)[:, None] - np.arctan2(py[:, :1], px[:, :1])
+    cos = np.cos(rotation)
+    sin = np.sin(rotation)
+    return px * cos - py * sin, px * sin + py * cos, r[:, 3] * 2
+
+
+def least_squares_circle(x: np.ndarray, y: np.ndarray) -> tuple:
+    """Center and radius of the least squares circle through points, starting from the
+    algebraic fit and refined to minimize the geometric radial deviations"""
+    a = np.column_stack((x, y, np.ones_like(x)))
+    (cx, cy, c), *_ = np.linalg.lstsq(a, x * x + y * y, rcond=None)
+    cx /= 2
+    cy /= 2
+    radius = np.sqrt(c + cx * cx + cy * cy)
+    for _ in range(LSQ_ITERATIONS):
+        dx = x - cx
+        dy = y - cy
+        d = np.hypot(dx, dy)
+        jacobian = np.column_stack((-dx / d, -dy / d, -np.ones_like(d)))
+        step, *_ = np.linalg.lstsq(jacobian, radius - d, rcond=None)
+        cx, cy, radius = cx + step[0], cy + step[1], radius + step[2]
+    return cx, cy, radius
+
+
+def _grid_search(x: np.ndarray, y: np.ndarray, cx: float, cy: float, half_width: float,
+                 tolerance: float, objective) -> tuple:
+    """Minimize objective over centers, by evaluating a grid of candidate centers around the
+    best center so far, then shrinking the grid around the best candidate. A best candidate on
+    the edge of the grid moves the grid without shrinking it.
+
+    :param objective: Function of the (candidates, points) array of squared distances from each
+    candidate center to each point, returning the value of each candidate to minimize
+    """
+    offsets = np.linspace(-1, 1, GRID_SIZE)
+    for _ in range(GRID_MAX_ITERATIONS):
+        gx = (cx + half_width * offsets)[:, None].repeat(GRID_SIZE, axis=1).ravel()
+        gy = (cy + half_width * offsets)[None, :].repeat(GRID_SIZE, axis=0).ravel()
+        squared = (x[None, :] - gx[:, None]) ** 2 + (y[None, :] - gy[:, None]) ** 2
+        best = int(np.argmin(objective(squared)))
+        cx, cy = gx[best], gy[best]
+        i, j = divmod(best, GRID_SIZE)
+        if 0 < i < GRID_SIZE - 1 and 0 < j < GRID_SIZE - 1:
+            if half_width < tolerance:
+                break
+            half_width *= 4 / (GRID_SIZE - 1)
+    return cx, cy
+
+
+def _zone_width(squared: np.ndarray) -> np.ndarray:
+    return np.sqrt(squared.max(axis=1)) - np.sqrt(squared.min(axis=1))
+
+
+def _negative_inscribed(squared: np.ndarray) -> np.ndarray:
+    return -squared.min(axis=1)
+
+
+def _fit(x: np.ndarray, y: np.ndarray, cx: float, cy: float, diameter: float) -> dict:
+    d = np.hypot(x - cx, y - cy)
+    return {'x': _decimal(cx), 'y': _decimal(cy), 'diameter': _decimal(diameter),
+            'roundness': _decimal(d.max() - d.min())}
+
+
+def fit_circles(x: np.ndarray, y: np.ndarray) -> dict:
+    """Least squares, minimum zone and maximum inscribed circles of points. Each fit is a
+    dictionary of Decimal center "x" and "y", "diameter", and "roundness", the radial distance
+    between the points nearest to and furthest from the center."""
+    cx, cy, radius = least_squares_circle(x, y)
+    d = np.hypot(x - cx, y - cy)
+    # the zone fits are centered within about the roundness of the least squares center
+    half_width = max(2 * (d.max() - d.min()), radius * 1e-9)
+    tolerance = radius * GRID_TOLERANCE
+    zx, zy = _grid_search(x, y, cx, cy, half_width, tolerance, _zone_width)
+    zd = np.hypot(x - zx, y - zy)
+    ix, iy = _grid_search(x, y, cx, cy, half_width, tolerance, _negative_inscribed)
+    return {'least_squares': _fit(x, y, cx, cy, radius * 2),
+            'min_zone': _fit(x, y, zx, zy, zd.max() + zd.min()),
+            'max_inscribed': _fit(x, y, ix, iy, np.hypot(x - ix, y - iy).min() * 2)}
+
+
+def evaluate_roundness(readings: list) -> dict:
+    """Calculate the bore of each of several three pin readings at different angular positions,
+    and fit reference circles to them all. Errors are returned as descriptive text, as in
+    calculate_hole_size().
+
+    :param readings: List of (pin1, pin2, pin3, angle) tuples of strings, the decimal pin
+    diameters and the angle of pin 1 in degrees, ex: ("1.000", "2.000", "3.000", "90")
+    :returns: Dictionary containing "result" and "error" keys. result value is a dictionary with
+    "bores", the Decimal bore diameter of each reading, and the "least_squares", "min_zone" and
+    "max_inscribed" fits described in fit_circles(), centered on the bore center of the
+    readings.
+    """
+    if not 0 < len(readings) <= MAX_READINGS:
+        return {'result': None, 'error': f"Enter from 1 to {MAX_READINGS} readings"}
+    try:
+        values = np.array([[float(Decimal(v)) for v in reading] for reading in readings])
+    except (InvalidOperation, ValueError, TypeError):
+        return {'result': None, 'error': "Readings must be four numbers each"}
+    if values.shape[1] != 4 or not np.isfinite(values).all():
+        return {'result': None, 'error': "Readings must be four numbers each"}
+    if (values[:, :3] <= 0).any():
+        return {'result': None, 'error': "Pin diameters must be positive"}
+    x, y, bores = contact_points(values[:, :3], values[:, 3])
+    invalid = np.flatnonzero(np.isnan(bores))
+    if invalid.size:
+        logging.debug(f"Roundness readings {invalid.tolist()} do not describe a bore")
+        return {'result': None,
+                'error': f"Reading {invalid[0] + 1} does not describe a bore, check pin values"}
+    result = fit_circles(x.ravel(), y.ravel())
+    result['bores'] = [_decimal(b) for b in bores]
+    logging.debug(f"Evaluated roundness of {len(readings)} readings")
+    return {'result': result, 'error': None}
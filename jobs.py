@@ -0,0 +1,419 @@
+"""Module containing a background job queue for batches of calculations too large to run inside
+a request, such as re-evaluating a year of inspection records in tolerance mode.
+
+Jobs and their results are stored in a local SQLite database. Request workers only submit jobs
+and read their status and results; the jobs are run by a separate runner process (started by
+gunicorn's when_ready hook, or with "python jobs.py") using a bounded pool of worker processes.
+Each job's rows are split into chunks whose results are stored as they complete, which gives
+the progress reported by the status endpoint. A job interrupted by a restart is resumed from
+its first incomplete chunk. If a worker process dies, for example killed for running out of
+memory, the runner replaces its pool and resumes the job that was running, unless the same job
+has broken the pool MAX_POOL_BREAKS times, when it fails.
+
+Every row of a job is calculated with the holecalc function for the job's kind, and its result
+is that function's return value converted to JSON, with Decimal values as strings. With
+AUDIT_LOG_ENABLED, the runner appends a record of every row to the audit log as each chunk is
+calculated, before it is stored, see auditlog.py.
+
+Configuration keys read from the flask app config:
+- JOBS_ENABLED: accept jobs and run the job runner
+- JOBS_DATABASE: path of the SQLite database
+- JOBS_PROCESSES: number of processes calculating jobs
+- JOBS_CHUNK_SIZE: rows per chunk
+- JOBS_MAX_ROWS: largest number of rows accepted in one job
+- JOBS_RETENTION: seconds finished jobs are kept before they are deleted
+- AUDIT_LOG_ENABLED, AUDIT_LOG_PATH: record the rows of jobs in the audit log
+"""
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal, getcontext, localcontext
+import json
+import logging
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from holecalc import holecalc as hc
+import auditlog
+
+# decimal context set up by holecalc, which only applies to the thread that imported it
+HOLECALC_CONTEXT = getcontext().copy()
+
+DEFAULT_DATABASE = '/tmp/holecalc-jobs.sqlite'
+DEFAULT_PROCESSES = 2
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_ROWS = 1000000
+DEFAULT_RETENTION = 7 * 24 * 3600
+# seconds the runner waits before checking for new jobs again
+POLL_INTERVAL = 1.0
+# times a job may break the runner's pool before it is failed instead of resumed
+MAX_POOL_BREAKS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    units TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    rows TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    chunk INTEGER NOT NULL,
+    results TEXT NOT NULL,
+    PRIMARY KEY (job_id, chunk)
+);
+"""
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _sign(value) -> bool:
+    if value not in ('+', '-'):
+        raise ValueError(f"Invalid sign: {value}")
+    return value == '+'
+
+
+def _hole_size(row, units):
+    return hc.calculate_hole_size(*(str(p) for p in row))
+
+
+def _hole_size_limits(row, units):
+    return hc.calculate_hole_size_limits(
+        *((str(p[0]), str(p[1]), _sign(p[2])) for p in row), units=units)
+
+
+def _remaining_pin(row, units):
+    return hc.calculate_remaining_pin(*(str(p) for p in row))
+
+
+def _pin_size(row, units):
+    return hc.pin_size_wrapper(str(row[0]), str(row[1]), _sign(row[2]), units)
+
+
+# job kind: (calculation of one row, description of a row, validator of a row)
+KINDS = {
+    'hole_size': (_hole_size, "[pin1, pin2, pin3]",
+                  lambda row: len(row) == 3),
+    'hole_size_limits': (_hole_size_limits,
+                         "[[pin1, class, sign], [pin2, class, sign], [pin3, class, sign]]",
+                         lambda row: len(row) == 3 and all(
+                             isinstance(p, list) and len(p) == 3 for p in row)),
+    'remaining_pin': (_remaining_pin, "[bore, pin1, pin2]",
+                      lambda row: len(row) == 3),
+    'pin_size': (_pin_size, "[nominal, class, sign]",
+                 lambda row: len(row) == 3),
+}
+
+
+# kinds whose result is a (minimum, maximum) pair of hole size results
+PAIRED_KINDS = ('hole_size_limits',)
+
+
+def to_json(value):
+    """Convert a holecalc result to JSON compatible types"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [to_json(v) for v in value]
+    return value
+
+
+def calculate_chunk(kind: str, units: str, rows: list) -> list:
+    """Calculate the results of a chunk of rows, run in the job runner's worker processes"""
+    calculate = KINDS[kind][0]
+    results = []
+    with localcontext(HOLECALC_CONTEXT):
+        for row in rows:
+            try:
+                results.append(to_json(calculate(row, units)))
+            except (ArithmeticError, ValueError, TypeError, IndexError) as e:
+                # an invalid row is reported in its result, like holecalc's own errors
+                error = {'result': None,
+                         'error': "Invalid number" if isinstance(e, ArithmeticError) else str(e)}
+                results.append([error, error] if kind in PAIRED_KINDS else error)
+    return results
+
+
+def _signs(pins) -> tuple:
+    return tuple('+' if p[2] == '+' else '-' for p in pins)
+
+
+# job kind: audit log record arguments of a row and its result, see auditlog.make_record()
+AUDIT_RECORDS = {
+    'hole_size': lambda row, r: dict(inputs=row, result=(r['result'],), error=r['error']),
+    'hole_size_limits': lambda row, r: dict(
+        inputs=[p[0] for p in row], result=(r[0]['result'], r[1]['result']),
+        error=r[0]['error'] or r[1]['error'], classes=[p[1] for p in row], signs=_signs(row)),
+    'remaining_pin': lambda row, r: dict(inputs=(row[1], row[2], row[0]), result=(r['result'],),
+                                         error=r['error']),
+    'pin_size': lambda row, r: dict(inputs=row[:1], result=r['result'] or (), error=r['error'],
+                                    classes=row[1:2], signs=_signs([row])),
+}
+
+
+def audit_records(kind: str, units: str, rows: list, results: list) -> list:
+    """Audit log records of the rows of a chunk of a job, with their results"""
+    arguments = AUDIT_RECORDS[kind]
+    now = time.time()
+    return [auditlog.make_record(kind, units, timestamp=now, **arguments(row, result))
+            for row, result in zip(rows, results)]
+
+
+class JobError(ValueError):
+    """Raised for a job submission that is not valid"""
+
+
+class PoolBroken(Exception):
+    """Raised when a worker process of the pool died while running a job, which is left running
+    so it can be resumed with a new pool"""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"A worker process died while running job {job_id}")
+        self.job_id = job_id
+
+
+class JobStore:
+    """Jobs and their results in a SQLite database. Every method uses its own connection, so a
+    store can be shared between threads and used again after a fork."""
+
+    def __init__(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        db.row_factory = sqlite3.Row
+        return db
+
+    def submit(self, kind: str, rows: list, units: str = 'in',
+               max_rows: int = DEFAULT_MAX_ROWS) -> str:
+        """Validate and queue a job, returning its id. Raises JobError if it is not valid."""
+        if kind not in KINDS:
+            raise JobError(f"Unknown job kind, use one of: {', '.join(KINDS)}")
+        if units not in ('in', 'mm'):
+            raise JobError("units must be in or mm")
+        if not isinstance(rows, list) or not rows:
+            raise JobError("rows must be a non-empty list")
+        if len(rows) > max_rows:
+            raise JobError(f"A job can have at most {max_rows} rows")
+        _, description, valid = KINDS[kind]
+        for i, row in enumerate(rows):
+            if not isinstance(row, list) or not valid(row):
+                raise JobError(f"Row {i} is not {description}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, kind, units, status, total, created, updated, rows) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (job_id, kind, units, QUEUED, len(rows), now, now, json.dumps(rows)))
+        logging.info(f"Queued {kind} job {job_id} with {len(rows)} rows")
+        return job_id
+
+    def status(self, job_id: str):
+        """Dictionary describing a job, or None if there is no such job"""
+        with self._connect() as db:
+            job = db.execute("SELECT id, kind, units, status, total, completed, error, created, "
+                             "updated FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        status = dict(job)
+        status['progress'] = round(job['completed'] / job['total'], 4)
+        return status
+
+    def result_chunks(self, job_id: str):
+        """Iterate over the results of a finished job as the JSON array text of each chunk, so
+        they can be sent without decoding them"""
+        with self._connect() as db:
+            cursor = db.execute("SELECT results FROM chunks WHERE job_id = ? ORDER BY chunk",
+                                (job_id,))
+            for (results,) in cursor:
+                yield results
+
+    def next_job(self):
+        """The oldest job that is queued, or was running when the runner last stopped"""
+        with self._connect() as db:
+            job = db.execute("SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created "
+                             "LIMIT 1", (RUNNING, QUEUED)).fetchone()
+        return None if job is None else job['id']
+
+    def start(self, job_id: str) -> tuple:
+        """Mark a job as running, returning its kind, units and the chunks still to calculate
+        as a list of (chunk number, rows) tuples"""
+        with self._connect() as db:
+            job = db.execute("SELECT kind, units, rows FROM jobs WHERE id = ?",
+                             (job_id,)).fetchone()
+            done = {row['chunk'] for row in
+                    db.execute("SELECT chunk FROM chunks WHERE job_id = ?", (job_id,))}
+            db.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                       (RUNNING, time.time(), job_id))
+        rows = json.loads(job['rows'])
+        pending = [(c, rows[start:start + self.chunk_size])
+                   for c, start in enumerate(range(0, len(rows), self.chunk_size))
+                   if c not in done]
+        return job['kind'], job['units'], pending
+
+    def save_chunk(self, job_id: str, chunk: int, results: list):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO chunks (job_id, chunk, results) VALUES (?, ?, ?)",
+                       (job_id, chunk, json.dumps(results)))
+            db.execute("UPDATE jobs SET completed = completed + ?, updated = ? WHERE id = ?",
+                       (len(results), time.time(), job_id))
+
+    def finish(self, job_id: str, error: str = None):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+                       (FAILED if error else DONE, error, time.time(), job_id))
+
+    def delete_expired(self, retention: float):
+        """Delete jobs that finished more than retention seconds ago"""
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                       (DONE, FAILED, time.time() - retention))
+
+
+def run_job(store: JobStore, job_id: str, executor, max_pending: int, audit=None):
+    """Calculate the remaining chunks of a job with executor, storing each as it completes, and
+    recording its rows with the audit log writer audit if there is one"""
+    kind, units, chunks = store.start(job_id)
+    logging.info(f"Running {kind} job {job_id}, {len(chunks)} chunks to calculate")
+    chunks = iter(chunks)
+    pending = {}
+    try:
+        while True:
+            # keep a bounded number of chunks in flight, so memory use doesn't grow with the job
+            for chunk, rows in chunks:
+                pending[executor.submit(calculate_chunk, kind, units, rows)] = (chunk, rows)
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                chunk, rows = pending.pop(future)
+                results = future.result()
+                if audit is not None:
+                    # recorded before the chunk is stored, so a restart in between repeats
+                    # records rather than losing them
+                    try:
+                        audit.write(audit_records(kind, units, rows, results))
+                    except OSError:
+                        logging.exception(f"Could not write {len(rows)} records of job {job_id} "
+                                          f"to audit log {audit.path}")
+                store.save_chunk(job_id, chunk, results)
+    except BrokenProcessPool as e:
+        for future in pending:
+            future.cancel()
+        raise PoolBroken(job_id) from e
+    except Exception as e:
+        logging.exception(f"Job {job_id} failed")
+        for future in pending:
+            future.cancel()
+        store.finish(job_id, error=str(e) or type(e).__name__)
+        return
+    store.finish(job_id)
+    logging.info(f"Finished job {job_id}")
+
+
+def run_pending(store: JobStore, executor, max_pending: int, audit=None) -> int:
+    """Run queued jobs until there are none left, returns the number run. Raises PoolBroken if
+    executor's worker processes die."""
+    count = 0
+    job_id = store.next_job()
+    while job_id is not None:
+        run_job(store, job_id, executor, max_pending, audit)
+        count += 1
+        job_id = store.next_job()
+    return count
+
+
+def replace_pool(store: JobStore, executor: ProcessPoolExecutor, processes: int,
+                 broken: PoolBroken, breaks: dict) -> ProcessPoolExecutor:
+    """New pool in place of one broken while running a job. The job is resumed by the next
+    run_pending(), or failed if it has broken the pool MAX_POOL_BREAKS times, counted in breaks
+    by job id."""
+    executor.shutdown(wait=False)
+    breaks[broken.job_id] = breaks.get(broken.job_id, 0) + 1
+    if breaks[broken.job_id] >= MAX_POOL_BREAKS:
+        logging.error(f"{broken}, {breaks[broken.job_id]} times, failing it")
+        store.finish(broken.job_id, error=str(broken))
+        del breaks[broken.job_id]
+    else:
+        logging.warning(f"{broken}, restarting the pool to resume it")
+    return ProcessPoolExecutor(max_workers=processes)
+
+
+# JobStore of each (database, chunk size), so the schema is only created once per process
+_stores = {}
+
+
+def get_store(config):
+    """JobStore for a flask app config, or None if the job queue is disabled"""
+    if not config.get('JOBS_ENABLED', False):
+        return None
+    key = (config.get('JOBS_DATABASE', DEFAULT_DATABASE),
+           config.get('JOBS_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    if key not in _stores:
+        _stores[key] = JobStore(*key)
+    return _stores[key]
+
+
+def run_forever(config):
+    """Job runner main loop"""
+    store = get_store(config)
+    if store is None:
+        logging.info("Job queue disabled, job runner exiting")
+        return
+    processes = config.get('JOBS_PROCESSES', DEFAULT_PROCESSES)
+    retention = config.get('JOBS_RETENTION', DEFAULT_RETENTION)
+    audit = None
+    if config.get('AUDIT_LOG_ENABLED', False):
+        audit = auditlog.LogWriter(config.get('AUDIT_LOG_PATH', auditlog.DEFAULT_PATH))
+    logging.info(f"Job runner started with {processes} processes")
+    executor = ProcessPoolExecutor(max_workers=processes)
+    breaks = {}
+    try:
+        while True:
+            store.delete_expired(retention)
+            try:
+                if not run_pending(store, executor, 2 * processes, audit):
+                    time.sleep(POLL_INTERVAL)
+            except PoolBroken as e:
+                executor = replace_pool(store, executor, processes, e, breaks)
+    finally:
+        executor.shutdown()
+
+
+def start_runner() -> subprocess.Popen:
+    """Start the job runner in its own process, for use in gunicorn's when_ready hook"""
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def _exit(signum, frame):
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, _exit)
+    from main import app
+    run_forever(app.config)
@@ -1,18 +1,63 @@
 """Module containing flask routes for holecalc web app"""
 
-from flask import Flask, render_template, request, flash
+from flask import Flask, Response, abort, request, flash, url_for, jsonify, \
+    stream_with_context
 from holecalc import holecalc as hc
+from holecalc.gaugeset import gauge_set_limits, size_range, format_rows, tolerance_table
+from holecalc.optimize import optimize_tolerance_classes, DEFAULT_CLASS_COSTS
+from holecalc.roundness import evaluate_roundness
 from decimal import Decimal
 import logging
-from forms import ThreePinForm, ReverseForm, PinSizeForm
+from forms import ThreePinForm, ReverseForm, PinSizeForm, OptimizeForm, RoundnessForm, \
+    GaugeSetForm, parse_readings, parse_sizes
 from flask_wtf.csrf import CSRFProtect
 from wtforms import ValidationError
 import copy
+import csv
+import datetime
+import io
+import json
 import os
-from htmlmin.minify import html_minify
+import assets
+import formats
+import jobs
+import minify
+from ratelimit import RateLimiter
+from resultcache import ResultCache
+from timing import ServerTiming, stage, render_template
+from warmup import WarmUp
+from memprofile import MemoryProfiler
+import auditlog
+from auditlog import AuditLog
+from parallel import ParallelPool
+
+
+def client_ip():
+    """Return the client IP address. Behind PROXY_TRUSTED_HOPS proxies, such as NGINX, this is
+    the address the first of them appended to the X-Forwarded-For header, counted from the
+    right, since addresses to its left are sent by the client and can be anything. Otherwise it
+    is the address of the remote end of the connection."""
+    hops = app.config.get('PROXY_TRUSTED_HOPS', 0)
+    if hops and "HTTP_X_FORWARDED_FOR" in request.environ.keys():
+        forwarded = request.environ['HTTP_X_FORWARDED_FOR'].split(',')
+        if len(forwarded) >= hops:
+            return forwarded[-hops].strip()
+    return request.remote_addr
+
 
 app = Flask(__name__)
+# templates are minified once when compiled, so rendered pages need no further minification
+minify.init_app(app)
+# registered first so the total request time includes the other extensions' hooks
+server_timing = ServerTiming(app)
+# rate limiter must be registered before CSRFProtect, so rejected requests are never parsed
+limiter = RateLimiter(app, key_func=client_ip)
 csrf = CSRFProtect(app)
+result_cache = ResultCache(app)
+warm_up = WarmUp(app)
+memory_profiler = MemoryProfiler(app)
+audit_log = AuditLog(app, client_func=client_ip)
+parallel_pool = ParallelPool(app)
 
 
 def load_config(mode=os.environ.get('FLASK_ENV')):
@@ -43,11 +88,38 @@ def log_remote_ip():
 
 load_config()
 
+# mapping of static filenames to fingerprinted filenames, empty if assets.py has not been run
+asset_manifest = assets.load_manifest()
+# mapping of assets generated by the app to fingerprinted filenames. The tolerance tables are
+# used for gage size calculation in the browser, at a URL that changes with them.
+generated_assets = {
+    'tolerances.json': assets.add_generated(
+        'tolerances.json', json.dumps(tolerance_table(), separators=(',', ':')).encode()),
+}
+
+
+@app.template_global()
+def asset_url(filename):
+    """Return the URL of a static file, using the fingerprinted copy built by assets.py if it
+    exists, or of an asset generated by the app. Use in templates in place of
+    url_for('static', filename=...)"""
+    hashed = asset_manifest.get(filename) or generated_assets.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('hashed_asset', filename=hashed)
+
+
 default_calc_menu = {"Three Pin": {'route': "/",
                                    'selected': False},
                      "Reverse": {'route': "/reverse",
                                  'selected': False},
                      "Gage Size": {'route': "/pinsize",
+                                   'selected': False},
+                     "Gage Set": {'route': "/gaugeset",
+                                  'selected': False},
+                     "Optimizer": {'route': "/optimize",
+                                   'selected': False},
+                     "Roundness": {'route': "/roundness",
                                    'selected': False}}
 
 # radii and center coordinates of default pins to draw
@@ -60,35 +132,58 @@ default_diagram_circles = (
 
 @app.route('/heartbeat')
 def heartbeat():
-    """return an OK message for simple testing of app deployment"""
+    """return an OK message for simple testing of app deployment, or a 503 response while the
+    worker is warming up"""
+    if not warm_up.is_ready():
+        return "WARMING UP", 503
     return "OK"
 
 
+@app.route('/admin/memory')
+def memory_report():
+    """Memory report of the worker serving the request, or with ?all=1 the latest reports of
+    every worker, see memprofile.py. Not found without the admin token."""
+    if not memory_profiler.authorized():
+        abort(404)
+    if request.args.get('all'):
+        return jsonify(workers=memory_profiler.read_reports())
+    return jsonify(memory_profiler.write_report())
+
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """Route for fingerprinted static files, served precompressed with long cache lifetimes"""
+    return assets.send_asset(filename)
+
+
 @app.route('/about/')
 def about():
     """Route for about page"""
     rendered = render_template('about.html')
-    return html_minify(rendered)
+    return rendered
 
 
 @app.route('/guide/')
 def guide():
     """Route for guide page"""
     rendered = render_template('guide.html')
-    return html_minify(rendered)
+    return rendered
 
 
 @app.route('/', methods=('GET', 'POST'))
 def three_pin_calc_render():
     """Route for home page containing three pin calculator"""
-    form = ThreePinForm()
+    with stage('form'):
+        form = ThreePinForm()
     calc_menu = copy.deepcopy(default_calc_menu)
     calc_menu['Three Pin']['selected'] = True
     draw_circles = default_diagram_circles
     if request.method == 'POST':
         logging.info("POST request on three pin calculator")
         log_remote_ip()
-        if not form.validate_on_submit():
+        with stage('form'):
+            valid = form.validate_on_submit()
+        if not valid:
             flash('Form validation failed')
             logging.warning("Form validation failed")
             rendered = render_template(
@@ -97,7 +192,7 @@ def three_pin_calc_render():
                 calc_menu=calc_menu,
                 circles=draw_circles
             )
-            return html_minify(rendered)
+            return rendered
         form_units = form.units.data
         precision = form.precision.data
         pin1 = form.pin1.data
@@ -112,7 +207,10 @@ def three_pin_calc_render():
         tol_type = form.tol_radio.data
         if tol_type == 'nom':
             logging.info(f"Calculating hole size in nominal mode, pins: {pin1}, {pin2}, {pin3}")
-            calc_result = hc.calculate_hole_size(pin1, pin2, pin3)
+            with stage('calc'):
+                calc_result = result_cache.calculate_hole_size(pin1, pin2, pin3)
+            audit_log.record('hole_size', form_units, (pin1, pin2, pin3),
+                             (calc_result['result'],), calc_result['error'])
             try:
                 if calc_result['error'] is not None:
                     raise ValueError(calc_result['error'])
@@ -127,12 +225,19 @@ def three_pin_calc_render():
             try:
                 logging.info(f"Calculating hole size in tolerance mode, pins: "
                              f"{pin1}, {pin2}, {pin3}")
-                calc_result = hc.calculate_hole_size_limits(
-                    (pin1, pin1_class, pin1_is_pos),
-                    (pin2, pin2_class, pin2_is_pos),
-                    (pin3, pin3_class, pin3_is_pos),
-                    units=form_units
-                )
+                with stage('calc'):
+                    calc_result = result_cache.calculate_hole_size_limits(
+                        (pin1, pin1_class, pin1_is_pos),
+                        (pin2, pin2_class, pin2_is_pos),
+                        (pin3, pin3_class, pin3_is_pos),
+                        units=form_units
+                    )
+                audit_log.record('hole_size_limits', form_units, (pin1, pin2, pin3),
+                                 (calc_result[0]['result'], calc_result[1]['result']),
+                                 calc_result[0]['error'] or calc_result[1]['error'],
+                                 (pin1_class, pin2_class, pin3_class),
+                                 tuple('+' if p else '-' for p in (pin1_is_pos, pin2_is_pos,
+                                                                   pin3_is_pos)))
                 for r in calc_result:
                     if r['error'] is not None:
                         raise ValueError(r['error'])
@@ -152,19 +257,22 @@ def three_pin_calc_render():
                                form=form,
                                calc_menu=calc_menu,
                                circles=draw_circles)
-    return html_minify(rendered)
+    return rendered
 
 
 @app.route('/pinsize', methods=('GET', 'POST'))
 def pin_calc_render():
     """Route for pin size calculator"""
-    form = PinSizeForm()
+    with stage('form'):
+        form = PinSizeForm()
     calc_menu = copy.deepcopy(default_calc_menu)
     calc_menu['Gage Size']['selected'] = True
     if request.method == 'POST':
         logging.info("POST request on pin size calculator")
         log_remote_ip()
-        if not form.validate_on_submit():
+        with stage('form'):
+            valid = form.validate_on_submit()
+        if not valid:
             logging.warning("Form validation failed")
             flash('Form validation failed')
             rendered = render_template(
@@ -172,7 +280,7 @@ def pin_calc_render():
                 form=form,
                 calc_menu=calc_menu
             )
-            return html_minify(rendered)
+            return rendered
         else:
             form_units = form.units.data
             pin_dia = form.pin_dia.data
@@ -184,10 +292,14 @@ def pin_calc_render():
                 precision = "0.0001"
             logging.info(f"Calculating pin size, nominal: {pin_dia} class: {pin_class} "
                          f"{form.pin_sign.data}")
-            calc_result = hc.pin_size_wrapper(w_nominal=pin_dia,
-                                              w_units=form_units,
-                                              w_is_plus=pin_is_pos,
-                                              w_tol_class=pin_class)
+            with stage('calc'):
+                calc_result = hc.pin_size_wrapper(w_nominal=pin_dia,
+                                                  w_units=form_units,
+                                                  w_is_plus=pin_is_pos,
+                                                  w_tol_class=pin_class)
+            audit_log.record('pin_size', form_units, (pin_dia,),
+                             calc_result['result'] or (), calc_result['error'],
+                             (pin_class,), (form.pin_sign.data,))
             if calc_result['result'] is None:
                 logging.info(f"Calculation error generated during pin size calculation: "
                              f"{calc_result['error']}")
@@ -203,13 +315,14 @@ def pin_calc_render():
     rendered = render_template('pinsize.html',
                            form=form,
                            calc_menu=calc_menu)
-    return html_minify(rendered)
+    return rendered
 
 
 @app.route('/reverse', methods=('GET', 'POST'))
 def reverse_calc_render():
     """Route for reverse/two pin calculator"""
-    form = ReverseForm()
+    with stage('form'):
+        form = ReverseForm()
     calc_menu = copy.deepcopy(default_calc_menu)
     calc_menu['Reverse']['selected'] = True
     draw_circles = default_diagram_circles
@@ -217,7 +330,8 @@ def reverse_calc_render():
         logging.info("POST request on reverse calculator")
         log_remote_ip()
         try:
-            form.validate()
+            with stage('form'):
+                form.validate()
         except ValidationError as e:
             logging.warning(f"Form validation failed: {e}")
             flash(str(e))
@@ -226,13 +340,16 @@ def reverse_calc_render():
                 form=form,
                 calc_menu=calc_menu,
                 circles=draw_circles)
-            return html_minify(rendered)
+            return rendered
         form_units = form.units.data
         precision = form.precision.data
         pin1 = form.pin1.data
         pin2 = form.pin2.data
         bore_dia = form.bore.data
-        calc_result = hc.calculate_remaining_pin(bore_dia, pin1, pin2)
+        with stage('calc'):
+            calc_result = hc.calculate_remaining_pin(bore_dia, pin1, pin2)
+        audit_log.record('remaining_pin', form_units, (pin1, pin2, bore_dia),
+                         (calc_result['result'],), calc_result['error'])
         if calc_result['error'] is not None:
             logging.info(f"Calculation error generated during reverse calculation: "
                          f"{calc_result['error']}")
@@ -246,7 +363,389 @@ def reverse_calc_render():
                            form=form,
                            calc_menu=calc_menu,
                            circles=draw_circles)
-    return html_minify(rendered)
+    return rendered
+
+
+def format_combinations(combinations: list, precision: str) -> list:
+    """Format optimize_tolerance_classes() results for display"""
+    return [{'pins': [(c, '+' if plus else '-') for c, plus in zip(r['classes'], r['plus'])],
+             'cost': f"{r['cost']:g}",
+             'min': str(r['min'].quantize(Decimal(precision))),
+             'max': str(r['max'].quantize(Decimal(precision)))}
+            for r in combinations]
+
+
+@app.route('/optimize', methods=('GET', 'POST'))
+def optimize_calc_render():
+    """Route for tolerance class optimizer"""
+    with stage('form'):
+        form = OptimizeForm()
+    calc_menu = copy.deepcopy(default_calc_menu)
+    calc_menu['Optimizer']['selected'] = True
+    combinations = None
+    if request.method == 'POST':
+        logging.info("POST request on tolerance class optimizer")
+        log_remote_ip()
+        with stage('form'):
+            valid = form.validate_on_submit()
+        if not valid:
+            logging.warning("Form validation failed")
+            flash('Form validation failed')
+        else:
+            form_units = form.units.data
+            precision = form.precision.data
+            pins = (str(form.pin1.data), str(form.pin2.data), str(form.pin3.data))
+            logging.info(f"Optimizing tolerance classes, pins: {pins}")
+            with stage('calc'):
+                calc_result = optimize_tolerance_classes(
+                    *pins,
+                    tolerance_plus=str(form.tolerance_plus.data),
+                    tolerance_minus=str(form.tolerance_minus.data),
+                    units=form_units,
+                    costs=app.config.get('TOLERANCE_CLASS_COSTS', DEFAULT_CLASS_COSTS)
+                )
+            audit_log.record('optimize', form_units,
+                             pins + (form.tolerance_plus.data, form.tolerance_minus.data),
+                             (calc_result['nominal'],), calc_result['error'])
+            if calc_result['error'] is not None:
+                logging.info(f"Calculation error generated during optimization: "
+                             f"{calc_result['error']}")
+                flash(calc_result['error'])
+            else:
+                nominal = str(calc_result['nominal'].quantize(Decimal(precision)))
+                flash(f'Nominal bore diameter: {nominal} {form_units}')
+                combinations = format_combinations(calc_result['result'], precision)
+    rendered = render_template('optimize.html',
+                               form=form,
+                               calc_menu=calc_menu,
+                               combinations=combinations)
+    return rendered
+
+
+@app.route('/api/optimize', methods=('POST',))
+@csrf.exempt
+def optimize_api():
+    """JSON API for the tolerance class optimizer. Takes a JSON object with "pins" (three
+    nominal diameters), "tolerance_plus" and optionally "tolerance_minus", "units", "costs" and
+    "limit". Decimal values are returned as strings."""
+    with stage('form'):
+        data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Request body must be a JSON object"), 400
+    pins = data.get('pins')
+    if not isinstance(pins, list) or len(pins) != 3:
+        return jsonify(error="pins must be a list of three diameters"), 400
+    limit = data.get('limit', 10)
+    if not isinstance(limit, int) or not 0 < limit <= 1000:
+        return jsonify(error="limit must be an integer from 1 to 1000"), 400
+    costs = data.get('costs') or {}
+    if not isinstance(costs, dict):
+        return jsonify(error="costs must be an object of tolerance class to cost"), 400
+    tolerance_minus = data.get('tolerance_minus')
+    with stage('calc'):
+        calc_result = optimize_tolerance_classes(
+            *(str(p) for p in pins),
+            tolerance_plus=str(data.get('tolerance_plus')),
+            tolerance_minus=None if tolerance_minus is None else str(tolerance_minus),
+            units=data.get('units', 'in'),
+            costs=dict(app.config.get('TOLERANCE_CLASS_COSTS', DEFAULT_CLASS_COSTS),
+                       **costs),
+            limit=limit
+        )
+    audit_log.record('optimize', data.get('units', 'in'),
+                     tuple(pins) + (data.get('tolerance_plus'), tolerance_minus),
+                     (calc_result['nominal'],), calc_result['error'])
+    if calc_result['error'] is not None:
+        return jsonify(error=calc_result['error']), 400
+    return jsonify(
+        nominal=str(calc_result['nominal']),
+        combinations=[{'classes': r['classes'],
+                       'signs': ['+' if plus else '-' for plus in r['plus']],
+                       'cost': r['cost'],
+                       'min': str(r['min']),
+                       'max': str(r['max'])}
+                      for r in calc_result['result']])
+
+
+def job_status(job: dict) -> dict:
+    status = dict(job, status_url=url_for('job_status_api', job_id=job['id']))
+    if job['status'] == jobs.DONE:
+        status['result_url'] = url_for('job_result_api', job_id=job['id'])
+    return status
+
+
+@app.route('/api/jobs', methods=('POST',))
+@csrf.exempt
+def job_submit_api():
+    """Queue a background job, see jobs.py. Takes a JSON object with "kind", "rows" and
+    optionally "units", and returns the job's status."""
+    store = jobs.get_store(app.config)
+    if store is None:
+        return jsonify(error="The job queue is disabled"), 503
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Request body must be a JSON object"), 400
+    try:
+        job_id = store.submit(data.get('kind'), data.get('rows'), data.get('units', 'in'),
+                              app.config.get('JOBS_MAX_ROWS', jobs.DEFAULT_MAX_ROWS))
+    except jobs.JobError as e:
+        return jsonify(error=str(e)), 400
+    job = store.status(job_id)
+    audit_log.record('job', job['units'], (job['total'], auditlog.KINDS.index(job['kind']) + 1))
+    return jsonify(job_status(job)), 202
+
+
+@app.route('/api/jobs/<job_id>')
+def job_status_api(job_id):
+    """Status and progress of a background job"""
+    store = jobs.get_store(app.config)
+    if store is None:
+        return jsonify(error="The job queue is disabled"), 503
+    job = store.status(job_id)
+    if job is None:
+        return jsonify(error="No such job"), 404
+    return jsonify(job_status(job))
+
+
+@app.route('/api/jobs/<job_id>/result')
+def job_result_api(job_id):
+    """Download the results of a finished background job, in the order of the submitted rows.
+    The format is negotiated from the Accept header, see formats.py, and defaults to a JSON
+    object with the results as a list. Streamed from the database one chunk at a time."""
+    store = jobs.get_store(app.config)
+    if store is None:
+        return jsonify(error="The job queue is disabled"), 503
+    job = store.status(job_id)
+    if job is None:
+        return jsonify(error="No such job"), 404
+    if job['status'] != jobs.DONE:
+        return jsonify(dict(job_status(job), error="The job has not finished")), 409
+    # a request without an Accept header accepts any format
+    mimetype = request.accept_mimetypes.best_match(formats.offered()) \
+        if request.accept_mimetypes else formats.JSON
+    if mimetype is None:
+        return jsonify(error=f"Acceptable formats are {', '.join(formats.offered())}"), 406
+    extension = {formats.JSON: 'json', formats.NDJSON: 'ndjson', formats.MSGPACK: 'msgpack',
+                 formats.COLUMNS: 'columns'}[mimetype]
+    return Response(formats.encode(mimetype, job, store.result_chunks(job_id)),
+                    mimetype=mimetype, headers={
+                        'Content-Disposition': f'attachment; filename=job-{job_id}.{extension}',
+                        'Vary': 'Accept'})
+
+
+GAUGE_SET_COLUMNS = ('nominal', 'class', 'sign', 'min', 'max', 'units', 'error')
+# gauge set CSV rows written to the response at a time
+GAUGE_SET_BATCH = 1000
+
+
+def gauge_set_csv(result: dict):
+    """Iterate over a gauge_set_limits() result as CSV text, in batches of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(GAUGE_SET_COLUMNS)
+    for i, row in enumerate(format_rows(result), start=1):
+        writer.writerow(row[:5] + (result['units'], row[5]))
+        if i % GAUGE_SET_BATCH == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def audit_gauge_set(calc_result: dict, sizes: list, classes: list, signs: list, units: str):
+    """Record a gage set calculation in the audit log, by its number and range of sizes"""
+    nominals = calc_result['result']['sizes'] if calc_result['result'] else ()
+    audit_log.record('gauge_set', units,
+                     (len(sizes), min(nominals, key=Decimal, default=None),
+                      max(nominals, key=Decimal, default=None),
+                      len(classes), len(signs)),
+                     error=calc_result['error'])
+
+
+def gauge_set_response(result: dict, output: str) -> Response:
+    """Stream a gauge_set_limits() result as a CSV download or a printable HTML sheet"""
+    if output == 'csv':
+        return Response(gauge_set_csv(result), mimetype='text/csv', headers={
+            'Content-Disposition': 'attachment; filename=gauge-set.csv'})
+    context = dict(
+        rows=format_rows(result),
+        units=result['units'],
+        classes=result['classes'],
+        signs=result['signs'],
+        count=len(result['sizes']) * len(result['classes']) * len(result['signs']),
+        date=datetime.date.today().isoformat()
+    )
+    app.update_template_context(context)
+    template = app.jinja_env.get_template('gaugesheet.html')
+    return Response(stream_with_context(template.generate(**context)), mimetype='text/html')
+
+
+@app.route('/gaugeset', methods=('GET', 'POST'))
+def gauge_set_calc_render():
+    """Route for gage set limits, returning the sheet in place of the page once calculated"""
+    with stage('form'):
+        form = GaugeSetForm()
+    calc_menu = copy.deepcopy(default_calc_menu)
+    calc_menu['Gage Set']['selected'] = True
+    if request.method == 'POST':
+        logging.info("POST request on gage set limits")
+        log_remote_ip()
+        with stage('form'):
+            valid = form.validate_on_submit()
+        if not valid:
+            logging.warning("Form validation failed")
+            errors = form.sizes.errors + form.classes.errors + form.signs.errors
+            flash(errors[0] if errors else 'Form validation failed')
+        else:
+            try:
+                sizes = parse_sizes(form.sizes.data or '') or size_range(
+                    str(form.start.data), str(form.stop.data), str(form.step.data))
+            except ValueError as e:
+                sizes = None
+                flash(str(e))
+            if sizes:
+                logging.info(f"Calculating gage set limits, {len(sizes)} sizes, classes "
+                             f"{form.classes.data} signs {form.signs.data}")
+                with stage('calc'):
+                    calc_result = gauge_set_limits(sizes, form.classes.data, form.signs.data,
+                                                   form.units.data)
+                audit_gauge_set(calc_result, sizes, form.classes.data, form.signs.data,
+                                form.units.data)
+                if calc_result['error'] is None:
+                    return gauge_set_response(calc_result['result'], form.output.data)
+                logging.info(f"Calculation error generated during gage set limits: "
+                             f"{calc_result['error']}")
+                flash(calc_result['error'])
+    rendered = render_template('gaugeset.html',
+                               form=form,
+                               calc_menu=calc_menu)
+    return rendered
+
+
+@app.route('/api/gaugeset', methods=('POST',))
+@csrf.exempt
+def gauge_set_api():
+    """API for gage set limits. Takes a JSON object with "sizes", a list of nominal diameters,
+    or "range", an object with "start", "stop" and "step", and "classes", "signs" and optionally
+    "units". Streams CSV, or a printable HTML sheet if the Accept header prefers text/html."""
+    with stage('form'):
+        data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Request body must be a JSON object"), 400
+    sizes = data.get('sizes')
+    size_spec = data.get('range')
+    if isinstance(size_spec, dict) and sizes is None:
+        try:
+            sizes = size_range(*(str(size_spec.get(k)) for k in ('start', 'stop', 'step')))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+    if not isinstance(sizes, list):
+        return jsonify(error="sizes must be a list of diameters, or range an object with "
+                             "start, stop and step"), 400
+    classes = data.get('classes')
+    signs = data.get('signs')
+    if not isinstance(classes, list) or not isinstance(signs, list):
+        return jsonify(error="classes and signs must be lists"), 400
+    with stage('calc'):
+        calc_result = gauge_set_limits([str(s) for s in sizes], classes, signs,
+                                       data.get('units', 'in'))
+    audit_gauge_set(calc_result, sizes, classes, signs, data.get('units', 'in'))
+    if calc_result['error'] is not None:
+        return jsonify(error=calc_result['error']), 400
+    output = 'html' if request.accept_mimetypes.best_match(('text/csv', 'text/html')) \
+        == 'text/html' else 'csv'
+    response = gauge_set_response(calc_result['result'], output)
+    response.vary.add('Accept')
+    return response
+
+
+# roundness fits in display order, with their names
+ROUNDNESS_FITS = (('min_zone', 'Minimum zone'), ('least_squares', 'Least squares'),
+                  ('max_inscribed', 'Maximum inscribed'))
+
+
+def format_roundness(result: dict, precision: str) -> tuple:
+    """Format evaluate_roundness() results for display, as lists of fits and of reading bores"""
+    step = Decimal(precision)
+    fits = [{'name': name,
+             'diameter': str(result[key]['diameter'].quantize(step)),
+             'roundness': str(result[key]['roundness'].quantize(step)),
+             'x': str(result[key]['x'].quantize(step)),
+             'y': str(result[key]['y'].quantize(step))}
+            for key, name in ROUNDNESS_FITS]
+    return fits, [str(b.quantize(step)) for b in result['bores']]
+
+
+def audit_roundness(calc_result: dict, readings: list, units: str):
+    """Record a roundness evaluation in the audit log, by its number of readings"""
+    fit = calc_result['result']['min_zone'] if calc_result['result'] else {}
+    audit_log.record('roundness', units, (len(readings),),
+                     (fit.get('diameter'), fit.get('roundness')), calc_result['error'])
+
+
+@app.route('/roundness', methods=('GET', 'POST'))
+def roundness_calc_render():
+    """Route for bore roundness evaluation"""
+    with stage('form'):
+        form = RoundnessForm()
+    calc_menu = copy.deepcopy(default_calc_menu)
+    calc_menu['Roundness']['selected'] = True
+    fits = None
+    readings = None
+    if request.method == 'POST':
+        logging.info("POST request on roundness evaluation")
+        log_remote_ip()
+        with stage('form'):
+            valid = form.validate_on_submit()
+        if not valid:
+            logging.warning("Form validation failed")
+            flash(form.readings.errors[0] if form.readings.errors else 'Form validation failed')
+        else:
+            form_units = form.units.data
+            precision = form.precision.data
+            readings = parse_readings(form.readings.data)
+            logging.info(f"Evaluating roundness of {len(readings)} readings")
+            with stage('calc'):
+                calc_result = evaluate_roundness(readings)
+            audit_roundness(calc_result, readings, form_units)
+            if calc_result['error'] is not None:
+                logging.info(f"Calculation error generated during roundness evaluation: "
+                             f"{calc_result['error']}")
+                flash(calc_result['error'])
+                readings = None
+            else:
+                fits, bores = format_roundness(calc_result['result'], precision)
+                flash(f"Roundness: {fits[0]['roundness']} {form_units}")
+                readings = [{'angle': r[3], 'bore': b} for r, b in zip(readings, bores)]
+    rendered = render_template('roundness.html',
+                               form=form,
+                               calc_menu=calc_menu,
+                               fits=fits,
+                               readings=readings)
+    return rendered
+
+
+@app.route('/api/roundness', methods=('POST',))
+@csrf.exempt
+def roundness_api():
+    """JSON API for bore roundness evaluation. Takes a JSON object with "readings", a list of
+    [pin1, pin2, pin3, angle] lists. Decimal values are returned as strings."""
+    with stage('form'):
+        data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify(error="Request body must be a JSON object"), 400
+    readings = data.get('readings')
+    if not isinstance(readings, list) or not all(isinstance(r, list) for r in readings):
+        return jsonify(error="readings must be a list of [pin1, pin2, pin3, angle] lists"), 400
+    with stage('calc'):
+        calc_result = evaluate_roundness([[str(v) for v in r] for r in readings])
+    audit_roundness(calc_result, readings, data.get('units', 'in'))
+    if calc_result['error'] is not None:
+        return jsonify(error=calc_result['error']), 400
+    result = calc_result['result']
+    return jsonify(bores=[str(b) for b in result['bores']],
+                   **{key: {k: str(v) for k, v in result[key].items()}
+                      for key, _ in ROUNDNESS_FITS})
 
 
 @app.errorhandler(404)
@@ -271,5 +770,36 @@ def page_not_found(e):
     return rendered, 500
 
 
+@warm_up.task
+def warm_up_forms():
+    """Validate submitted data with each calculator form"""
+    pins = {"pin1": "1", "pin2": "2", "pin3": "3", "units": "in", "precision": "0.001"}
+    for form_class, data in ((ThreePinForm, dict(pins, tol_radio='tol')),
+                             (ReverseForm, dict(pins, bore="6")),
+                             (PinSizeForm, {"pin_dia": "1", "units": "in"}),
+                             (OptimizeForm, dict(pins, tolerance_plus="0.001",
+                                                 tolerance_minus="0.001")),
+                             (RoundnessForm, {"readings": "1 2 3 0\n1 2 3 90", "units": "in",
+                                              "precision": "0.0001"}),
+                             (GaugeSetForm, {"sizes": "0.25 0.5", "classes": ["ZZ", "XX"],
+                                             "signs": ["+", "-"], "units": "in"})):
+        with app.test_request_context(method='POST', data=data):
+            form_class(meta={'csrf': False}).validate()
+
+
+@warm_up.task
+def warm_up_calculations():
+    """Run one calculation of each kind, priming the result cache"""
+    with app.app_context():
+        result_cache.calculate_hole_size("1", "2", "3")
+        result_cache.calculate_hole_size_limits(("1", "ZZ", True), ("2", "ZZ", True),
+                                                ("3", "ZZ", True), units="in")
+    hc.calculate_remaining_pin("6", "1", "2")
+    hc.pin_size_wrapper("1", "ZZ", True, "in")
+    optimize_tolerance_classes("0.5", "0.6", "0.7", "0.0003")
+    evaluate_roundness([("1", "2", "2.5", "0"), ("1", "2", "2.5", "120")])
+    list(format_rows(gauge_set_limits(["0.25", "0.5"], ["ZZ"], ["+", "-"])['result']))
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,203 @@
+"""Module containing per-worker memory profiling with tracemalloc, to find what makes worker
+memory grow over days of uptime.
+
+Tracing every allocation slows requests down several times, so allocations are traced for a
+random sample of requests instead, one at a time in each worker. Tracing starts before a
+sampled request is handled, and once its response has been sent and garbage collected, a
+snapshot shows the memory the request left allocated, such as cache entries or leaked objects.
+The sites of these retained allocations are added up over all sampled requests.
+
+Every MEMPROFILE_INTERVAL seconds each worker writes a JSON report to MEMPROFILE_DIR with its
+resident set size, the allocation sites that retained the most memory over all sampled requests
+and over those since its previous report, and the counts of the most numerous object types and
+of those that grew most since its previous report. Object counts cover all requests, not only
+sampled ones.
+
+The /admin/memory route writes and returns a report of the worker serving it, or with ?all=1
+returns the latest reports of every worker. It requires an "Authorization: Bearer
+<MEMPROFILE_TOKEN>" header, and is not found when no token is configured.
+
+Configuration keys read from the flask app config:
+- MEMPROFILE_ENABLED: sample requests and write periodic reports
+- MEMPROFILE_DIR: directory reports are written to
+- MEMPROFILE_INTERVAL: seconds between the periodic reports of each worker
+- MEMPROFILE_SAMPLE_RATE: fraction of requests whose allocations are traced
+- MEMPROFILE_FRAMES: number of stack frames recorded for each allocation
+- MEMPROFILE_TOP: number of allocation sites and object types in each report
+- MEMPROFILE_TOKEN: bearer token required by the admin route
+"""
+
+from collections import Counter
+import gc
+import glob
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from flask import current_app, g, request
+
+DEFAULT_DIR = '/dev/shm'
+DEFAULT_INTERVAL = 600
+DEFAULT_SAMPLE_RATE = 0.002
+DEFAULT_FRAMES = 1
+DEFAULT_TOP = 25
+REPORT_PREFIX = 'holecalc-memory-'
+# allocations by the profiler itself are left out of snapshots
+SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                    tracemalloc.Filter(False, '<unknown>'))
+
+
+def _rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _site(statistic) -> str:
+    frame = statistic.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def _top_sites(sizes: Counter, counts: Counter, top: int) -> list:
+    return [{'site': site, 'size': size, 'count': counts[site]}
+            for site, size in sizes.most_common(top) if size > 0]
+
+
+class MemoryProfiler:
+    """Flask extension sampling the allocations retained by requests in this worker process,
+    and writing reports of them"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.requests = 0
+        self.sampled = 0
+        # bytes and number of allocations retained by sampled requests, by allocation site
+        self.sizes = Counter()
+        self.counts = Counter()
+        # state at the previous report, for the growth since then
+        self.previous = None
+        self._sampling = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['memprofile'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        config = current_app.config
+        if not config.get('MEMPROFILE_ENABLED', False):
+            return
+        self.requests += 1
+        if self._sampling or tracemalloc.is_tracing():
+            return
+        if random.random() < config.get('MEMPROFILE_SAMPLE_RATE', DEFAULT_SAMPLE_RATE):
+            self._sampling = True
+            g.memprofile_sampled = True
+            tracemalloc.start(config.get('MEMPROFILE_FRAMES', DEFAULT_FRAMES))
+
+    def _after_request(self, response):
+        if not current_app.config.get('MEMPROFILE_ENABLED', False):
+            return response
+        if g.pop('memprofile_sampled', False):
+            # the response still holds allocations until it has been sent
+            response.call_on_close(self._finish_sample)
+        if self.previous is None:
+            self.previous = self._state()
+        elif time.time() - self.previous['time'] >= current_app.config.get(
+                'MEMPROFILE_INTERVAL', DEFAULT_INTERVAL):
+            response.call_on_close(self.write_report)
+        return response
+
+    def _finish_sample(self):
+        try:
+            gc.collect()
+            snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        finally:
+            tracemalloc.stop()
+            self._sampling = False
+        with self._lock:
+            self.sampled += 1
+            for statistic in snapshot.statistics('lineno'):
+                site = _site(statistic)
+                self.sizes[site] += statistic.size
+                self.counts[site] += statistic.count
+
+    def _state(self) -> dict:
+        return {'time': time.time(), 'rss_bytes': _rss_bytes(), 'sampled': self.sampled,
+                'sizes': self.sizes.copy(), 'counts': self.counts.copy(),
+                'objects': Counter(type(o).__name__ for o in gc.get_objects())}
+
+    def report(self) -> dict:
+        """Report on this worker, compared to its previous report"""
+        top = self.app.config.get('MEMPROFILE_TOP', DEFAULT_TOP)
+        with self._lock:
+            start = time.perf_counter()
+            state = self._state()
+            previous = self.previous or state
+            self.previous = state
+        sizes = state['sizes'] - previous['sizes']
+        counts = state['counts'] - previous['counts']
+        object_growth = state['objects'] - previous['objects']
+        return {
+            'pid': os.getpid(),
+            'time': state['time'],
+            'seconds_since_previous': round(state['time'] - previous['time'], 3),
+            'requests': self.requests,
+            'sampled_requests': state['sampled'],
+            'sampled_since_previous': state['sampled'] - previous['sampled'],
+            'rss_bytes': state['rss_bytes'],
+            'rss_growth_bytes': state['rss_bytes'] - previous['rss_bytes'],
+            'retained': _top_sites(state['sizes'], state['counts'], top),
+            'retained_since_previous': _top_sites(sizes, counts, top),
+            'objects': [{'type': name, 'count': count}
+                        for name, count in state['objects'].most_common(top)],
+            'object_growth': [{'type': name, 'count_diff': count,
+                               'count': state['objects'][name]}
+                              for name, count in object_growth.most_common(top)],
+            'report_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+
+    def write_report(self) -> dict:
+        """Write a report to MEMPROFILE_DIR, replacing this worker's previous report"""
+        report = self.report()
+        directory = self.app.config.get('MEMPROFILE_DIR', DEFAULT_DIR)
+        path = os.path.join(directory, f"{REPORT_PREFIX}{report['pid']}.json")
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(report, f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logging.exception(f"Could not write memory report {path}")
+        logging.info(f"Memory report for worker {report['pid']}: RSS {report['rss_bytes']} "
+                     f"bytes, {report['rss_growth_bytes']} since previous report")
+        return report
+
+    def read_reports(self) -> list:
+        """Latest report of every worker that has written one, with whether it is still
+        running"""
+        directory = self.app.config.get('MEMPROFILE_DIR', DEFAULT_DIR)
+        reports = []
+        for path in sorted(glob.glob(os.path.join(directory, REPORT_PREFIX + '*.json'))):
+            try:
+                with open(path) as f:
+                    report = json.load(f)
+            except (OSError, ValueError):
+                continue
+            report['alive'] = os.path.exists(f"/proc/{report['pid']}")
+            reports.append(report)
+        return reports
+
+    def authorized(self) -> bool:
+        """Whether the current request carries the configured admin token"""
+        token = current_app.config.get('MEMPROFILE_TOKEN')
+        supplied = request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(supplied.encode(),
+                                                   f"Bearer {token}".encode())
@@ -0,0 +1,226 @@
+"""Module containing a Jinja template loader that minifies template source before it is compiled.
+
+Every template is minified once, when Jinja first loads and compiles it, so rendered pages are
+already compact and routes no longer need to pass their output through html_minify. The
+whitespace rules follow django-htmlmin's html_minify: comments are removed, runs of whitespace
+are collapsed to one space, and whitespace next to block elements is removed, while whitespace
+next to inline text elements is kept. The content of pre, script and textarea elements is left
+untouched. Jinja statements are treated as opaque. Expressions that render WTForms fields are
+treated as block elements; any other expression outputs text, which is passed through the
+minify_space filter so that the same rules apply to it when the template is rendered.
+"""
+
+import re
+from jinja2 import BaseLoader
+from markupsafe import Markup
+
+# inline elements, whitespace next to these is significant (same list as django-htmlmin)
+TEXT_FLOW = {
+    "a", "em", "strong", "small", "s", "cite", "q", "dfn", "abbr", "data",
+    "time", "code", "var", "samp", "kbd", "sup", "sub", "i", "b", "u", "mark",
+    "ruby", "rt", "rp", "bdi", "bdo", "span", "br", "wbr", "ins", "del",
+}
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+    "source", "track", "wbr",
+}
+# elements whose content is copied as-is
+RAW_ELEMENTS = ("pre", "script", "textarea")
+# expressions rendering form fields or their labels, which output block elements
+WIDGET_EXPRESSION = re.compile(r'\{\{-?\s*(form\.|subfield\b)')
+# statements whose output is defined elsewhere, as opposed to control flow like if and for
+BOUNDARY_STATEMENT = re.compile(r'\{%-?\s*(extends|block|endblock|include|import|from|call)\b')
+
+# whitespace other than non-breaking space, as in django-htmlmin
+SPACE = '((?=\\s)[^\xa0])'
+MULTI_SPACE = re.compile(SPACE + '+')
+LEADING_SPACE = re.compile('^' + SPACE + '+')
+TRAILING_SPACE = re.compile(SPACE + '+$')
+
+EXPRESSION = re.compile(r'\{\{(-?)(.*?)(-?)\}\}', re.DOTALL)
+
+TOKEN = re.compile(r'''
+    (?P<jinja_comment>\{\#.*?\#\})
+    |(?P<statement>\{%.*?%\})
+    |(?P<expression>\{\{.*?\}\})
+    |(?P<comment><!--(?!\[if).*?-->)
+    |(?P<tag><(?P<closing>/)?(?P<name>[a-zA-Z][a-zA-Z0-9-]*|!)
+        (?:"[^"]*"|'[^']*'|\{\{.*?\}\}|\{%.*?%\}|[^>"'])*>)
+    ''', re.DOTALL | re.VERBOSE)
+
+BLOCK = 'block'
+INLINE = 'inline'
+TEXT = 'text'
+
+
+class _Token:
+    __slots__ = ('kind', 'source', 'before', 'after')
+
+    def __init__(self, kind: str, source: str, before: str = None, after: str = None):
+        self.kind = kind
+        self.source = source
+        # how the token appears to text immediately before and after it
+        self.before = before
+        self.after = after
+
+
+def _tag_token(match) -> _Token:
+    name = match.group('name').lower()
+    flow = INLINE if name in TEXT_FLOW else BLOCK
+    if name == '!':
+        return _Token('tag', match.group(0), BLOCK, BLOCK)
+    if match.group('closing'):
+        # text before a closing tag is the last child of the element, text after is a sibling
+        return _Token('tag', match.group(0), BLOCK, flow)
+    if name in VOID_ELEMENTS or match.group(0).endswith('/>'):
+        return _Token('tag', match.group(0), flow, flow)
+    # text after an opening tag is the first child of the element
+    return _Token('tag', match.group(0), flow, BLOCK)
+
+
+def _tokenize(source: str) -> list:
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = TOKEN.search(source, position)
+        end = match.start() if match else len(source)
+        if end > position:
+            tokens.append(_Token('text', source[position:end]))
+        if match is None:
+            break
+        position = match.end()
+        if match.group('jinja_comment') or match.group('comment'):
+            # removed, but still separates the text on either side like django-htmlmin does
+            tokens.append(_Token('comment', '', BLOCK, BLOCK))
+        elif match.group('statement'):
+            if BOUNDARY_STATEMENT.match(match.group(0)):
+                # output comes from another template or block, which start and end with block
+                # elements in this project
+                tokens.append(_Token('boundary', match.group(0), BLOCK, BLOCK))
+            else:
+                tokens.append(_Token('statement', match.group(0)))
+        elif match.group('expression'):
+            flow = BLOCK if WIDGET_EXPRESSION.match(match.group(0)) else TEXT
+            tokens.append(_Token('expression', match.group(0), flow, flow))
+        else:
+            token = _tag_token(match)
+            tokens.append(token)
+            name = match.group('name').lower()
+            if not match.group('closing') and name in RAW_ELEMENTS + ('style',):
+                close = re.compile(rf'</{name}\s*>', re.IGNORECASE).search(source, position)
+                content_end = close.start() if close else len(source)
+                content = source[position:content_end]
+                if name == 'style':
+                    content = _minify_style(content)
+                if content:
+                    tokens.append(_Token('raw', content, TEXT, TEXT))
+                position = content_end
+    return tokens
+
+
+def _minify_style(content: str) -> str:
+    """Collapse whitespace in a style element, leaving Jinja tags untouched"""
+    pieces = re.split(r'(\{\{.*?\}\}|\{%.*?%\})', content, flags=re.DOTALL)
+    minified = ''.join(p if p.startswith(('{{', '{%')) else MULTI_SPACE.sub(' ', p)
+                       for p in pieces)
+    return minified.strip(' ')
+
+
+def _neighbour(tokens: list, index: int, step: int, side: str) -> str:
+    """Flow class of the nearest token producing output before or after tokens[index], skipping
+    control flow statements and the whitespace between them, which output nothing that
+    html_minify would keep"""
+    index += step
+    while 0 <= index < len(tokens):
+        token = tokens[index]
+        if token.kind == 'text':
+            if token.source.strip():
+                return TEXT
+        elif token.kind != 'statement':
+            return getattr(token, side)
+        index += step
+    return BLOCK
+
+
+def minify_space(value, strip_left: bool, strip_right: bool):
+    """Jinja filter collapsing whitespace in text output by an expression, and removing it
+    from the sides of the text that border block elements"""
+    if not isinstance(value, str):
+        return value
+    text = MULTI_SPACE.sub(' ', value)
+    if strip_left:
+        text = LEADING_SPACE.sub('', text)
+    if strip_right:
+        text = TRAILING_SPACE.sub('', text)
+    return Markup(text) if isinstance(value, Markup) else text
+
+
+def _wrap_expression(tokens: list, index: int) -> str:
+    """Pass a text expression's output through the minify_space filter"""
+    before = tokens[index - 1] if index > 0 else None
+    after = tokens[index + 1] if index + 1 < len(tokens) else None
+    # strip a side if it borders a block element, or literal text already ending in a space
+    strip_left = _neighbour(tokens, index, -1, 'after') == BLOCK or \
+        (before is not None and before.kind == 'text' and before.source[-1:].isspace())
+    strip_right = _neighbour(tokens, index, 1, 'before') == BLOCK or \
+        (after is not None and after.kind == 'text' and after.source[:1].isspace())
+    left, expression, right = EXPRESSION.fullmatch(tokens[index].source).groups()
+    expression = f"({expression.strip()})|minify_space({strip_left}, {strip_right})"
+    return f"{{{{{left} {expression} {right}}}}}"
+
+
+def minify_template(source: str) -> str:
+    """Minify the HTML in a Jinja template's source, keeping all Jinja syntax intact"""
+    tokens = _tokenize(source)
+    output = []
+    # whether the last text written ended in a space, to avoid two spaces either side of a
+    # statement
+    trailing_space = False
+    for i, token in enumerate(tokens):
+        if token.kind == 'statement':
+            output.append(token.source)
+            continue
+        if token.kind == 'expression' and token.before == TEXT:
+            output.append(_wrap_expression(tokens, i))
+            trailing_space = False
+            continue
+        if token.kind != 'text':
+            output.append(token.source)
+            trailing_space = False
+            continue
+        before = _neighbour(tokens, i, -1, 'after')
+        after = _neighbour(tokens, i, 1, 'before')
+        text = MULTI_SPACE.sub(' ', token.source)
+        if text == ' ':
+            text = ' ' if before != BLOCK and after != BLOCK else ''
+        else:
+            text = LEADING_SPACE.sub(' ' if before != BLOCK else '', text)
+            text = TRAILING_SPACE.sub(' ' if after != BLOCK else '', text)
+        if trailing_space and text.startswith(' '):
+            text = text[1:]
+        if text:
+            trailing_space = text.endswith(' ')
+        output.append(text)
+    return ''.join(output)
+
+
+def init_app(app):
+    """Minify the templates of a flask app. Must be called before the first template is
+    rendered."""
+    app.jinja_loader = MinifyingLoader(app.jinja_loader)
+    app.jinja_env.filters['minify_space'] = minify_space
+
+
+class MinifyingLoader(BaseLoader):
+    """Jinja loader that wraps another loader and minifies the source of every template it
+    loads. Jinja caches compiled templates, so each template is minified only once."""
+
+    def __init__(self, loader: BaseLoader):
+        self.loader = loader
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = self.loader.get_source(environment, template)
+        return minify_template(source), filename, uptodate
+
+    def list_templates(self):
+        return self.loader.list_templates()
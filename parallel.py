@@ -0,0 +1,208 @@
+"""Module containing a pool of processes that evaluates one large calculation on several cores
+within a request.
+
+Each gunicorn worker forks its own pool once, when a calculation first needs it, and all of the
+worker's requests share it. A calculation is a kernel function applied to numpy
+arrays: split inputs and the outputs are divided into chunks of rows along their first axis,
+and shared inputs are passed whole to every chunk. The arrays of a calculation are placed in one
+memory-mapped file under /dev/shm, which pool processes map too, so only the file name and the
+rows of each chunk are pickled, never the data. Each chunk writes its rows of the outputs in
+place, so the outputs are in order once every chunk has finished, and are returned still mapped,
+without a copy. Calculations with fewer than PARALLEL_THRESHOLD output elements, or with the
+pool disabled, run in the calling process. If a pool process dies during a calculation, for
+example killed for running out of memory, the calculation raises BrokenProcessPool at once
+rather than waiting forever on the lost chunk, and the next calculation starts a new pool.
+
+Configuration keys read from the flask app config:
+- PARALLEL_ENABLED: run large calculations on the process pool
+- PARALLEL_PROCESSES: number of pool processes of each worker, by default the CPUs divided
+  between the PARALLEL_WORKERS workers, so concurrent large requests in every worker don't run
+  more processes than there are CPUs
+- PARALLEL_WORKERS: number of gunicorn workers, each with its own pool
+- PARALLEL_THRESHOLD: smallest number of output elements calculated on the pool
+- PARALLEL_CHUNK: largest number of output elements in a chunk
+- PARALLEL_DIR: directory of the files holding the arrays of calculations
+"""
+
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import numpy as np
+
+DEFAULT_THRESHOLD = 1 << 18
+DEFAULT_CHUNK = 1 << 16
+DEFAULT_DIR = '/dev/shm'
+# chunks per pool process at least, so processes that finish early take on more of the work
+CHUNKS_PER_PROCESS = 4
+# arrays in the file start on cache line boundaries
+ALIGN = 64
+
+
+def cpu_count() -> int:
+    """Number of CPUs this process may run on, which may be fewer than the machine has"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _layout(specs: list) -> tuple:
+    """Offset, dtype and shape of each array of a list of (shape, dtype), packed into one file,
+    and the size of the file"""
+    layout = []
+    offset = 0
+    for shape, dtype in specs:
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in shape)
+        layout.append((offset, dtype.str, shape))
+        offset += -(-int(np.prod(shape)) * dtype.itemsize // ALIGN) * ALIGN
+    return layout, max(offset, ALIGN)
+
+
+def _map_arrays(path: str, layout: list) -> list:
+    """Arrays of a calculation, mapped from its file"""
+    data = np.asarray(np.memmap(path, dtype=np.uint8, mode='r+'))
+    arrays = []
+    for offset, dtype, shape in layout:
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        arrays.append(data[offset:offset + size].view(dtype).reshape(shape))
+    return arrays
+
+
+def _init_process():
+    # shutting down is left to the worker that forked the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _run_chunk(task: tuple) -> int:
+    """Run a kernel on one chunk of rows of a calculation, in a pool process"""
+    kernel, path, layout, split, shared, start, stop = task
+    arrays = _map_arrays(path, layout)
+    kernel(*(a[start:stop] for a in arrays[:split]),
+           *arrays[split:split + shared],
+           *(a[start:stop] for a in arrays[split + shared:]))
+    return stop - start
+
+
+class ParallelPool:
+    """Flask extension holding the process pool of this worker process, and running
+    calculations on it"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._pool_pid = None
+        self._pool_processes = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['parallel'] = self
+        atexit.register(self.close)
+
+    def processes(self) -> int:
+        """Number of processes calculations are divided between, 1 when the pool is disabled"""
+        config = self.app.config
+        if not config.get('PARALLEL_ENABLED', False):
+            return 1
+        return config.get('PARALLEL_PROCESSES') or \
+            max(1, cpu_count() // (config.get('PARALLEL_WORKERS') or 1))
+
+    def start(self):
+        """Fork the pool of this worker process if it is enabled and not already running"""
+        processes = self.processes()
+        if processes < 2:
+            return None
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid() and \
+                    self._pool_processes == processes:
+                return self._pool
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            # a pool inherited from a parent process belongs to the parent
+            self._pool = ProcessPoolExecutor(processes, initializer=_init_process,
+                                             mp_context=multiprocessing.get_context('fork'))
+            self._pool_pid = os.getpid()
+            self._pool_processes = processes
+            logging.info(f"Started a pool of {processes} calculation processes in worker "
+                         f"{self._pool_pid}")
+            return self._pool
+
+    def close(self):
+        """Stop the pool of this worker process"""
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _discard(self, pool):
+        """Forget a broken pool, so the next calculation starts a new one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def run(self, kernel, split: tuple, shared: tuple = (), outputs: tuple = ()) -> tuple:
+        """Calculate outputs by applying kernel to chunks of rows, on the pool when the
+        calculation is large enough.
+
+        :param kernel: Module level function called as kernel(*split, *shared, *outputs) with
+        the rows of a chunk of each split input and output, writing its results into the
+        output rows
+        :param split: Arrays with a row per row of the outputs, divided into chunks
+        :param shared: Arrays passed whole to every chunk
+        :param outputs: (shape, dtype) of each output, with the same number of rows as the split
+        inputs
+        :returns: Tuple of the output arrays
+        :raises BrokenProcessPool: if a pool process died, the pool is discarded so the next
+        calculation starts a new one
+        """
+        rows = len(split[0])
+        elements = sum(int(np.prod(shape)) for shape, _ in outputs)
+        config = self.app.config
+        processes = self.processes()
+        if processes < 2 or rows < 2 or \
+                elements < config.get('PARALLEL_THRESHOLD', DEFAULT_THRESHOLD):
+            results = tuple(np.empty(shape, dtype) for shape, dtype in outputs)
+            kernel(*split, *shared, *results)
+            return results
+        pool = self.start()
+        row_elements = max(1, elements // rows)
+        chunk_rows = max(1, min(config.get('PARALLEL_CHUNK', DEFAULT_CHUNK) // row_elements,
+                                -(-rows // (processes * CHUNKS_PER_PROCESS))))
+        inputs = tuple(np.asarray(a) for a in tuple(split) + tuple(shared))
+        layout, size = _layout([(a.shape, a.dtype) for a in inputs] + list(outputs))
+        fd, path = tempfile.mkstemp(prefix='holecalc-parallel-',
+                                    dir=config.get('PARALLEL_DIR', DEFAULT_DIR))
+        try:
+            os.ftruncate(fd, size)
+            arrays = _map_arrays(path, layout)
+            for array, source in zip(arrays, inputs):
+                array[...] = source
+            tasks = [(kernel, path, layout, len(split), len(shared), start,
+                      min(start + chunk_rows, rows))
+                     for start in range(0, rows, chunk_rows)]
+            try:
+                for _ in pool.map(_run_chunk, tasks):
+                    pass
+            except BrokenProcessPool:
+                logging.error(f"A calculation process of worker {os.getpid()} died, "
+                              f"discarding its pool")
+                self._discard(pool)
+                raise
+        finally:
+            # the mapping stays valid after the file is removed, until the arrays are freed
+            os.close(fd)
+            os.unlink(path)
+        logging.debug(f"Calculated {elements} elements in {len(tasks)} chunks on "
+                      f"{processes} processes")
+        return tuple(arrays[len(inputs):])
@@ -0,0 +1,278 @@
+"""Module containing admission control for the hole calc flask app: a per-client token bucket
+rate limit for each route and a global limit on requests in progress.
+
+State is kept in a small memory-mapped file (by default under /dev/shm) so that every gunicorn
+worker sees the same buckets and in-progress counts. Requests that are over a limit are rejected
+with a 429 response before any form parsing or calculation runs.
+
+Configuration keys read from the flask app config:
+- RATELIMIT_ENABLED: turn admission control on or off
+- RATELIMIT_STATE_FILE: path of the shared state file
+- RATELIMIT_MAX_CONCURRENT: maximum requests in progress across all workers
+- RATELIMIT_DEFAULT: (burst, refill rate per second) applied to routes without their own limit
+- RATELIMIT_ROUTES: dictionary of endpoint name to (burst, rate per second), or None to exempt
+"""
+
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from flask import current_app, g, request, Response
+
+DEFAULT_STATE_FILE = '/dev/shm/holecalc-ratelimit'
+DEFAULT_MAX_CONCURRENT = 16
+DEFAULT_LIMIT = (20, 2.0)
+# endpoints that are never limited, regardless of configuration
+EXEMPT_ENDPOINTS = ('heartbeat', 'static', 'hashed_asset')
+
+MAGIC = b'HCRLIM01'
+HEADER = struct.Struct('<8sII')  # magic, number of worker slots, number of bucket slots
+WORKER = struct.Struct('<qq')  # pid, requests in progress
+BUCKET = struct.Struct('<Qdd')  # key hash, tokens, last update time
+WORKER_SLOTS = 256
+BUCKET_SLOTS = 8192
+# number of neighbouring bucket slots searched before the least recently used is evicted
+BUCKET_PROBES = 8
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedState:
+    """Token buckets and per-worker in-progress counts stored in a memory-mapped file.
+
+    Every method takes an exclusive flock on the file, so updates from different worker
+    processes are atomic. The file is opened lazily and reopened after a fork, because flock
+    locks are shared by processes that inherit the same open file."""
+
+    def __init__(self, path: str, worker_slots: int = WORKER_SLOTS,
+                 bucket_slots: int = BUCKET_SLOTS):
+        self.path = path
+        self.worker_slots = worker_slots
+        self.bucket_slots = bucket_slots
+        self.workers_offset = HEADER.size
+        self.buckets_offset = self.workers_offset + worker_slots * WORKER.size
+        self.size = self.buckets_offset + bucket_slots * BUCKET.size
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._worker_index = None
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            expected = HEADER.pack(MAGIC, self.worker_slots, self.bucket_slots)
+            if header != expected or os.fstat(fd).st_size != self.size:
+                # new file or one written with a different layout, start from empty state
+                logging.info(f"Initializing rate limit state file {self.path}")
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, expected, 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+        self._worker_index = None
+
+    def _lock(self):
+        self._thread_lock.acquire()
+        try:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def _unlock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def _worker_slot(self) -> int:
+        """Offset of this process' in-progress counter, claiming a free slot if needed"""
+        if self._worker_index is not None:
+            return self.workers_offset + self._worker_index * WORKER.size
+        pid = os.getpid()
+        free = None
+        for i in range(self.worker_slots):
+            slot_pid, _ = WORKER.unpack_from(self._map, self.workers_offset + i * WORKER.size)
+            if slot_pid == pid:
+                free = i
+                break
+            if slot_pid == 0 and free is None:
+                free = i
+        if free is None:
+            # workers that exited without child_exit cleanup leave their slot behind
+            for i in range(self.worker_slots):
+                slot_pid, _ = WORKER.unpack_from(self._map, self.workers_offset + i * WORKER.size)
+                if not _pid_alive(slot_pid):
+                    free = i
+                    break
+        if free is None:
+            raise RuntimeError("No free worker slots in rate limit state file")
+        offset = self.workers_offset + free * WORKER.size
+        WORKER.pack_into(self._map, offset, pid, 0)
+        self._worker_index = free
+        return offset
+
+    def in_progress(self) -> int:
+        """Total number of requests in progress across all workers"""
+        self._lock()
+        try:
+            return self._in_progress()
+        finally:
+            self._unlock()
+
+    def _in_progress(self) -> int:
+        counts = struct.unpack_from(f'<{self.worker_slots * 2}q', self._map, self.workers_offset)
+        return sum(counts[1::2])
+
+    def acquire(self, max_concurrent: int) -> bool:
+        """Count a request as in progress, unless max_concurrent requests already are"""
+        self._lock()
+        try:
+            if self._in_progress() >= max_concurrent:
+                return False
+            offset = self._worker_slot()
+            pid, count = WORKER.unpack_from(self._map, offset)
+            WORKER.pack_into(self._map, offset, pid, count + 1)
+            return True
+        finally:
+            self._unlock()
+
+    def release(self):
+        """Mark a request previously counted by acquire() as finished"""
+        self._lock()
+        try:
+            offset = self._worker_slot()
+            pid, count = WORKER.unpack_from(self._map, offset)
+            WORKER.pack_into(self._map, offset, pid, max(count - 1, 0))
+        finally:
+            self._unlock()
+
+    def release_worker(self, pid: int):
+        """Free the slot of a worker process that has exited, along with any requests it was
+        counting as in progress"""
+        self._lock()
+        try:
+            for i in range(self.worker_slots):
+                offset = self.workers_offset + i * WORKER.size
+                if WORKER.unpack_from(self._map, offset)[0] == pid:
+                    WORKER.pack_into(self._map, offset, 0, 0)
+        finally:
+            self._unlock()
+
+    def take_token(self, key: str, burst: int, rate: float) -> float:
+        """Take a token from the bucket identified by key, which holds up to burst tokens and
+        refills at rate tokens per second.
+
+        :returns: 0 if a token was taken, otherwise the number of seconds until one is available
+        """
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(),
+                                  'little') or 1
+        now = time.monotonic()
+        self._lock()
+        try:
+            start = key_hash % self.bucket_slots
+            oldest = None
+            for probe in range(BUCKET_PROBES):
+                target = self.buckets_offset + \
+                    ((start + probe) % self.bucket_slots) * BUCKET.size
+                slot_hash, tokens, updated = BUCKET.unpack_from(self._map, target)
+                if slot_hash == key_hash:
+                    tokens = min(burst, tokens + (now - updated) * rate)
+                    break
+                if slot_hash == 0:
+                    # buckets are never removed, so the key can't be further along
+                    tokens = burst
+                    break
+                if oldest is None or updated < oldest[1]:
+                    oldest = (target, updated)
+            else:
+                # an idle bucket is equivalent to a full one, so the least recently updated
+                # neighbour can be evicted without changing the limit any client sees
+                target = oldest[0]
+                tokens = burst
+            if tokens >= 1:
+                BUCKET.pack_into(self._map, target, key_hash, tokens - 1, now)
+                return 0
+            BUCKET.pack_into(self._map, target, key_hash, tokens, now)
+            return (1 - tokens) / rate
+        finally:
+            self._unlock()
+
+
+class RateLimiter:
+    """Flask extension applying the shared admission control to every request.
+
+    Must be initialized before other extensions that read the request body in a before_request
+    hook (such as CSRFProtect), so that rejected requests are never parsed."""
+
+    def __init__(self, app=None, key_func=None):
+        self.key_func = key_func or (lambda: request.remote_addr)
+        self.state = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _get_state(self, config) -> SharedState:
+        path = config.get('RATELIMIT_STATE_FILE', DEFAULT_STATE_FILE)
+        if self.state is None or self.state.path != path:
+            self.state = SharedState(path)
+        return self.state
+
+    @staticmethod
+    def _reject(retry_after: float) -> Response:
+        return Response("Too many requests, try again later", status=429,
+                        headers={'Retry-After': str(max(1, math.ceil(retry_after)))},
+                        mimetype='text/plain')
+
+    def _before_request(self):
+        config = current_app.config
+        if not config.get('RATELIMIT_ENABLED', False) or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        limit = config.get('RATELIMIT_ROUTES', {}).get(
+            request.endpoint, config.get('RATELIMIT_DEFAULT', DEFAULT_LIMIT))
+        if limit is None:
+            return None
+        state = self._get_state(config)
+        client = self.key_func()
+        retry_after = state.take_token(f"{client}|{request.endpoint}", *limit)
+        if retry_after:
+            logging.warning(f"Rate limit exceeded on {request.endpoint} by {client}")
+            return self._reject(retry_after)
+        if not state.acquire(config.get('RATELIMIT_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT)):
+            logging.warning(f"Concurrency limit reached, rejecting {request.endpoint}")
+            return self._reject(1)
+        g.ratelimit_acquired = True
+        return None
+
+    def _teardown_request(self, exc):
+        if g.pop('ratelimit_acquired', False):
+            self.state.release()
+
+
+def release_worker(pid: int, path: str = DEFAULT_STATE_FILE):
+    """Release the in-progress count of an exited worker, for use in gunicorn's child_exit hook"""
+    if os.path.exists(path):
+        SharedState(path).release_worker(pid)
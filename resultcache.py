@@ -0,0 +1,209 @@
+"""Module containing a result cache for hole size calculations that is shared between gunicorn
+worker processes.
+
+Results are stored in a fixed-size open-addressing hash table in a memory-mapped file (by
+default under /dev/shm). Each slot holds a fixed-width record keyed by a digest of the normalized
+calculation inputs. Writers serialize through an flock on the file; readers take no lock and
+instead use a per-record sequence number (a seqlock) to detect and discard records that were
+being rewritten while they were read. When every slot an insert may use is occupied, the oldest
+record among them is evicted.
+
+Configuration keys read from the flask app config:
+- RESULT_CACHE_ENABLED: turn the cache on or off
+- RESULT_CACHE_FILE: path of the shared cache file
+- RESULT_CACHE_SLOTS: number of records the cache holds
+"""
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from flask import current_app
+from holecalc import holecalc as hc
+
+DEFAULT_CACHE_FILE = '/dev/shm/holecalc-results'
+DEFAULT_SLOTS = 16384
+# number of neighbouring slots searched for a key before giving up, or evicting on insert
+PROBES = 8
+
+MAGIC = b'HCRES001'
+HEADER = struct.Struct('<8sI')  # magic, number of slots
+SEQ = struct.Struct('<Q')  # record sequence number, odd while the record is being written
+# key digest, time written, number of results, then two result blocks
+RECORD = struct.Struct('<Q16sdB7x')
+# status (0 result, 1 error), decimal result or error text, pin circle x, y, r values
+RESULT = struct.Struct('<B63s9d')
+RESULT_SLOTS = 2
+RECORD_SIZE = RECORD.size + RESULT_SLOTS * RESULT.size
+
+
+def _encode_result(result: dict) -> bytes:
+    if result['error'] is not None:
+        return RESULT.pack(1, result['error'].encode(), *([0.0] * 9))
+    coordinates = [c[k] for c in result['circles'] for k in ('x', 'y', 'r')]
+    return RESULT.pack(0, str(result['result']).encode(), *coordinates)
+
+
+def _decode_result(data: bytes, offset: int) -> dict:
+    status, text, *coordinates = RESULT.unpack_from(data, offset)
+    text = text.rstrip(b'\0').decode()
+    if status:
+        return {'result': None, 'error': text}
+    circles = tuple({'x': coordinates[i], 'y': coordinates[i + 1], 'r': coordinates[i + 2]}
+                    for i in range(0, 9, 3))
+    return {'result': Decimal(text), 'circles': circles, 'error': None}
+
+
+def make_key(kind: str, numbers: tuple, labels: tuple = ()) -> bytes:
+    """Digest of calculation inputs. Decimal inputs are normalized so that equal numbers such as
+    "1" and "1.000" produce the same key, raises InvalidOperation for non-numeric values.
+
+    :param kind: name of the calculation
+    :param numbers: decimal inputs, as strings or Decimal objects
+    :param labels: other inputs such as units or tolerance classes, compared as strings
+    """
+    parts = [kind] + [str(Decimal(n).normalize()) for n in numbers] + [str(x) for x in labels]
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=16).digest()
+
+
+class SharedResultTable:
+    """Fixed-size hash table of calculation results in a memory-mapped file.
+
+    The file is opened lazily and reopened after a fork, because flock locks are shared by
+    processes that inherit the same open file."""
+
+    def __init__(self, path: str, slots: int = DEFAULT_SLOTS):
+        self.path = path
+        self.slots = slots
+        self.size = HEADER.size + slots * RECORD_SIZE
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            expected = HEADER.pack(MAGIC, self.slots)
+            if os.pread(fd, HEADER.size, 0) != expected or os.fstat(fd).st_size != self.size:
+                logging.info(f"Initializing result cache file {self.path}")
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, expected, 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+
+    def _offsets(self, key: bytes):
+        start = int.from_bytes(key[:8], 'little') % self.slots
+        for probe in range(PROBES):
+            yield HEADER.size + ((start + probe) % self.slots) * RECORD_SIZE
+
+    def get(self, key: bytes):
+        """Return the tuple of result dictionaries stored under key, or None on a miss. Takes no
+        lock, a record that changes while it is read counts as a miss."""
+        self._open()
+        for offset in self._offsets(key):
+            seq = SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                continue
+            data = self._map[offset:offset + RECORD_SIZE]
+            if SEQ.unpack_from(self._map, offset)[0] != seq:
+                continue
+            _, slot_key, _, count = RECORD.unpack_from(data)
+            if slot_key == key:
+                return tuple(_decode_result(data, RECORD.size + i * RESULT.size)
+                             for i in range(count))
+            if seq == 0:
+                # records are never removed, so the key can't be further along
+                return None
+        return None
+
+    def put(self, key: bytes, results: tuple):
+        """Store a tuple of up to two result dictionaries under key"""
+        payload = b''.join(_encode_result(r) for r in results)
+        self._thread_lock.acquire()
+        try:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                target = None
+                oldest = None
+                for offset in self._offsets(key):
+                    seq, slot_key, written, _ = RECORD.unpack_from(self._map, offset)
+                    if seq == 0 or slot_key == key:
+                        target = offset
+                        break
+                    if oldest is None or written < oldest[1]:
+                        oldest = (offset, written)
+                if target is None:
+                    target = oldest[0]
+                seq = SEQ.unpack_from(self._map, target)[0]
+                SEQ.pack_into(self._map, target, seq + 1)
+                self._map[target + SEQ.size:target + RECORD.size + len(payload)] = \
+                    RECORD.pack(0, key, time.time(), len(results))[SEQ.size:] + payload
+                SEQ.pack_into(self._map, target, seq + 2)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+
+class ResultCache:
+    """Flask extension wrapping the holecalc hole size functions with the shared result table.
+
+    When RESULT_CACHE_ENABLED is false the wrapped functions are called directly."""
+
+    def __init__(self, app=None):
+        self.table = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['result_cache'] = self
+
+    def _get_table(self):
+        config = current_app.config
+        if not config.get('RESULT_CACHE_ENABLED', False):
+            return None
+        path = config.get('RESULT_CACHE_FILE', DEFAULT_CACHE_FILE)
+        if self.table is None or self.table.path != path:
+            self.table = SharedResultTable(path, config.get('RESULT_CACHE_SLOTS', DEFAULT_SLOTS))
+        return self.table
+
+    def _cached(self, key_parts: tuple, calculate):
+        table = self._get_table()
+        if table is None:
+            return calculate()
+        try:
+            key = make_key(*key_parts)
+        except (InvalidOperation, ValueError, TypeError):
+            return calculate()
+        cached = table.get(key)
+        if cached is not None:
+            logging.debug(f"Result cache hit for {key_parts[0]} {key_parts[1]}")
+            return cached
+        result = calculate()
+        table.put(key, result)
+        return result
+
+    def calculate_hole_size(self, pin1, pin2, pin3) -> dict:
+        """Cached version of holecalc.calculate_hole_size()"""
+        return self._cached(('hole', (pin1, pin2, pin3)),
+                            lambda: (hc.calculate_hole_size(pin1, pin2, pin3),))[0]
+
+    def calculate_hole_size_limits(self, pin1: tuple, pin2: tuple, pin3: tuple, units: str):
+        """Cached version of holecalc.calculate_hole_size_limits()"""
+        return self._cached(('limits', (pin1[0], pin2[0], pin3[0]),
+                             (units,) + pin1[1:] + pin2[1:] + pin3[1:]),
+                            lambda: hc.calculate_hole_size_limits(pin1, pin2, pin3, units))
@@ -3,6 +3,7 @@
 // run toggleTol when page loads, so if "toleranced" is selected the fields will show after reloading the page
 document.addEventListener("DOMContentLoaded", function () {
     toggleTol();
+    loadToleranceTables();
 });
 
 // function to toggle showing pin tolerance options.
@@ -26,4 +27,146 @@ function loading() {
         loaders[i].style.visibility = 'visible';
     }
     document.getElementById('calculate').disabled = true
-}
\ No newline at end of file
+}
+
+// Gage size calculation in the browser, from the tolerance tables exported by the server at the URL in the
+// gage size form's data-tolerances attribute. The URL changes whenever the tables do, so browsers cache them
+// indefinitely. Sizes are calculated as integers scaled to the smallest decimal place used, and rounded half up,
+// so results are identical to the server's. Until the tables are loaded, or for input the form would reject, the
+// form is submitted to the server as usual.
+let toleranceTables = null;
+
+function loadToleranceTables() {
+    let form = document.querySelector(".calc#pinsize form[data-tolerances]");
+    if (!form) {
+        return;
+    }
+    fetch(form.dataset.tolerances)
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error("Tolerance tables not available");
+            }
+            return response.json();
+        })
+        .then(function (tables) {
+            toleranceTables = tables;
+        })
+        .catch(function (error) {
+            console.log(error);
+        });
+    // registered on the document while capturing, so it runs before the form's own submit handlers
+    document.addEventListener("submit", pinSizeSubmit, true);
+}
+
+// parse a decimal number written without exponent or sign into its digits and number of decimal places,
+// returns null if it is not one or has too many digits to be calculated exactly
+function parseDecimal(text) {
+    let match = /^\s*(\d*)(?:\.(\d*))?\s*$/.exec(text);
+    if (!match || !(match[1] + (match[2] || ""))) {
+        return null;
+    }
+    let fraction = match[2] || "";
+    let digits = (match[1] + fraction).replace(/^0+/, "");
+    if (fraction.length > 9 || digits.length > 15) {
+        return null;
+    }
+    return {digits: Number(digits), places: fraction.length};
+}
+
+// integer of a parsed decimal scaled to places decimal places
+function scaled(decimal, places) {
+    return decimal.digits * 10 ** (places - decimal.places);
+}
+
+// round an integer scaled to places decimal places half up to precision decimal places, as the server's decimal
+// context does
+function roundScaled(value, places, precision) {
+    if (places <= precision) {
+        return value * 10 ** (precision - places);
+    }
+    let step = 10 ** (places - precision);
+    return Math.floor((value + step / 2) / step);
+}
+
+// text of an integer scaled to places decimal places
+function formatScaled(value, places) {
+    let text = String(value).padStart(places + 1, "0");
+    return places ? text.slice(0, -places) + "." + text.slice(-places) : text;
+}
+
+// minimum and maximum diameters of a gage pin as text, as pin_tolerance_limits() and the gage size calculator
+// calculate them, or an error message, or null if the size is not a valid input
+function gageLimits(tables, size, tolClass, sign, units) {
+    let table = tables.units[units];
+    let nominal = parseDecimal(size);
+    // limits of the form's pin diameter field, whose minimum is compared with the float 0.00001, which is
+    // slightly above the decimal 0.00001
+    if (!table || !nominal || !(Number(size) > 0.00001 && Number(size) <= 9999)) {
+        return null;
+    }
+    let lower = parseDecimal(table.lower);
+    let precision = parseDecimal(table.precision).places;
+    let ranges = table.ranges.map(function (range) {
+        return [parseDecimal(range[0]), parseDecimal(range[1][tolClass])];
+    });
+    let places = Math.max(nominal.places, lower.places, ...ranges.map(r => Math.max(r[0].places, r[1].places)));
+    let value = scaled(nominal, places);
+    let range = ranges.find(r => value <= scaled(r[0], places));
+    if (value <= scaled(lower, places) || !range) {
+        return {error: "Diameter not within tolerance class limits"};
+    }
+    let tolerance = scaled(range[1], places);
+    let limits = sign === "+" ? [value, value + tolerance] : [value - tolerance, value];
+    return {
+        min: formatScaled(roundScaled(limits[0], places, precision), precision),
+        max: formatScaled(roundScaled(limits[1], places, precision), precision)
+    };
+}
+
+// show gage size results in the same markup as the server's results
+function showPinSizeResults(results, units) {
+    let container = document.getElementById("pinsize-results");
+    for (let row of container.querySelectorAll(":scope > .pure-u-1")) {
+        row.remove();
+    }
+    let rows = results.error ? [[results.error]] :
+        [["Max gage diameter", results.max + " " + units], ["Min gage diameter", results.min + " " + units]];
+    for (let [label, value] of rows.reverse()) {
+        let row = document.createElement("div");
+        row.className = "pure-u-1";
+        if (value === undefined) {
+            row.innerHTML = '<div class="pure-u-1"><p class="result-error"></p></div>';
+            row.querySelector("p").textContent = label;
+        } else {
+            row.innerHTML = '<div class="pure-u-1-2"><b></b></div><div class="pure-u-1-3"></div>';
+            row.querySelector("b").textContent = label;
+            row.querySelector(".pure-u-1-3").textContent = value;
+        }
+        container.prepend(row);
+    }
+    let svg = container.querySelector("svg");
+    if (!svg.querySelector("line")) {
+        svg.insertAdjacentHTML("beforeend",
+            '<line x1="35" y1="90" x2="35" y2="0" stroke="#ffac00" stroke-width="2"></line>' +
+            '<line x1="5" y1="115" x2="5" y2="0" stroke="#ffac00" stroke-width="2"></line>');
+    }
+}
+
+function pinSizeSubmit(event) {
+    let form = event.target;
+    if (!toleranceTables || !form.matches(".calc#pinsize form")) {
+        return;
+    }
+    let units = form.elements["units"].value;
+    let results = gageLimits(toleranceTables, form.elements["pin_dia"].value, form.elements["pin_class"].value,
+        form.elements["pin_sign"].value, units);
+    if (!results) {
+        return;
+    }
+    event.preventDefault();
+    event.stopPropagation();
+    if (window.recordFormEvent) {
+        recordFormEvent(form);
+    }
+    showPinSizeResults(results, units);
+}
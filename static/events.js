@@ -12,10 +12,15 @@ for (let i = 0; i < forms.length; i++) {
 function handleFormEvent(event) {
   event.preventDefault();
   console.log("Handling form event")
-  let attributes = event.target.getAttribute('dataanalytics').split(/,(.+)/);
-  let events = [JSON.parse(attributes[0]), JSON.parse(attributes[1] || '{}')];
-  plausible(...events);
+  recordFormEvent(event.target);
   setTimeout(function () {
       event.target.submit();
   }, 150);
+}
+
+// Send the event of a form, also used for forms calculated in the browser without submitting them
+function recordFormEvent(form) {
+  let attributes = form.getAttribute('dataanalytics').split(/,(.+)/);
+  let events = [JSON.parse(attributes[0]), JSON.parse(attributes[1] || '{}')];
+  plausible(...events);
 }
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Tests for the accuracy comparison harness in tools/accuracy.py
+"""
+
+from decimal import Decimal
+from tools import accuracy
+import numpy
+import pytest
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("accuracy") / "corpus.npz")
+    accuracy.generate(path, size=3000, seed=1, workers=1)
+    with numpy.load(path) as data:
+        yield {k: data[k] for k in data.files}
+
+
+def test_reference_bore():
+    assert abs(accuracy.reference_bore(["1", "2", "3"]) - 6) < Decimal("1e-45")
+    assert accuracy.reference_bore(["1", "1", "1"]).quantize(Decimal("0.000001")) == \
+        Decimal("2.154701")
+    # the third pin is too small to touch the other two
+    assert accuracy.reference_bore(["2", "2", "0.1"]) is None
+
+
+def test_corpus(corpus):
+    assert corpus['pins'].shape == (3000, 3)
+    assert set(corpus['categories']) == set(range(len(accuracy.CATEGORIES)))
+    reference = corpus['reference']
+    valid = numpy.isfinite(reference)
+    assert valid.mean() > 0.5
+    # quantized references agree with the float references
+    step = accuracy.STEPS.index('0.001')
+    assert numpy.allclose(corpus['quantized'][valid, step] * 0.001, reference[valid], atol=0.0006)
+
+
+def test_quantize():
+    floats = numpy.array([0.0005, 0.0015, 2.0004999, numpy.nan])
+    assert accuracy.quantize(floats, '0.001').tolist() == [1, 2, 2000, 0]
+    decimals = numpy.array([Decimal("0.0025"), None], dtype=object)
+    assert accuracy.quantize(decimals, '0.001').tolist() == [3, 0]
+
+
+def test_backends_agree_with_reference(corpus):
+    report = accuracy.evaluate(corpus)
+    assert report['triples'] == 3000
+    assert set(report['backends']) == set(accuracy.BACKENDS)
+    for name, backend in report['backends'].items():
+        assert backend['wrong_validity'] == 0
+        assert backend['throughput_per_s'] > 0
+        # away from degenerate triples every backend matches at the calculators' default
+        # precision, and the float backends are within a fraction of the finest step
+        for category in ('typical', 'collinear', 'equal', 'tiny'):
+            assert backend['categories'][category]['steps']['0.001']['mismatches'] == 0
+            if name != 'decimal':
+                assert backend['categories'][category]['steps']['0.000001'][
+                    'max_error_steps'] < 0.01
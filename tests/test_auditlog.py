@@ -0,0 +1,98 @@
+"""
+Tests for the calculation audit log in auditlog.py and its export tool in tools/audit.py
+"""
+
+import csv
+from decimal import Decimal
+import io
+import math
+import auditlog
+from tools import audit
+import numpy
+import pytest
+
+
+def write_log(path, records):
+    writer = auditlog.LogWriter(str(path))
+    writer.write(records)
+    writer.close()
+
+
+def test_records(tmp_path):
+    path = tmp_path / "audit.log"
+    write_log(path, [
+        auditlog.make_record('hole_size_limits', 'in', (Decimal("1"), "2", 3.5),
+                             (Decimal("6.0003"), Decimal("6.0009")), None, ('ZZ', 'X', 'XX'),
+                             ('+', '-', '+'), '10.1.2.3', timestamp=1000.0),
+        auditlog.make_record('pin_size', 'mm', ("30",), (), "Diameter not within tolerance "
+                             "class limits", ('Z',), ('-',), '2001:db8::1', timestamp=1001.0)])
+    # a second writer appends to the existing log without another header
+    write_log(path, [auditlog.make_record('hole_size', 'in', ("1", "2", "3"), ("6",),
+                                          timestamp=1002.0)])
+    records = auditlog.read_log(str(path))
+    assert path.stat().st_size == auditlog.HEADER_SIZE + 3 * auditlog.RECORD_SIZE
+    assert records['time'].tolist() == [1000.0, 1001.0, 1002.0]
+    assert records['inputs'][0, :3].tolist() == [1.0, 2.0, 3.5]
+    assert math.isnan(records['inputs'][0, 3])
+    output = io.StringIO()
+    assert auditlog.write_csv(auditlog.scan(records), output) == 3
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+    assert rows[0]['time'] == '1970-01-01T00:16:40.000000Z'
+    assert [rows[0][k] for k in ('kind', 'units', 'input1', 'input3', 'input4', 'class1', 'sign2',
+                                 'result1', 'client')] == \
+        ['hole_size_limits', 'in', '1.0', '3.5', '', 'ZZ', '-', '6.0003', '10.1.2.3']
+    assert rows[1]['error'] == "Diameter not within tolerance class limits"
+    assert rows[1]['client'] == '2001:db8::1'
+    assert rows[1]['result1'] == rows[1]['class2'] == ''
+    assert rows[2]['client'] == ''
+
+
+def test_partial_record(tmp_path):
+    # a record being appended is not read back until it is complete
+    path = tmp_path / "audit.log"
+    write_log(path, [auditlog.make_record('hole_size', 'in', ("1", "2", "3"), ("6",))] * 2)
+    with open(path, 'ab') as f:
+        f.write(b'\1' * (auditlog.RECORD_SIZE // 2))
+    assert len(auditlog.read_log(str(path))) == 2
+    (tmp_path / "other").write_bytes(b'not a log')
+    with pytest.raises(ValueError):
+        auditlog.read_log(str(tmp_path / "other"))
+
+
+def test_scan(tmp_path, monkeypatch):
+    # small blocks, so scans cover many of them
+    monkeypatch.setattr(auditlog, 'SCAN_BLOCK', 7)
+    rng = numpy.random.default_rng(1)
+    times = numpy.arange(1000) + rng.uniform(-auditlog.ORDER_SLACK, 0, 1000) + 10000
+    bores = rng.uniform(0, 10, 1000)
+    kinds = rng.choice(['hole_size', 'remaining_pin'], 1000)
+    path = tmp_path / "audit.log"
+    write_log(path, [auditlog.make_record(k, 'in', ("1",), (b,), timestamp=t)
+                     for t, b, k in zip(times, bores, kinds)])
+    records = auditlog.read_log(str(path))
+
+    def scanned(**filters):
+        return numpy.concatenate(list(auditlog.scan(records, **filters)) or
+                                 [numpy.empty(0, dtype=auditlog.RECORD)])
+    result = scanned(start=10300, end=10400.5)
+    assert sorted(result['time']) == sorted(times[(times >= 10300) & (times <= 10400.5)])
+    result = scanned(start=10300, kind='remaining_pin', min_result=2, max_result=3)
+    expected = (times >= 10300) & (kinds == 'remaining_pin') & (bores >= 2) & (bores <= 3)
+    assert result['time'].tolist() == times[expected].tolist()
+    assert len(scanned(units='mm')) == 0
+
+
+def test_export(tmp_path, capsys):
+    path = tmp_path / "audit.log"
+    write_log(path, [auditlog.make_record('hole_size', 'in', ("1", "2", str(3 + i / 10)),
+                                          (str(6 + i / 10),), timestamp=86400.0 + i * 3600)
+                     for i in range(48)])
+    output = tmp_path / "out.csv"
+    audit.main(['export', str(path), str(output), '--start', '1970-01-02T10:00',
+                '--end', '1970-01-02T12:00+00:00', '--min-result', '7.05'])
+    rows = list(csv.DictReader(open(output)))
+    assert [r['time'] for r in rows] == ['1970-01-02T11:00:00.000000Z',
+                                         '1970-01-02T12:00:00.000000Z']
+    assert [r['result1'] for r in rows] == ['7.1', '7.2']
+    audit.main(['summary', str(path)])
+    assert '"hole_size": 48' in capsys.readouterr().out
@@ -0,0 +1,67 @@
+"""
+Tests for the bore map generator in tools/boremap.py
+"""
+
+from holecalc import holecalc
+from tools import boremap
+import numpy
+import pytest
+
+
+@pytest.fixture
+def spec():
+    # small chunks, so the map is split into many of them
+    return boremap.GridSpec((0.1, 1.0, 30), (0.2, 2.0, 20), (0.05, 0.5, 4), chunk_cells=100)
+
+
+def test_generate(tmp_path, spec):
+    path = str(tmp_path / "map.npy")
+    assert boremap.generate(path, spec, workers=2) == spec.chunks
+    bore_map = numpy.load(path)
+    assert bore_map.shape == (4, 30, 20)
+    assert bore_map.dtype == numpy.float32
+    pin1, pin2, pin3 = spec.values
+    for k, i, j in ((0, 0, 0), (1, 7, 13), (3, 29, 19), (2, 15, 0)):
+        expected = holecalc.calculate_hole_size(str(pin1[i]), str(pin2[j]), str(pin3[k]))
+        if expected['error'] is None:
+            assert bore_map[k, i, j] == pytest.approx(float(expected['result']), rel=1e-6)
+        else:
+            assert numpy.isnan(bore_map[k, i, j])
+    # a small pin between two large ones cannot touch both, and has no enclosing circle
+    assert numpy.isnan(bore_map[0, 29, 19])
+
+
+def test_resume(tmp_path, spec):
+    path = str(tmp_path / "map.npy")
+    boremap.generate(path, spec, workers=1)
+    complete = numpy.load(path)
+    # simulate an interruption that lost the last few chunks
+    progress = numpy.load(path + ".progress.npy", mmap_mode='r+')
+    progress[-3:] = 0
+    progress.flush()
+    bore_map = numpy.load(path, mmap_mode='r+')
+    k, start, _ = spec.chunk(spec.chunks - 3)
+    bore_map[k, start:] = 0
+    bore_map.flush()
+    assert boremap.generate(path, spec, workers=1) == 3
+    assert numpy.array_equal(numpy.load(path), complete, equal_nan=True)
+    assert boremap.generate(path, spec, workers=1) == 0
+
+
+def test_different_grid(tmp_path, spec):
+    path = str(tmp_path / "map.npy")
+    boremap.generate(path, spec, workers=1)
+    other = boremap.GridSpec((0.1, 1.0, 31), (0.2, 2.0, 20), (0.05, 0.5, 4), chunk_cells=100)
+    with pytest.raises(ValueError):
+        boremap.generate(path, other, workers=1)
+    assert boremap.generate(path, other, workers=1, overwrite=True) == other.chunks
+
+
+def test_preview(tmp_path):
+    path = str(tmp_path / "map.npy")
+    boremap.generate(path, boremap.GridSpec((0.1, 1.0, 100), (0.1, 1.0, 90), (0.3,)), workers=1)
+    preview = boremap.preview(path, size=10)
+    assert preview.shape == (1, 10, 9)
+    assert numpy.array_equal(preview, numpy.load(path)[:, ::10, ::10], equal_nan=True)
+    boremap.write_pgm(str(tmp_path / "preview.pgm"), preview[0])
+    assert (tmp_path / "preview.pgm").read_bytes().startswith(b"P5\n9 10\n255\n")
@@ -1,6 +1,23 @@
 from main import app as hc_app
 from main import load_config
+import main
+import auditlog
+import formats
+import jobs
+import assets
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import gzip
+import json
+import logging
+import os
+import bs4
+from collections import Counter
+import jinja2
+from htmlmin.minify import html_minify
 import pytest
+import time
+import tracemalloc
 
 """
 Tests for the flask app
@@ -21,6 +38,15 @@ def client(flask_app):
     return flask_app.test_client()
 
 
+@pytest.fixture
+def built_assets(tmp_path, monkeypatch):
+    """build fingerprinted static assets into a temporary directory and serve them"""
+    manifest = assets.build(build_dir=str(tmp_path))
+    monkeypatch.setattr(main, 'asset_manifest', manifest)
+    monkeypatch.setattr(assets, 'BUILD_DIR', str(tmp_path))
+    yield manifest
+
+
 def test_environment(flask_app):
     assert flask_app.config['TESTING'] is True
 
@@ -81,3 +107,501 @@ def test_pin_size_calculation_mm(flask_app, client):
     response = client.post('/pinsize', data=post_data)
     assert b"64.9898" in response.data
     assert b"65.0000" in response.data
+
+
+def test_optimizer(flask_app, client):
+    post_data = {"pin1": "0.5",
+                 "pin2": "0.6",
+                 "pin3": "0.7",
+                 "tolerance_plus": "0.0003",
+                 "tolerance_minus": "0.0003",
+                 "units": "in",
+                 "precision": "0.00001"}
+    response = client.post('/optimize', data=post_data)
+    assert b"1.31551" in response.data
+    assert b"<td>ZZ+</td>" in response.data
+    # a zero deviation is a tolerance, not a missing one
+    response = client.post('/optimize', data=dict(post_data, tolerance_plus="0.0006",
+                                                  tolerance_minus="0"))
+    assert b"This field is required" not in response.data
+    assert b"<td>1.31593</td>" in response.data
+
+
+def test_optimizer_api(flask_app, client):
+    response = client.post('/api/optimize', json={"pins": ["0.5", "0.6", "0.7"],
+                                                  "tolerance_plus": "0.0001",
+                                                  "tolerance_minus": "0.00005",
+                                                  "limit": 3})
+    assert response.status_code == 200
+    assert response.json['nominal'] == "1.31550846991"
+    assert len(response.json['combinations']) == 3
+    assert response.json['combinations'][0]['cost'] == 5.4
+    response = client.post('/api/optimize', json={"pins": ["0.5", "0.6"]})
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+
+def test_roundness(flask_app, client):
+    post_data = {"readings": "1 2 2.5 0\n1, 2, 2.6, 90\n\n1 2 2.5 180",
+                 "units": "in",
+                 "precision": "0.0001"}
+    response = client.post('/roundness', data=post_data)
+    assert b"Minimum zone" in response.data
+    assert response.data.count(b"<td>90</td>") == 1
+    bore = main.hc.calculate_hole_size("1", "2", "2.6")['result'].quantize(Decimal("0.0001"))
+    assert f"<td>{bore}</td>".encode() in response.data
+    response = client.post('/roundness', data=dict(post_data, readings="1 2 3"))
+    assert b"Line 1 needs pin 1, pin 2, pin 3 and angle" in response.data
+
+
+def test_roundness_api(flask_app, client):
+    response = client.post('/api/roundness', json={"readings": [[1, 2, 2.5, 0], [1, 2, 2.6, 90]]})
+    assert response.status_code == 200
+    assert len(response.json['bores']) == 2
+    assert set(response.json['min_zone']) == {'x', 'y', 'diameter', 'roundness'}
+    response = client.post('/api/roundness', json={"readings": [[1, 1, 0.01, 0]]})
+    assert response.status_code == 400
+    assert response.json['error'] == "Reading 1 does not describe a bore, check pin values"
+    assert client.post('/api/roundness', json={"readings": "1 2 3 0"}).status_code == 400
+
+
+def test_gauge_set(flask_app, client):
+    post_data = {"sizes": "0.25, 0.5\n30", "classes": ["ZZ", "X"], "signs": ["+", "-"],
+                 "units": "in", "output": "html"}
+    response = client.post('/gaugeset', data=post_data)
+    assert response.mimetype == 'text/html'
+    assert response.data.count(b"<td>0.5</td>") == 4
+    assert b"<td>0.499960</td><td>0.500000</td>" in response.data
+    assert response.data.count(b"Diameter not within tolerance class limits") == 4
+    response = client.post('/gaugeset', data=dict(post_data, sizes="", start="0.25", stop="0.26",
+                                                  step="0.005", classes="ZZ", signs="+",
+                                                  output="csv"))
+    assert response.mimetype == 'text/csv'
+    assert response.data.decode().splitlines() == [
+        "nominal,class,sign,min,max,units,error",
+        "0.250,ZZ,+,0.250000,0.250200,in,",
+        "0.255,ZZ,+,0.255000,0.255200,in,",
+        "0.260,ZZ,+,0.260000,0.260200,in,"]
+    response = client.post('/gaugeset', data=dict(post_data, sizes=""))
+    assert b"Enter sizes or a size range" in response.data
+    response = client.post('/gaugeset', data=dict(post_data, classes=[]))
+    assert b"Select at least one class" in response.data
+
+
+def test_gauge_set_api(flask_app, client):
+    request = {"range": {"start": 1, "stop": 2, "step": 0.5}, "classes": ["XX"], "signs": ["-"],
+               "units": "mm"}
+    response = client.post('/api/gaugeset', json=request)
+    assert response.mimetype == 'text/csv'
+    assert response.data.decode().splitlines()[1:] == [
+        "1.0,XX,-,0.9995,1.0000,mm,", "1.5,XX,-,1.4995,1.5000,mm,", "2.0,XX,-,1.9995,2.0000,mm,"]
+    response = client.post('/api/gaugeset', json=dict(request, sizes=["21.5"]),
+                           headers={'Accept': 'text/html'})
+    assert response.mimetype == 'text/html'
+    assert b"<td>21.4992</td><td>21.5000</td>" in response.data
+    response = client.post('/api/gaugeset', json=dict(request, classes=["Q"]))
+    assert response.status_code == 400
+    assert response.json['error'] == "Invalid tolerance class specified: Q"
+    response = client.post('/api/gaugeset', json={"sizes": "1", "classes": ["X"], "signs": ["+"]})
+    assert response.status_code == 400
+
+
+def test_server_timing(flask_app, client):
+    post_data = {"pin1": "1", "pin2": "2", "pin3": "3", "units": "in", "precision": "0.001"}
+    response = client.post('/', data=post_data)
+    stages = dict(s.split(';dur=') for s in response.headers['Server-Timing'].split(', '))
+    assert list(stages) == ['form', 'calc', 'render', 'total']
+    assert sum(float(stages[s]) for s in ('form', 'calc', 'render')) <= float(stages['total'])
+
+
+def test_server_timing_log(flask_app, client, monkeypatch, caplog):
+    monkeypatch.setitem(flask_app.config, 'SERVER_TIMING_LOG', True)
+    with caplog.at_level(logging.INFO):
+        client.get('/pinsize')
+    line = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Server timing")]
+    record = json.loads(line[0][len("Server timing "):])
+    assert record['endpoint'] == 'pin_calc_render'
+    assert record['status'] == 200
+    assert set(record['ms']) == {'form', 'render', 'total'}
+
+
+def test_server_timing_disabled(flask_app, client, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SERVER_TIMING_ENABLED', False)
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+
+
+@pytest.fixture
+def warm_up_enabled(flask_app, monkeypatch):
+    """enable warm-up, with this process not yet warmed up"""
+    monkeypatch.setitem(flask_app.config, 'WARMUP_ENABLED', True)
+    monkeypatch.setattr(main.warm_up, 'ready', False)
+    yield main.warm_up
+
+
+def test_warm_up(warm_up_enabled, client):
+    response = client.get('/heartbeat')
+    assert response.status_code == 503
+    assert warm_up_enabled.run()
+    assert client.get('/heartbeat').data == b'OK'
+
+
+def test_warm_up_failure(warm_up_enabled, client, monkeypatch):
+    monkeypatch.setattr(warm_up_enabled, 'tasks', [lambda: 1 / 0])
+    assert not warm_up_enabled.run()
+    assert client.get('/heartbeat').status_code == 503
+
+
+@pytest.mark.parametrize("method,url,data", [
+    ("GET", "/", None),
+    ("GET", "/reverse", None),
+    ("GET", "/pinsize", None),
+    ("GET", "/optimize", None),
+    ("GET", "/roundness", None),
+    ("GET", "/gaugeset", None),
+    ("GET", "/about/", None),
+    ("GET", "/guide/", None),
+    ("GET", "/nonexistent", None),
+    ("POST", "/", {"pin1": "1", "pin2": "2", "pin3": "3", "units": "in", "precision": "0.001",
+                   "tol_radio": "tol", "pin1_class": "X", "pin1_sign": "+", "pin2_class": "X",
+                   "pin2_sign": "+", "pin3_class": "X", "pin3_sign": "+"}),
+    ("POST", "/", {"pin1": "0", "pin2": "2", "pin3": "3"}),
+    ("POST", "/reverse", {"pin1": "1", "pin2": "2", "bore": "6", "units": "in",
+                          "precision": "0.001"}),
+    ("POST", "/pinsize", {"pin_dia": "1", "pin_class": "ZZ", "pin_sign": "-", "units": "in"}),
+    ("POST", "/optimize", {"pin1": "0.5", "pin2": "0.6", "pin3": "0.7", "tolerance_plus": "0.0003",
+                           "tolerance_minus": "0.0001", "units": "in", "precision": "0.00001"}),
+    ("POST", "/roundness", {"readings": "1 2 2.5 0\n1 2 2.6 90", "units": "in",
+                            "precision": "0.0001"}),
+    ("POST", "/gaugeset", {"sizes": "0.25 30", "classes": "ZZ", "signs": "+", "units": "in",
+                           "output": "html"}),
+])
+def test_minified_templates(flask_app, client, monkeypatch, method, url, data):
+    """pages rendered from the minified templates must be equivalent to the unminified pages
+    passed through html_minify, which re-serializes its output with BeautifulSoup"""
+    minified = client.open(url, method=method, data=data).data.decode()
+    monkeypatch.setattr(flask_app.jinja_env, 'loader', jinja2.FileSystemLoader('templates'))
+    reference = client.open(url, method=method, data=data).data.decode()
+    assert len(minified) < len(reference)
+    # html_minify changes how BeautifulSoup serializes doctypes, so it must run first
+    expected = html_minify(reference)
+    assert str(bs4.BeautifulSoup(minified, 'html5lib')) == expected
+
+
+def test_unbuilt_assets_use_static(flask_app, client, monkeypatch):
+    monkeypatch.setattr(main, 'asset_manifest', {})
+    response = client.get('/')
+    assert b"/static/styles.css" in response.data
+
+
+def test_hashed_asset_urls(flask_app, client, built_assets):
+    response = client.get('/')
+    assert f"/assets/{built_assets['styles.css']}".encode() in response.data
+    assert b"/static/styles.css" not in response.data
+
+
+def test_hashed_asset_references_rewritten(flask_app, client, built_assets):
+    response = client.get(f"/assets/{built_assets['styles.css']}")
+    assert f"/assets/{built_assets['fonts/SpaceGrotesk.woff2']}".encode() in response.data
+    assert b"/static/fonts" not in response.data
+
+
+def test_hashed_asset_precompressed(flask_app, client, built_assets):
+    url = f"/assets/{built_assets['custom.js']}"
+    plain = client.get(url)
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert 'immutable' in plain.headers['Cache-Control']
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.mimetype == plain.mimetype
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_hashed_asset_not_found(flask_app, client, built_assets):
+    assert client.get('/assets/manifest.json').status_code == 404
+    assert client.get(f"/assets/{built_assets['custom.js']}.gz").status_code == 404
+    assert client.get('/assets/missing.css').status_code == 404
+
+
+def test_tolerance_table_asset(flask_app, client):
+    page = client.get('/pinsize').data.decode()
+    url = page.split('data-tolerances="')[1].split('"')[0]
+    assert url.startswith('/assets/tolerances.') and url.endswith('.json')
+    plain = client.get(url)
+    assert plain.json == main.tolerance_table()
+    assert plain.json['units']['in']['ranges'][0] == \
+        ["0.825", {"XX": "0.000020", "X": "0.000040", "Y": "0.000070", "Z": "0.000100",
+                   "ZZ": "0.000200"}]
+    assert 'immutable' in plain.headers['Cache-Control']
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    cached = client.get(url, headers={'If-None-Match': plain.headers['ETag']})
+    assert cached.status_code == 304
+    assert client.get('/assets/tolerances.00000000.json').status_code == 404
+
+
+@pytest.fixture
+def rate_limited(flask_app, tmp_path, monkeypatch):
+    """enable admission control with a small burst and a negligible refill rate"""
+    monkeypatch.setitem(flask_app.config, 'RATELIMIT_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'RATELIMIT_STATE_FILE', str(tmp_path / 'ratelimit'))
+    monkeypatch.setitem(flask_app.config, 'RATELIMIT_DEFAULT', (2, 0.01))
+    monkeypatch.setitem(flask_app.config, 'RATELIMIT_ROUTES', {'guide': None})
+    monkeypatch.setitem(flask_app.config, 'RATELIMIT_MAX_CONCURRENT', 16)
+    yield flask_app
+
+
+def test_rate_limit(rate_limited, client):
+    assert client.get('/about/').status_code == 200
+    assert client.get('/about/').status_code == 200
+    response = client.get('/about/')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # buckets are per route and per client
+    assert client.get('/').status_code == 200
+    assert client.get('/about/', headers={'X-Forwarded-For': '10.0.0.2, 10.0.0.1'}) \
+        .status_code == 200
+
+
+def test_rate_limit_client_from_proxy(rate_limited, client):
+    """the client is the address the proxy appended, not one the client sent"""
+    for _ in range(2):
+        client.get('/about/', headers={'X-Forwarded-For': '10.0.0.1'})
+    for spoofed in ('10.0.0.1', '10.0.0.2, 10.0.0.1', '10.0.0.3, 10.0.0.4, 10.0.0.1'):
+        assert client.get('/about/', headers={'X-Forwarded-For': spoofed}).status_code == 429
+    assert client.get('/about/', headers={'X-Forwarded-For': '10.0.0.1, 10.0.0.5'}) \
+        .status_code == 200
+
+
+def test_rate_limit_rejects_before_form_parsing(rate_limited, client, monkeypatch):
+    for _ in range(2):
+        client.get('/reverse')
+
+    def fail(*args, **kwargs):
+        raise AssertionError("calculation ran for a rejected request")
+    monkeypatch.setattr(main.hc, 'calculate_remaining_pin', fail)
+    response = client.post('/reverse', data={"pin1": "1", "pin2": "2", "bore": "6"})
+    assert response.status_code == 429
+
+
+def test_rate_limit_exemptions(rate_limited, client):
+    for _ in range(5):
+        assert client.get('/heartbeat').status_code == 200
+        assert client.get('/guide/').status_code == 200
+
+
+def test_concurrency_limit(rate_limited, client, monkeypatch):
+    monkeypatch.setitem(rate_limited.config, 'RATELIMIT_MAX_CONCURRENT', 0)
+    response = client.get('/about/')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert client.get('/heartbeat').status_code == 200
+
+
+def test_result_cache(flask_app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'RESULT_CACHE_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'RESULT_CACHE_FILE', str(tmp_path / 'results'))
+    post_data = {"pin1": "1", "pin2": "2", "pin3": "3", "tol_radio": "tol",
+                 "pin1_class": "ZZ", "pin1_sign": "+", "pin2_class": "ZZ", "pin2_sign": "+",
+                 "pin3_class": "ZZ", "pin3_sign": "+", "units": "in", "precision": "0.0001"}
+    uncached = client.post('/', data=post_data)
+    assert b"6.0003" in uncached.data
+
+    def fail(*args, **kwargs):
+        raise AssertionError("result was not served from the cache")
+    monkeypatch.setattr(main.hc, 'calculate_hole_size_limits', fail)
+    cached = client.post('/', data=post_data)
+    assert cached.data == uncached.data
+
+
+def test_jobs(flask_app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'JOBS_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'JOBS_DATABASE', str(tmp_path / 'jobs.sqlite'))
+    monkeypatch.setitem(flask_app.config, 'JOBS_CHUNK_SIZE', 2)
+    rows = [["1", "2", "3"], ["1", "1", "0.01"], ["0.5", "0.6", "0.7"]]
+    response = client.post('/api/jobs', json={"kind": "hole_size", "rows": rows})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status'] == 'queued'
+    assert job['total'] == 3
+    assert client.get(job['status_url']).get_json()['progress'] == 0
+    result_url = f"/api/jobs/{job['id']}/result"
+    assert client.get(result_url).status_code == 409
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        jobs.run_pending(jobs.get_store(flask_app.config), executor, max_pending=1)
+    status = client.get(job['status_url']).get_json()
+    assert status['status'] == 'done'
+    assert status['progress'] == 1
+    assert status['result_url'] == result_url
+    response = client.get(result_url)
+    assert response.headers['Content-Disposition'] == f"attachment; filename=job-{job['id']}.json"
+    result = response.get_json()
+    assert result['kind'] == 'hole_size'
+    assert [r['result'] for r in result['results']] == [
+        None if r is None else str(r)
+        for r in (main.hc.calculate_hole_size(*row)['result'] for row in rows)]
+    assert result['results'][1]['error'] is not None
+
+
+def test_job_result_formats(flask_app, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'JOBS_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'JOBS_DATABASE', str(tmp_path / 'jobs.sqlite'))
+    rows = [["1", "2", "3"], ["1", "1", "0.01"]]
+    job = client.post('/api/jobs', json={"kind": "hole_size", "rows": rows}).get_json()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        jobs.run_pending(jobs.get_store(flask_app.config), executor, max_pending=1)
+    result_url = f"/api/jobs/{job['id']}/result"
+    json_results = client.get(result_url, headers={'Accept': '*/*'}).get_json()['results']
+    response = client.get(result_url, headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Vary'] == 'Accept'
+    assert [json.loads(line) for line in response.data.splitlines()] == json_results
+    response = client.get(result_url, headers={
+        'Accept': 'application/vnd.holecalc.columns, application/json;q=0.5'})
+    assert response.headers['Content-Disposition'].endswith('.columns')
+    _, columns, errors = formats.read_columns(response.data)
+    assert columns['result'][0] == float(json_results[0]['result'])
+    assert errors[columns['error'][1]] == json_results[1]['error']
+    assert client.get(result_url, headers={'Accept': 'text/csv'}).status_code == 406
+
+
+def test_jobs_invalid(flask_app, client, tmp_path, monkeypatch):
+    assert client.post('/api/jobs', json={"kind": "hole_size", "rows": [["1", "2", "3"]]}) \
+        .status_code == 503
+    monkeypatch.setitem(flask_app.config, 'JOBS_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'JOBS_DATABASE', str(tmp_path / 'jobs.sqlite'))
+    response = client.post('/api/jobs', json={"kind": "hole_size", "rows": [["1", "2"]]})
+    assert response.status_code == 400
+    assert "Row 0" in response.get_json()['error']
+    assert client.post('/api/jobs', data="rows").status_code == 400
+    assert client.get('/api/jobs/nonsense').status_code == 404
+    assert client.get('/api/jobs/nonsense/result').status_code == 404
+
+
+@pytest.fixture
+def audit_logging(flask_app, tmp_path, monkeypatch):
+    """enable the audit log, written to a temporary file"""
+    monkeypatch.setitem(flask_app.config, 'AUDIT_LOG_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'AUDIT_LOG_PATH', str(tmp_path / 'audit.log'))
+    yield str(tmp_path / 'audit.log')
+    main.audit_log.close()
+
+
+def test_audit_log(audit_logging, client):
+    pins = {"pin1": "1", "pin2": "2", "pin3": "3", "units": "in", "precision": "0.001"}
+    client.post('/', data=pins, headers={'X-Forwarded-For': '10.0.0.1, 203.0.113.7'})
+    client.post('/', data=dict(pins, tol_radio='tol', pin1_class='X', pin1_sign='+'))
+    client.post('/reverse', data=dict(pins, bore="6"))
+    client.post('/pinsize', data={"pin_dia": "30", "pin_class": "ZZ", "pin_sign": "-",
+                                  "units": "in"})
+    client.post('/api/roundness', json={"readings": [[1, 2, 2.5, 0], [1, 2, 2.6, 90]]})
+    client.post('/api/gaugeset', json={"sizes": [0.5, 0.25], "classes": ["X"], "signs": ["+"]})
+    # form validation failures are not calculations
+    client.post('/', data={"pin1": "0"})
+    main.audit_log.close()
+    records = auditlog.read_log(audit_logging)
+    assert [auditlog.KINDS[k - 1] for k in records['kind']] == [
+        'hole_size', 'hole_size_limits', 'remaining_pin', 'pin_size', 'roundness', 'gauge_set']
+    assert records['time'][0] == pytest.approx(time.time(), abs=60)
+    assert records['inputs'][0, :3].tolist() == [1, 2, 3]
+    assert records['result'][0, 0] == pytest.approx(6.0, abs=1e-3)
+    assert bytes(records['client'][0][-4:]) == bytes([203, 0, 113, 7])
+    assert records['result'][1, 0] < records['result'][1, 1]
+    assert records['classes'][1].tolist() == [2, 5, 5]
+    assert records['inputs'][2, :3].tolist() == [1, 2, 6]
+    assert records['error'][3] == b"Diameter not within tolerance class limits"
+    assert records['inputs'][4, 0] == 2
+    assert records['inputs'][5, :5].tolist() == [2, 0.25, 0.5, 1, 1]
+
+
+def test_audit_log_jobs(audit_logging, client, tmp_path, monkeypatch):
+    monkeypatch.setitem(hc_app.config, 'JOBS_ENABLED', True)
+    monkeypatch.setitem(hc_app.config, 'JOBS_DATABASE', str(tmp_path / 'jobs.sqlite'))
+    client.post('/api/jobs', json={"kind": "pin_size", "rows": [["1", "X", "-"]] * 3,
+                                   "units": "mm"})
+    client.post('/api/jobs', json={"kind": "pin_size", "rows": []})
+    main.audit_log.close()
+    records = auditlog.read_log(audit_logging)
+    assert [auditlog.KINDS[k - 1] for k in records['kind']] == ['job']
+    assert records['inputs'][0, :2].tolist() == [3, auditlog.KINDS.index('pin_size') + 1]
+    assert auditlog.UNITS[records['units'][0] - 1] == 'mm'
+
+
+@pytest.fixture
+def memory_profiling(flask_app, tmp_path, monkeypatch):
+    """enable memory profiling of every request, with reports in a temporary directory"""
+    monkeypatch.setitem(flask_app.config, 'MEMPROFILE_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'MEMPROFILE_SAMPLE_RATE', 1.0)
+    monkeypatch.setitem(flask_app.config, 'MEMPROFILE_DIR', str(tmp_path))
+    monkeypatch.setitem(flask_app.config, 'MEMPROFILE_TOKEN', 'secret')
+    profiler = main.memory_profiler
+    for name, value in (('requests', 0), ('sampled', 0), ('sizes', Counter()),
+                        ('counts', Counter()), ('previous', None), ('_sampling', False)):
+        monkeypatch.setattr(profiler, name, value)
+    yield tmp_path
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def get_closed_json(client, url, **kwargs):
+    """GET a JSON response and close it, running its call_on_close callbacks"""
+    with client.get(url, **kwargs) as response:
+        return response.get_json()
+
+
+def test_memory_report(memory_profiling, client, monkeypatch):
+    headers = {'Authorization': 'Bearer secret'}
+    first = get_closed_json(client, '/admin/memory', headers=headers)
+    assert first['pid'] == os.getpid()
+    assert first['rss_bytes'] > 0
+    assert first['objects']
+    assert (memory_profiling / f"holecalc-memory-{os.getpid()}.json").exists()
+
+    # pages rendered by sampled requests leak memory
+    leaked = []
+    render_template = main.render_template
+
+    class LeakedPage:
+        def __init__(self):
+            self.data = bytearray(100000)
+
+    def leaky_render_template(*args, **kwargs):
+        leaked.append(LeakedPage())
+        return render_template(*args, **kwargs)
+    monkeypatch.setattr(main, 'render_template', leaky_render_template)
+    for _ in range(3):
+        client.get('/about/').close()
+    assert not tracemalloc.is_tracing()
+    second = get_closed_json(client, '/admin/memory', headers=headers)
+    assert second['requests'] == 5
+    assert second['sampled_since_previous'] == 4
+    top = second['retained_since_previous'][0]
+    assert top['site'].split(':')[0].endswith('test_flask.py')
+    assert top['size'] >= 300000
+    assert {'type': 'LeakedPage', 'count_diff': 3} in [
+        {'type': o['type'], 'count_diff': o['count_diff']} for o in second['object_growth']]
+    workers = get_closed_json(client, '/admin/memory?all=1', headers=headers)['workers']
+    assert [(w['pid'], w['alive']) for w in workers] == [(os.getpid(), True)]
+
+
+def test_memory_report_periodic(memory_profiling, client, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'MEMPROFILE_INTERVAL', 0)
+    client.get('/about/').close()
+    client.get('/about/').close()
+    report = json.loads((memory_profiling / f"holecalc-memory-{os.getpid()}.json").read_text())
+    assert report['requests'] == 2
+    assert report['sampled_requests'] == 2
+
+
+def test_memory_report_authorization(memory_profiling, client, monkeypatch):
+    assert client.get('/admin/memory').status_code == 404
+    assert client.get('/admin/memory', headers={'Authorization': 'Bearer wrong'}) \
+        .status_code == 404
+    monkeypatch.setitem(main.app.config, 'MEMPROFILE_TOKEN', None)
+    assert client.get('/admin/memory', headers={'Authorization': 'Bearer secret'}) \
+        .status_code == 404
@@ -0,0 +1,93 @@
+"""
+Tests for the bulk result formats in formats.py
+"""
+
+import json
+import formats
+import jobs
+import numpy
+import pytest
+
+
+def encoded(mimetype, kind, rows, units='in', chunk_size=2):
+    """encode the results of rows calculated in chunks, as a job's results would be"""
+    chunks = [json.dumps(jobs.calculate_chunk(kind, units, rows[i:i + chunk_size]))
+              for i in range(0, len(rows), chunk_size)]
+    job = {'id': 'abc', 'kind': kind, 'total': len(rows)}
+    return b''.join(formats.encode(mimetype, job, chunks)), jobs.calculate_chunk(kind, units, rows)
+
+
+HOLE_ROWS = [["1", "2", "3"], ["1", "1", "0.01"], ["0.5", "0.6", "0.7"], ["1", "1", "1"],
+             ["1", "1", "0.01"]]
+
+
+def test_json():
+    data, results = encoded(formats.JSON, 'hole_size', HOLE_ROWS)
+    assert json.loads(data) == {'id': 'abc', 'kind': 'hole_size', 'results': results}
+
+
+def test_ndjson():
+    data, results = encoded(formats.NDJSON, 'hole_size', HOLE_ROWS)
+    assert data.endswith(b'\n')
+    assert [json.loads(line) for line in data.splitlines()] == results
+
+
+def test_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    data, results = encoded(formats.MSGPACK, 'hole_size_limits', [
+        [["1", "ZZ", "+"], ["2", "ZZ", "+"], ["3", "ZZ", "+"]],
+        [["1", "ZZ", "+"], ["2", "ZZ", "?"], ["3", "ZZ", "+"]],
+        [["0.5", "X", "-"], ["0.6", "X", "-"], ["0.7", "X", "-"]]])
+    assert msgpack.unpackb(data) == {'id': 'abc', 'kind': 'hole_size_limits', 'results': results}
+
+
+def test_msgpack_not_installed(monkeypatch):
+    monkeypatch.setattr(formats, 'msgpack', None)
+    assert formats.MSGPACK not in formats.offered()
+
+
+def test_columns():
+    data, results = encoded(formats.COLUMNS, 'hole_size', HOLE_ROWS)
+    header, columns, errors = formats.read_columns(data)
+    assert header == {'id': 'abc', 'kind': 'hole_size', 'rows': 5,
+                      'float_columns': ['result'] + list(formats.CIRCLE_COLUMNS),
+                      'error_columns': ['error']}
+    assert all(len(column) == 5 for column in columns.values())
+    assert columns['result'].dtype == numpy.float64
+    assert columns['error'].dtype == numpy.int32
+    for i, result in enumerate(results):
+        if result['error'] is None:
+            assert columns['result'][i] == float(result['result'])
+            assert columns['circle2_y'][i] == result['circles'][1]['y']
+            assert columns['error'][i] == -1
+        else:
+            assert numpy.isnan(columns['result'][i])
+            assert numpy.isnan(columns['circle3_r'][i])
+            assert errors[columns['error'][i]] == result['error']
+    # the same error in different batches has one code
+    assert columns['error'][1] == columns['error'][4]
+    assert len(errors) == 1
+
+
+def test_columns_kinds():
+    data, results = encoded(formats.COLUMNS, 'hole_size_limits', [
+        [["1", "ZZ", "+"], ["2", "ZZ", "+"], ["3", "ZZ", "+"]],
+        [["100", "ZZ", "+"], ["2", "ZZ", "+"], ["3", "ZZ", "+"]]])
+    _, columns, errors = formats.read_columns(data)
+    assert columns['min_result'][0] == float(results[0][0]['result'])
+    assert columns['max_circle1_x'][0] == results[0][1]['circles'][0]['x']
+    assert errors[columns['max_error'][1]] == results[1][1]['error']
+
+    data, results = encoded(formats.COLUMNS, 'pin_size', [["1", "X", "+"], ["100", "X", "+"]])
+    _, columns, errors = formats.read_columns(data)
+    assert list(columns) == ['min', 'max', 'error']
+    assert columns['max'][0] == float(results[0]['result'][1])
+    assert numpy.isnan(columns['min'][1])
+    assert errors == [results[1]['error']]
+
+
+def test_columns_aligned():
+    data, _ = encoded(formats.COLUMNS, 'pin_size', [["1", "X", "+"]] * 3, chunk_size=1)
+    assert len(data) % 8 == 0
+    with pytest.raises(ValueError):
+        formats.read_columns(data[8:])
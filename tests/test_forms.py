@@ -0,0 +1,14 @@
+"""
+Tests for the form benchmark of tools/formbench.py
+"""
+
+from tools import formbench
+
+
+def test_formbench():
+    report = formbench.run(number=5)
+    assert set(report['cases']) == set(formbench.CASES)
+    for case in report['cases'].values():
+        assert 0 < case['form_us'] < case['request_us']
+    assert not report['cases']['three_pin_invalid']['valid']
+    assert report['cases']['three_pin']['valid']
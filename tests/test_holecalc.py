@@ -6,7 +6,12 @@ The tests here are designed to unit test the math equations used for hole/pin si
 
 
 from holecalc import holecalc
+from holecalc import geometry
+from holecalc import optimize
+from holecalc import roundness
+from holecalc import gaugeset
 from decimal import Decimal
+import numpy
 import pytest
 import random
 import sys
@@ -215,3 +220,247 @@ class TestReversePin:
         test_result = holecalc.calculate_remaining_pin(bore_dia="6", pin1="-3", pin2="1")
         assert test_result['result'] is None
         assert test_result['error'] == "Cannot calculate pin dimension, check pin/bore diameters"
+
+
+class TestCenterPositions:
+    """Unit tests for the functions that calculate pin positions for diagrams"""
+
+    def test_equal_pins(self):
+        circles = holecalc.calculate_center_positions(1.0, 1.0, 1.0)
+        expected = ((0.732, 0.634, 0.464), (0.268, 0.634, 0.464), (0.5, 0.232, 0.464))
+        for c, e in zip(circles, expected):
+            assert (round(c['x'], 3), round(c['y'], 3), round(c['r'], 3)) == e
+
+    def test_batch_matches_scalar(self):
+        rng = random.Random(0)
+        scales = [10 ** rng.randint(-3, 2) for _ in range(200)]
+        pins = [[rng.uniform(1, 2) * s for _ in range(3)] for s in scales]
+        radii = numpy.array(pins).T / 2
+        x, y, r = geometry.center_positions_batch(*radii)
+        assert x.shape == (200, 3) and x.flags['C_CONTIGUOUS']
+        for i, (p1, p2, p3) in enumerate(pins):
+            for j, c in enumerate(holecalc.calculate_center_positions(p1, p2, p3)):
+                assert c['x'] == pytest.approx(x[i, j], rel=1e-9, abs=1e-12)
+                assert c['y'] == pytest.approx(y[i, j], rel=1e-9, abs=1e-12)
+                assert c['r'] == pytest.approx(r[i, j], rel=1e-9, abs=1e-12)
+
+    def test_enclosing_circle(self):
+        outer = geometry.tangent_circles(0.5, 1.0, 1.5)[3]
+        assert outer.r == pytest.approx(3.0)
+        x, y, r = geometry.tangent_circles_batch([0.5], [1.0], [1.5])
+        assert (x[0, 3], y[0, 3], r[0, 3]) == pytest.approx((outer.x, outer.y, outer.r))
+
+    def test_batch_invalid(self):
+        # a pin too small to touch the other two, and a zero diameter pin
+        x, y, r = geometry.center_positions_batch([25, 0.5, 0], [0.5, 0.5, 1], [0.005, 0.08, 1])
+        assert numpy.isnan(x[0]).all() and numpy.isnan(x[1]).all() and numpy.isnan(x[2]).all()
+
+    def test_enclosing_diameter_batch(self):
+        rng = numpy.random.default_rng(0)
+        radii = rng.uniform(0.001, 2, (3, 1000))
+        _, _, r = geometry.tangent_circles_batch(*radii)
+        diameters = geometry.enclosing_diameter_batch(*radii)
+        assert numpy.array_equal(numpy.isnan(diameters), numpy.isnan(r[:, 3]))
+        assert numpy.allclose(diameters, r[:, 3] * 2, equal_nan=True)
+        # radii broadcast to a grid
+        grid = geometry.enclosing_diameter_batch(radii[0, :5, None], radii[1, None, :7], 0.5)
+        assert grid.shape == (5, 7)
+        assert numpy.array_equal(grid[2, 3], geometry.enclosing_diameter_batch(
+            radii[0, 2], radii[1, 3], 0.5), equal_nan=True)
+
+
+class TestToleranceOptimizer:
+    """Unit test the tolerance class optimizer against the Decimal hole size calculation"""
+    def test_combinations_meet_tolerance(self):
+        pins = ("0.5", "0.6", "0.7")
+        nominal = holecalc.calculate_hole_size(*pins)['result']
+        plus, minus = Decimal("0.0001"), Decimal("0.00005")
+        result = optimize.optimize_tolerance_classes(*pins, str(plus), str(minus), limit=20)
+        assert result['error'] is None
+        assert result['nominal'] == nominal
+        assert len(result['result']) == 20
+        for combination in result['result']:
+            limits = [holecalc.pin_tolerance_limits(p, c, is_plus)
+                      for p, c, is_plus in zip(pins, combination['classes'], combination['plus'])]
+            # every corner of the pin diameter ranges must be inside the reported bore range
+            for corner in range(8):
+                diameters = [limits[i][(corner >> i) & 1] for i in range(3)]
+                bore = holecalc.calculate_hole_size(*diameters)['result']
+                assert combination['min'] - Decimal("1e-9") <= bore
+                assert bore <= combination['max'] + Decimal("1e-9")
+            assert combination['min'] >= nominal - minus - Decimal("1e-9")
+            assert combination['max'] <= nominal + plus + Decimal("1e-9")
+
+    def test_cheapest_first(self):
+        result = optimize.optimize_tolerance_classes("0.5", "0.6", "0.7", "0.0003", limit=1000)
+        costs = [c['cost'] for c in result['result']]
+        assert costs == sorted(costs)
+        assert result['result'][0]['classes'] == ('ZZ', 'ZZ', 'ZZ')
+
+    def test_cost_weights(self):
+        # when XX pins cost less than ZZ pins, the cheapest combinations use them
+        costs = dict(optimize.DEFAULT_CLASS_COSTS, XX=0.5)
+        result = optimize.optimize_tolerance_classes("0.5", "0.6", "0.7", "0.0003", costs=costs)
+        assert result['result'][0]['classes'] == ('XX', 'XX', 'XX')
+        assert result['result'][0]['cost'] == 1.5
+
+    def test_unreachable_tolerance(self):
+        assert optimize.optimize_tolerance_classes("0.5", "0.6", "0.7", "0.000001") == \
+            {'result': None, 'nominal': None,
+             'error': 'No combination of tolerance classes meets the tolerance'}
+
+    def test_invalid_inputs(self):
+        assert optimize.optimize_tolerance_classes("0.5", "abc", "0.7", "0.001")['error'] == \
+            'Cannot optimize, check inputs'
+        assert optimize.optimize_tolerance_classes("0.5", "0.6", "30", "0.001")['error'] == \
+            'Diameter not within tolerance class limits'
+        assert optimize.optimize_tolerance_classes(
+            "0.5", "0.6", "0.7", "0.001", costs={'Q': 1})['error'] == \
+            'Invalid tolerance class in costs: Q'
+
+
+class TestRoundness:
+    """Unit test the roundness evaluation against the Decimal hole size calculation and shapes
+    of known roundness"""
+    def test_reading_bores(self):
+        readings = [("0.5", "0.6", "0.7", "0"), ("1", "2", "2.5", "45"), ("1", "1", "1", "200")]
+        result = roundness.evaluate_roundness(readings)
+        assert result['error'] is None
+        for reading, bore in zip(readings, result['result']['bores']):
+            expected = holecalc.calculate_hole_size(*reading[:3])['result']
+            assert abs(bore - expected) < Decimal("1e-9")
+
+    def test_round_bore(self):
+        # the same pins at any angle touch the same circle
+        readings = [("10", "20", "25", str(angle)) for angle in range(0, 360, 15)]
+        result = roundness.evaluate_roundness(readings)['result']
+        bore = result['bores'][0]
+        for fit in ('least_squares', 'min_zone', 'max_inscribed'):
+            assert abs(result[fit]['diameter'] - bore) < Decimal("1e-8")
+            assert abs(result[fit]['x']) < Decimal("1e-8")
+            assert abs(result[fit]['y']) < Decimal("1e-8")
+            assert result[fit]['roundness'] < Decimal("1e-8")
+
+    def test_fits(self):
+        # a profile with two and three lobes, offset from the origin
+        angles = numpy.linspace(0, 2 * numpy.pi, 720, endpoint=False)
+        radii = 50 + 0.01 * numpy.cos(2 * angles) + 0.005 * numpy.cos(3 * angles + 1)
+        x = radii * numpy.cos(angles) + 0.3
+        y = radii * numpy.sin(angles) - 0.2
+        fits = roundness.fit_circles(x, y)
+        lsq = fits['least_squares']
+        assert float(lsq['x']) == pytest.approx(0.3, abs=1e-6)
+        assert float(lsq['y']) == pytest.approx(-0.2, abs=1e-6)
+        assert float(lsq['diameter']) == pytest.approx(100, abs=1e-6)
+        # no other center has a narrower zone, or a larger inscribed circle
+        offsets = numpy.linspace(-0.005, 0.005, 41)
+        for name, value in (('min_zone', lambda d: d.max() - d.min()),
+                            ('max_inscribed', lambda d: -d.min())):
+            cx, cy = float(fits[name]['x']), float(fits[name]['y'])
+            best = value(numpy.hypot(x - cx, y - cy))
+            for dx in offsets:
+                for dy in offsets:
+                    assert value(numpy.hypot(x - cx - dx, y - cy - dy)) >= best - 1e-12
+        assert fits['min_zone']['roundness'] < lsq['roundness']
+        assert fits['max_inscribed']['diameter'] < fits['min_zone']['diameter'] < \
+            Decimal(radii.max() * 2)
+
+    def test_oval_bore(self):
+        # pin 3 has to be larger across the long axis of an oval bore
+        readings = [("1", "1", str(1 + 0.001 * abs(numpy.cos(numpy.radians(angle)))), str(angle))
+                    for angle in range(0, 360, 10)]
+        result = roundness.evaluate_roundness(readings)['result']
+        assert result['min_zone']['roundness'] > Decimal("0.0001")
+        assert result['min_zone']['roundness'] <= result['least_squares']['roundness']
+        assert min(result['bores']) <= result['max_inscribed']['diameter'] <= max(result['bores'])
+
+    def test_invalid_inputs(self):
+        assert roundness.evaluate_roundness([])['error'] == "Enter from 1 to 1000 readings"
+        assert roundness.evaluate_roundness([("1", "2", "3", "0")] * 1001)['error'] == \
+            "Enter from 1 to 1000 readings"
+        assert roundness.evaluate_roundness([("1", "abc", "3", "0")])['error'] == \
+            "Readings must be four numbers each"
+        assert roundness.evaluate_roundness([("1", "2", "3")])['error'] == \
+            "Readings must be four numbers each"
+        assert roundness.evaluate_roundness([("1", "0", "3", "0")])['error'] == \
+            "Pin diameters must be positive"
+        result = roundness.evaluate_roundness([("1", "2", "3", "0"), ("1", "1", "0.01", "90")])
+        assert result['error'] == "Reading 2 does not describe a bore, check pin values"
+
+
+class TestGaugeSet:
+    """Unit test the gauge set limits against pin_size_wrapper(), one pin at a time"""
+    @pytest.mark.parametrize("units,sizes", [
+        ("in", gaugeset.size_range("0", "22", "0.0125") + ["0.0011", "0.8250001", "1.51"]),
+        ("mm", gaugeset.size_range("0", "540", "0.25") + ["0.255", "20.9600001", "533.65"]),
+    ])
+    def test_matches_pin_size_wrapper(self, units, sizes):
+        signs = ["+", "-"]
+        result = gaugeset.gauge_set_limits(sizes, list(holecalc.TOL_CLASSES), signs, units)
+        assert result['error'] is None
+        rows = list(gaugeset.format_rows(result['result']))
+        assert len(rows) == len(sizes) * len(holecalc.TOL_CLASSES) * len(signs)
+        precision = Decimal(gaugeset.PRECISION[units])
+        expected = []
+        for size in sizes:
+            for tol_class in holecalc.TOL_CLASSES:
+                for sign in signs:
+                    limits = holecalc.pin_size_wrapper(size, tol_class, sign == "+", units)
+                    if limits['result'] is None:
+                        expected.append((str(Decimal(size)), tol_class, sign, '', '',
+                                         limits['error']))
+                    else:
+                        expected.append((str(Decimal(size)), tol_class, sign,
+                                         str(limits['result'][0].quantize(precision)),
+                                         str(limits['result'][1].quantize(precision)), ''))
+        assert rows == expected
+
+    def test_precision(self):
+        result = gaugeset.gauge_set_limits(["0.25"], ["X"], ["+", "-"])['result']
+        assert list(gaugeset.format_rows(result, "0.0001")) == [
+            ("0.25", "X", "+", "0.2500", "0.2500", ""), ("0.25", "X", "-", "0.2500", "0.2500", "")]
+        result = gaugeset.gauge_set_limits(["0.12345678"], ["ZZ"], ["+"])['result']
+        assert list(gaugeset.format_rows(result)) == [
+            ("0.12345678", "ZZ", "+", "0.123457", "0.123657", "")]
+
+    def test_tolerance_table(self):
+        # limits looked up in the exported tables match pin_size_wrapper()
+        table = gaugeset.tolerance_table()
+        for units, sizes in (("in", ("0.0011", "0.825", "0.8251", "21.01")),
+                             ("mm", ("0.255", "20.96", "300", "533.65"))):
+            units_table = table['units'][units]
+            for size in sizes:
+                assert Decimal(size) > Decimal(units_table['lower'])
+                tolerances = next(t for bound, t in units_table['ranges']
+                                  if Decimal(size) <= Decimal(bound))
+                for tol_class in table['classes']:
+                    limits = holecalc.pin_size_wrapper(size, tol_class, True, units)['result']
+                    assert limits[1] - limits[0] == Decimal(tolerances[tol_class])
+
+    def test_size_range(self):
+        assert gaugeset.size_range("0.25", "0.26", "0.005") == ["0.250", "0.255", "0.260"]
+        assert gaugeset.size_range("1", "1.09", "0.05") == ["1.00", "1.05"]
+        with pytest.raises(ValueError):
+            gaugeset.size_range("1", "0", "0.1")
+        with pytest.raises(ValueError):
+            gaugeset.size_range("0", "1", "0")
+        with pytest.raises(ValueError):
+            gaugeset.size_range("0", "1", "abc")
+        with pytest.raises(ValueError):
+            gaugeset.size_range("0", "10", "0.0001")
+
+    def test_invalid_inputs(self):
+        assert gaugeset.gauge_set_limits(["1"], ["Q"], ["+"])['error'] == \
+            "Invalid tolerance class specified: Q"
+        assert gaugeset.gauge_set_limits(["1"], ["X"], ["*"])['error'] == \
+            "Invalid tolerance sign specified: *"
+        assert gaugeset.gauge_set_limits(["1"], ["X"], ["+"], "ft")['error'] == \
+            "Invalid units specified: ft"
+        assert gaugeset.gauge_set_limits(["1"], [], ["+"])['error'] == \
+            "Select at least one tolerance class and sign"
+        assert gaugeset.gauge_set_limits([], ["X"], ["+"])['error'] == \
+            "Enter from 1 to 10000 sizes"
+        assert gaugeset.gauge_set_limits(["1", "abc"], ["X"], ["+"])['error'] == \
+            "Sizes must be numbers"
+        assert gaugeset.gauge_set_limits(["0.0000000001"], ["X"], ["+"])['error'] == \
+            "Sizes can have at most 9 decimal places"
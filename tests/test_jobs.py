@@ -0,0 +1,215 @@
+"""
+Tests for the background job queue in jobs.py
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import multiprocessing
+import os
+import auditlog
+import jobs
+from holecalc import holecalc
+import pytest
+
+
+@pytest.fixture
+def store(tmp_path):
+    # small chunks, so jobs are split into many of them
+    return jobs.JobStore(str(tmp_path / "jobs.sqlite"), chunk_size=3)
+
+
+def results(store, job_id):
+    return [r for chunk in store.result_chunks(job_id) for r in json.loads(chunk)]
+
+
+def die_on_fourth_row(kind, units, rows):
+    """calculate_chunk of a worker process killed by the chunk starting at the fourth row"""
+    if rows[0] == ["1", "2", "3.3"]:
+        os._exit(1)
+    return calculate_chunk(kind, units, rows)
+
+
+calculate_chunk = jobs.calculate_chunk
+
+
+def test_run_job(store):
+    rows = [["1", "2", str(3 + i / 10)] for i in range(10)] + [["1", "1", "0.01"]]
+    job_id = store.submit('hole_size', rows)
+    assert store.status(job_id)['status'] == jobs.QUEUED
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert jobs.run_pending(store, executor, max_pending=2) == 1
+    status = store.status(job_id)
+    assert status['status'] == jobs.DONE
+    assert status['completed'] == status['total'] == 11
+    assert status['progress'] == 1
+    assert results(store, job_id) == [jobs.to_json(holecalc.calculate_hole_size(*row))
+                                      for row in rows]
+    assert results(store, job_id)[-1]['error'] is not None
+
+
+def test_job_kinds(store):
+    job_id = store.submit('hole_size_limits', [[["1", "ZZ", "+"], ["2", "ZZ", "+"],
+                                                ["3", "ZZ", "+"]],
+                                               [["1", "ZZ", "+"], ["2", "ZZ", "?"],
+                                                ["3", "ZZ", "+"]]], units='in')
+    pin_job_id = store.submit('pin_size', [["1", "X", "-"], ["25", "XX", "+"]], units='mm')
+    reverse_job_id = store.submit('remaining_pin', [["6", "1", "2"]])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert jobs.run_pending(store, executor, max_pending=1) == 3
+    limits = results(store, job_id)
+    assert limits[0] == jobs.to_json(holecalc.calculate_hole_size_limits(
+        ("1", "ZZ", True), ("2", "ZZ", True), ("3", "ZZ", True), units='in'))
+    assert limits[1] == [{'result': None, 'error': "Invalid sign: ?"}] * 2
+    assert results(store, pin_job_id) == [
+        jobs.to_json(holecalc.pin_size_wrapper("1", "X", False, 'mm')),
+        jobs.to_json(holecalc.pin_size_wrapper("25", "XX", True, 'mm'))]
+    assert results(store, reverse_job_id) == [
+        jobs.to_json(holecalc.calculate_remaining_pin("6", "1", "2"))]
+
+
+@pytest.mark.parametrize("kind,rows,units", [
+    ('nonsense', [["1", "2", "3"]], 'in'),
+    ('hole_size', [], 'in'),
+    ('hole_size', [["1", "2"]], 'in'),
+    ('hole_size', [["1", "2", "3"]], 'ft'),
+    ('hole_size_limits', [["1", "2", "3"]], 'in'),
+    ('hole_size', "1, 2, 3", 'in'),
+])
+def test_invalid_jobs(store, kind, rows, units):
+    with pytest.raises(jobs.JobError):
+        store.submit(kind, rows, units)
+
+
+def test_invalid_rows(store):
+    job_id = store.submit('hole_size_limits', [[["abc", "ZZ", "+"], ["2", "ZZ", "+"],
+                                                ["3", "ZZ", "+"]]])
+    pin_job_id = store.submit('pin_size', [["1", "ZZ", "+"], ["1", "ZZ", "x"], ["x", "ZZ", "+"]])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        jobs.run_pending(store, executor, max_pending=1)
+    assert store.status(job_id)['status'] == jobs.DONE
+    assert results(store, job_id) == [[{'result': None, 'error': "Invalid number"}] * 2]
+    pin_results = results(store, pin_job_id)
+    assert pin_results[0]['error'] is None
+    assert pin_results[1:] == [{'result': None, 'error': "Invalid sign: x"},
+                               {'result': None, 'error': "Invalid number"}]
+
+
+def test_audit_records(store, tmp_path):
+    store.submit('hole_size_limits', [[["1", "ZZ", "+"], ["2", "X", "-"], ["3", "ZZ", "+"]]])
+    store.submit('pin_size', [["1", "X", "-"], ["x", "ZZ", "+"]], units='mm')
+    store.submit('remaining_pin', [["6", "1", "2"]])
+    path = str(tmp_path / "audit.log")
+    audit = auditlog.LogWriter(path)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        jobs.run_pending(store, executor, max_pending=1, audit=audit)
+    audit.close()
+    records = auditlog.read_log(path)
+    assert [auditlog.KINDS[k - 1] for k in records['kind']] == [
+        'hole_size_limits', 'pin_size', 'pin_size', 'remaining_pin']
+    assert records['inputs'][0, :3].tolist() == [1, 2, 3]
+    assert records['classes'][0].tolist() == [5, 2, 5]
+    assert records['signs'][0].tolist() == [1, -1, 1]
+    limits = holecalc.calculate_hole_size_limits(("1", "ZZ", True), ("2", "X", False),
+                                                 ("3", "ZZ", True), units='in')
+    assert records['result'][0].tolist() == [float(r['result']) for r in limits]
+    assert auditlog.UNITS[records['units'][1] - 1] == 'mm'
+    assert records['error'][2] == b"Invalid number"
+    assert records['inputs'][3, :3].tolist() == [1, 2, 6]
+    assert records['result'][3, 0] == pytest.approx(3.0, abs=1e-3)
+
+
+def test_max_rows(store):
+    with pytest.raises(jobs.JobError):
+        store.submit('hole_size', [["1", "2", "3"]] * 4, max_rows=3)
+
+
+def test_resume(store, monkeypatch):
+    rows = [["1", "2", str(3 + i / 10)] for i in range(10)]
+    job_id = store.submit('hole_size', rows)
+    calculated = []
+    calculate_chunk = jobs.calculate_chunk
+
+    def recording(kind, units, rows):
+        if len(calculated) == interrupt_after:
+            raise KeyboardInterrupt
+        calculated.append(rows)
+        return calculate_chunk(kind, units, rows)
+    monkeypatch.setattr(jobs, 'calculate_chunk', recording)
+    interrupt_after = 2
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(KeyboardInterrupt):
+            jobs.run_pending(store, executor, max_pending=1)
+    status = store.status(job_id)
+    assert status['status'] == jobs.RUNNING
+    assert status['completed'] == 6
+    assert status['progress'] == 0.6
+
+    # the restarted runner only calculates the chunks that were not finished
+    calculated.clear()
+    interrupt_after = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert jobs.run_pending(store, executor, max_pending=1) == 1
+    assert calculated == [rows[6:9], rows[9:]]
+    assert store.status(job_id)['status'] == jobs.DONE
+    assert results(store, job_id) == [jobs.to_json(holecalc.calculate_hole_size(*row))
+                                      for row in rows]
+
+
+def test_broken_pool(store, monkeypatch):
+    rows = [["1", "2", str(3 + i / 10)] for i in range(10)]
+    job_id = store.submit('hole_size', rows)
+    monkeypatch.setattr(jobs, 'calculate_chunk', die_on_fourth_row)
+    # forked, so the worker processes see the patched calculate_chunk
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork'))
+    with pytest.raises(jobs.PoolBroken) as broken:
+        jobs.run_pending(store, executor, max_pending=1)
+    assert broken.value.job_id == job_id
+    assert store.status(job_id)['status'] == jobs.RUNNING
+    assert store.status(job_id)['completed'] == 3
+
+    # the job is resumed on the new pool
+    monkeypatch.undo()
+    breaks = {}
+    executor = jobs.replace_pool(store, executor, 1, broken.value, breaks)
+    assert breaks == {job_id: 1}
+    with executor:
+        assert jobs.run_pending(store, executor, max_pending=1) == 1
+    assert store.status(job_id)['status'] == jobs.DONE
+    assert results(store, job_id) == [jobs.to_json(holecalc.calculate_hole_size(*row))
+                                      for row in rows]
+
+
+def test_broken_pool_fails_job(store):
+    job_id = store.submit('hole_size', [["1", "2", "3"]])
+    breaks = {job_id: jobs.MAX_POOL_BREAKS - 1}
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        executor = jobs.replace_pool(store, executor, 1, jobs.PoolBroken(job_id), breaks)
+    executor.shutdown()
+    assert breaks == {}
+    status = store.status(job_id)
+    assert status['status'] == jobs.FAILED
+    assert status['error'] == f"A worker process died while running job {job_id}"
+
+
+def test_failed_job(store, monkeypatch):
+    job_id = store.submit('hole_size', [["1", "2", "3"]])
+
+    def fail(kind, units, rows):
+        raise MemoryError("out of memory")
+    monkeypatch.setattr(jobs, 'calculate_chunk', fail)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        jobs.run_pending(store, executor, max_pending=1)
+    status = store.status(job_id)
+    assert status['status'] == jobs.FAILED
+    assert status['error'] == "out of memory"
+
+
+def test_delete_expired(store):
+    finished = store.submit('hole_size', [["1", "2", "3"]])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        jobs.run_pending(store, executor, max_pending=1)
+    queued = store.submit('hole_size', [["1", "2", "3"]])
+    store.delete_expired(retention=-1)
+    assert store.status(finished) is None
+    assert list(store.result_chunks(finished)) == []
+    assert store.status(queued)['status'] == jobs.QUEUED
@@ -0,0 +1,21 @@
+"""
+Tests for the load test harness in tools/loadtest.py
+"""
+
+from tools import loadtest
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile(values, 100) == 100
+    assert loadtest.percentile([], 50) is None
+
+
+def test_wsgi_run():
+    report = loadtest.run(loadtest.WSGITarget(), requests=40, concurrency=2, duration=60)
+    assert report['requests'] == 40
+    assert report['errors'] == 0
+    assert sum(s['requests'] for s in report['scenarios'].values()) == 40
+    assert report['latency_ms']['p50'] <= report['latency_ms']['p99']
@@ -0,0 +1,109 @@
+"""
+Tests for calculating on the process pool of parallel.py
+"""
+
+from main import app as hc_app
+from main import load_config
+import main
+import os
+import numpy as np
+import parallel
+import pytest
+import signal
+from tools import parallelbench
+
+
+def double_rows(values, offset, doubled):
+    doubled[:] = values[:, None] * 2 + offset[None, :]
+
+
+def fail(values, doubled):
+    raise ValueError("kernel failed")
+
+
+def die(values, doubled):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    app = hc_app
+    load_config("testing")
+    monkeypatch.setitem(app.config, 'PARALLEL_ENABLED', True)
+    monkeypatch.setitem(app.config, 'PARALLEL_PROCESSES', 2)
+    monkeypatch.setitem(app.config, 'PARALLEL_THRESHOLD', 100)
+    monkeypatch.setitem(app.config, 'PARALLEL_CHUNK', 64)
+    monkeypatch.setitem(app.config, 'PARALLEL_DIR', str(tmp_path))
+    pool = main.parallel_pool
+    pool.close()
+    yield pool
+    pool.close()
+
+
+def test_run(pool, tmp_path):
+    values = np.arange(1000, dtype=np.int64)
+    offset = np.array([0.0, 0.5, 0.25])
+    doubled, = pool.run(double_rows, split=(values,), shared=(offset,),
+                        outputs=(((1000, 3), 'float64'),))
+    assert pool._pool is not None
+    assert doubled.shape == (1000, 3)
+    assert np.array_equal(doubled, values[:, None] * 2 + offset)
+    # the file of the calculation is removed once it is done
+    assert os.listdir(tmp_path) == []
+
+
+def test_run_in_process(pool):
+    """calculations below the threshold are not sent to the pool"""
+    values = np.arange(10, dtype=np.int64)
+    doubled, = pool.run(double_rows, split=(values,), shared=(np.zeros(1),),
+                        outputs=(((10, 1), 'float64'),))
+    assert pool._pool is None
+    assert doubled[:, 0].tolist() == list(range(0, 20, 2))
+
+
+def test_run_error(pool, tmp_path):
+    with pytest.raises(ValueError, match="kernel failed"):
+        pool.run(fail, split=(np.arange(1000),), outputs=(((1000,), 'float64'),))
+    assert os.listdir(tmp_path) == []
+
+
+def test_run_process_died(pool, tmp_path):
+    """a pool process killed mid-calculation fails the calculation instead of hanging it"""
+    with pytest.raises(parallel.BrokenProcessPool):
+        pool.run(die, split=(np.arange(1000),), outputs=(((1000,), 'float64'),))
+    assert pool._pool is None
+    assert os.listdir(tmp_path) == []
+    # the next calculation starts a new pool
+    values = np.arange(1000, dtype=np.int64)
+    doubled, = pool.run(double_rows, split=(values,), shared=(np.zeros(1),),
+                        outputs=(((1000, 1), 'float64'),))
+    assert doubled[:, 0].tolist() == list(range(0, 2000, 2))
+
+
+def test_processes(pool, monkeypatch):
+    monkeypatch.setattr(parallel, 'cpu_count', lambda: 16)
+    monkeypatch.setitem(hc_app.config, 'PARALLEL_PROCESSES', None)
+    monkeypatch.setitem(hc_app.config, 'PARALLEL_WORKERS', 4)
+    # the CPUs are shared between the pools of the workers
+    assert pool.processes() == 4
+    monkeypatch.setitem(hc_app.config, 'PARALLEL_WORKERS', 32)
+    assert pool.processes() == 1
+    monkeypatch.setitem(hc_app.config, 'PARALLEL_PROCESSES', 3)
+    assert pool.processes() == 3
+    monkeypatch.setitem(hc_app.config, 'PARALLEL_ENABLED', False)
+    assert pool.processes() == 1
+
+
+def test_layout():
+    layout, size = parallel._layout([((3,), 'float64'), ((2, 5), 'int32'), ((1,), 'uint8')])
+    assert [offset for offset, _, _ in layout] == [0, 64, 128]
+    assert size == 192
+
+
+def test_parallelbench(tmp_path, monkeypatch):
+    for key in ('PARALLEL_ENABLED', 'PARALLEL_PROCESSES', 'PARALLEL_THRESHOLD'):
+        monkeypatch.setitem(hc_app.config, key, None)
+    monkeypatch.setitem(hc_app.config, 'PARALLEL_DIR', str(tmp_path))
+    report = parallelbench.run(cells=20000, processes=[1, 2], repeat=1)
+    assert [r['processes'] for r in report['runs']] == [1, 2]
+    assert all(r['matches'] for r in report['runs'])
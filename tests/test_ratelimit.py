@@ -0,0 +1,50 @@
+"""
+Tests for the ratelimit.py module
+
+The tests here check that admission control state is shared between processes
+"""
+
+import multiprocessing
+import os
+import ratelimit
+
+
+def test_token_bucket(tmp_path):
+    state = ratelimit.SharedState(str(tmp_path / 'state'))
+    assert state.take_token("client", 3, 0.001) == 0
+    assert state.take_token("client", 3, 0.001) == 0
+    assert state.take_token("client", 3, 0.001) == 0
+    assert state.take_token("client", 3, 0.001) > 1
+    assert state.take_token("other client", 3, 0.001) == 0
+
+
+def test_bucket_eviction(tmp_path):
+    state = ratelimit.SharedState(str(tmp_path / 'state'), bucket_slots=4)
+    for i in range(20):
+        assert state.take_token(f"client {i}", 1, 0.001) == 0
+    assert state.take_token("client 19", 1, 0.001) > 0
+
+
+def _take_tokens(path, count):
+    state = ratelimit.SharedState(path)
+    for _ in range(count):
+        state.take_token("client", 5, 0.001)
+    state.acquire(10)
+    state.acquire(10)
+    os._exit(0)
+
+
+def test_state_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'state')
+    state = ratelimit.SharedState(path)
+    state.acquire(10)
+    process = multiprocessing.get_context('fork').Process(target=_take_tokens, args=(path, 5))
+    process.start()
+    process.join()
+    assert state.take_token("client", 5, 0.001) > 0
+    assert state.in_progress() == 3
+    ratelimit.release_worker(process.pid, path)
+    assert state.in_progress() == 1
+    state.release()
+    assert state.in_progress() == 0
+    assert not state.acquire(0)
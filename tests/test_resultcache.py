@@ -0,0 +1,72 @@
+"""
+Tests for the resultcache.py module
+
+The tests here check that cached results match the holecalc functions and are shared between
+processes
+"""
+
+import multiprocessing
+import os
+from decimal import Decimal
+from holecalc import holecalc
+import resultcache
+
+
+def test_round_trip(tmp_path):
+    table = resultcache.SharedResultTable(str(tmp_path / 'cache'))
+    key = resultcache.make_key('hole', ("1", "2", "3"))
+    result = holecalc.calculate_hole_size("1", "2", "3")
+    assert table.get(key) is None
+    table.put(key, (result,))
+    assert table.get(key) == (result,)
+
+
+def test_round_trip_errors(tmp_path):
+    table = resultcache.SharedResultTable(str(tmp_path / 'cache'))
+    key = resultcache.make_key('limits', ("30", "1", "1"), ("in", "X", True, "X", True, "X", True))
+    results = holecalc.calculate_hole_size_limits(("30", "X", True), ("1", "X", True),
+                                                  ("1", "X", True), "in")
+    table.put(key, results)
+    assert table.get(key) == results
+
+
+def test_normalized_key():
+    assert resultcache.make_key('hole', ("1", "2.0", Decimal("3.000"))) == \
+           resultcache.make_key('hole', (Decimal("1.00"), "2", "3"))
+    assert resultcache.make_key('hole', ("1", "2", "3")) != \
+           resultcache.make_key('hole', ("1", "3", "2"))
+
+
+def test_eviction(tmp_path):
+    table = resultcache.SharedResultTable(str(tmp_path / 'cache'), slots=4)
+    result = holecalc.calculate_hole_size("1", "2", "3")
+    for i in range(1, 20):
+        table.put(resultcache.make_key('hole', (i, "2", "3")), (result,))
+    assert table.get(resultcache.make_key('hole', (19, "2", "3"))) == (result,)
+    assert table.get(resultcache.make_key('hole', (1, "2", "3"))) is None
+
+
+def test_record_being_written_is_a_miss(tmp_path):
+    table = resultcache.SharedResultTable(str(tmp_path / 'cache'), slots=1)
+    key = resultcache.make_key('hole', ("1", "2", "3"))
+    table.put(key, (holecalc.calculate_hole_size("1", "2", "3"),))
+    resultcache.SEQ.pack_into(table._map, resultcache.HEADER.size, 3)
+    assert table.get(key) is None
+
+
+def _put_result(path):
+    table = resultcache.SharedResultTable(path)
+    table.put(resultcache.make_key('hole', ("5", "2", "8")),
+              (holecalc.calculate_hole_size("5", "2", "8"),))
+    os._exit(0)
+
+
+def test_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'cache')
+    table = resultcache.SharedResultTable(path)
+    table.get(resultcache.make_key('hole', ("5", "2", "8")))
+    process = multiprocessing.get_context('fork').Process(target=_put_result, args=(path,))
+    process.start()
+    process.join()
+    cached = table.get(resultcache.make_key('hole', ("5.000", "2", "8")))
+    assert str(cached[0]['result'].quantize(Decimal("0.001"))) == "24.375"
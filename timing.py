@@ -0,0 +1,75 @@
+"""Module containing per-request timing of the stages of a request, reported to browsers in a
+Server-Timing response header and optionally logged as one JSON line per request.
+
+Routes mark their stages with the stage() context manager, and render templates with this
+module's render_template(), which is timed as the "render" stage. Durations of a stage entered
+more than once in a request are added together. The "total" duration covers the request from
+the first before_request hook to the response being ready.
+
+Configuration keys read from the flask app config:
+- SERVER_TIMING_ENABLED: collect stage timings and add the Server-Timing header
+- SERVER_TIMING_LOG: also log the timings of every request
+"""
+
+from contextlib import contextmanager
+import json
+import logging
+import time
+import flask
+from flask import current_app, g, request
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as the named stage of the current request"""
+    timings = g.get('server_timing')
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def render_template(template_name_or_list, **context) -> str:
+    """flask.render_template(), timed as the render stage"""
+    with stage('render'):
+        return flask.render_template(template_name_or_list, **context)
+
+
+class ServerTiming:
+    """Flask extension collecting stage timings for every request.
+
+    Should be initialized before other extensions, so the total includes their request hooks."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def _before_request():
+        if current_app.config.get('SERVER_TIMING_ENABLED', True):
+            g.server_timing = {}
+            g.server_timing_start = time.perf_counter()
+
+    @staticmethod
+    def _after_request(response):
+        timings = g.pop('server_timing', None)
+        if timings is None:
+            return response
+        timings['total'] = time.perf_counter() - g.pop('server_timing_start')
+        response.headers['Server-Timing'] = ', '.join(
+            f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items())
+        if current_app.config.get('SERVER_TIMING_LOG', False):
+            logging.info("Server timing " + json.dumps({
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'status': response.status_code,
+                'ms': {name: round(seconds * 1000, 3) for name, seconds in timings.items()}}))
+        return response
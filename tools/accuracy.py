@@ -0,0 +1,276 @@
+"""Accuracy and speed comparison of the bore diameter calculation backends against a reference
+corpus of pin triples whose bores are computed with 50 digit Decimal arithmetic.
+
+The corpus mixes typical pin sizes with edge cases: near-degenerate triples whose enclosing
+circle is almost a straight line, collinear triples, tiny pins, very unequal pins, equal pins and
+large metric pins. For every backend the harness reports throughput, the largest error in units
+of each display precision step, how many results differ from the reference after rounding to
+that step as the app does, and how many triples the backend wrongly reports as valid or invalid.
+
+Example usage:
+    python tools/accuracy.py generate corpus.npz --size 3000000
+    python tools/accuracy.py run corpus.npz --backends numpy,float --limit 500000
+"""
+
+import argparse
+from decimal import Decimal, localcontext, ROUND_HALF_UP
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from holecalc import holecalc as hc  # noqa: E402
+from holecalc import geometry  # noqa: E402
+
+# display precisions of the calculators
+STEPS = ('0.1', '0.01', '0.001', '0.0001', '0.00001', '0.000001')
+REFERENCE_PRECISION = 50
+CHUNK_SIZE = 20000
+
+
+def _pin(rng, low: float, high: float, decimals: int = 4) -> str:
+    return f"{rng.uniform(low, high):.{decimals}f}"
+
+
+def _typical(rng):
+    return [_pin(rng, 0.01, 2.0) for _ in range(3)]
+
+
+def _near_degenerate(rng):
+    # the third pin only just touches both others inside a bore, which is almost infinitely large
+    a, b = rng.uniform(0.1, 2.0), rng.uniform(0.1, 2.0)
+    critical = 1 / (1 / math.sqrt(a) + 1 / math.sqrt(b)) ** 2
+    c = critical * (1 + 10 ** rng.uniform(-7, -2))
+    return [f"{a:.6f}", f"{b:.6f}", f"{c:.6f}"]
+
+
+def _collinear(rng):
+    # the largest pin spans the other two, all three centers lie on a bore diameter
+    a, b = _pin(rng, 0.01, 2.0), _pin(rng, 0.01, 2.0)
+    return [a, b, str(Decimal(a) + Decimal(b))]
+
+
+def _tiny(rng):
+    return [_pin(rng, 0.001, 0.01, 6) for _ in range(3)]
+
+
+def _unequal(rng):
+    large = _pin(rng, 5.0, 20.0)
+    return [large, _pin(rng, 0.01, 0.1), _pin(rng, 0.01, 0.1)]
+
+
+def _equal(rng):
+    pin = _pin(rng, 0.01, 20.0)
+    return [pin, pin, pin]
+
+
+def _metric(rng):
+    return [_pin(rng, 100.0, 533.0, 3) for _ in range(3)]
+
+
+# category name: (share of the corpus, generator of one triple of pin diameter strings)
+CATEGORIES = {
+    'typical': (0.5, _typical),
+    'near_degenerate': (0.1, _near_degenerate),
+    'collinear': (0.05, _collinear),
+    'tiny': (0.1, _tiny),
+    'unequal': (0.1, _unequal),
+    'equal': (0.05, _equal),
+    'metric': (0.1, _metric),
+}
+
+
+def reference_bore(pins: list):
+    """Bore diameter of a triple in high precision Decimal arithmetic, or None if the pins do
+    not describe a bore. Uses the same validity rule as holecalc.calculate_hole_size()."""
+    with localcontext() as ctx:
+        ctx.prec = REFERENCE_PRECISION
+        k1, k2, k3 = (2 / Decimal(p) for p in pins)
+        denominator = k1 + k2 + k3 - 2 * (k1 * k2 + k2 * k3 + k1 * k3).sqrt()
+        if denominator >= 0:
+            return None
+        return -2 / denominator
+
+
+def _generate_chunk(args) -> tuple:
+    seed, index, size = args
+    rng = np.random.default_rng([seed, index])
+    names = list(CATEGORIES)
+    shares = np.array([CATEGORIES[n][0] for n in names])
+    categories = rng.choice(len(names), size=size, p=shares / shares.sum())
+    pins = np.empty((size, 3), dtype='S16')
+    reference = np.full(size, np.nan)
+    quantized = np.zeros((size, len(STEPS)), dtype=np.int64)
+    for i, category in enumerate(categories):
+        triple = CATEGORIES[names[category]][1](rng)
+        pins[i] = triple
+        bore = reference_bore(triple)
+        if bore is not None:
+            reference[i] = float(bore)
+            quantized[i] = [int((bore / Decimal(s)).to_integral_value(ROUND_HALF_UP))
+                            for s in STEPS]
+    return categories.astype(np.uint8), pins, reference, quantized
+
+
+def generate(path: str, size: int, seed: int = 0, workers: int = None):
+    """Generate a reference corpus of size triples and save it to path as .npz"""
+    chunks = [(seed, i, min(CHUNK_SIZE, size - start))
+              for i, start in enumerate(range(0, size, CHUNK_SIZE))]
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        parts = pool.map(_generate_chunk, chunks)
+    np.savez(path, categories=np.concatenate([p[0] for p in parts]),
+             category_names=np.array(list(CATEGORIES)),
+             pins=np.concatenate([p[1] for p in parts]),
+             reference=np.concatenate([p[2] for p in parts]),
+             quantized=np.concatenate([p[3] for p in parts]),
+             steps=np.array(STEPS))
+
+
+def decimal_backend(pins: np.ndarray) -> np.ndarray:
+    """holecalc.calculate_hole_size(), the Decimal calculation used by the app"""
+    results = np.empty(len(pins), dtype=object)
+    for i, (a, b, c) in enumerate(pins.astype(str)):
+        results[i] = hc.calculate_hole_size(a, b, c)['result']
+    return results
+
+
+def float_backend(pins: np.ndarray) -> np.ndarray:
+    """Descartes' theorem in Python floats, one triple at a time"""
+    results = np.full(len(pins), np.nan)
+    for i, (a, b, c) in enumerate(pins.astype(float).tolist()):
+        k1, k2, k3 = 2 / a, 2 / b, 2 / c
+        denominator = k1 + k2 + k3 - 2 * math.sqrt(k1 * k2 + k2 * k3 + k1 * k3)
+        if denominator < 0:
+            results[i] = -2 / denominator
+    return results
+
+
+def numpy_backend(pins: np.ndarray) -> np.ndarray:
+    """geometry.enclosing_diameter_batch()"""
+    radii = pins.astype(float).T / 2
+    return geometry.enclosing_diameter_batch(*radii)
+
+
+def numpy_tangent_backend(pins: np.ndarray) -> np.ndarray:
+    """geometry.tangent_circles_batch(), used for the circle diagrams"""
+    radii = pins.astype(float).T / 2
+    return geometry.tangent_circles_batch(*radii)[2][:, 3] * 2
+
+
+BACKENDS = {
+    'decimal': decimal_backend,
+    'float': float_backend,
+    'numpy': numpy_backend,
+    'numpy_tangent': numpy_tangent_backend,
+}
+
+
+def quantize(results: np.ndarray, step: str) -> np.ndarray:
+    """Round results to a multiple of step with ROUND_HALF_UP as Decimal.quantize() does,
+    returned as integer multiples of step. Floats are rounded exactly, as the app would after
+    converting them to Decimal."""
+    if results.dtype == object:
+        step = Decimal(step)
+        return np.array([0 if r is None else
+                         int((r / step).to_integral_value(ROUND_HALF_UP)) for r in results],
+                        dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        scaled = results / float(step)
+        rounded = np.floor(scaled + 0.5)
+        # values too close to a rounding boundary for float arithmetic are rounded exactly
+        close = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[~np.isfinite(rounded)] = 0
+    rounded = rounded.astype(np.int64)
+    for i in np.flatnonzero(close):
+        rounded[i] = int((Decimal(float(results[i])) / Decimal(step))
+                         .to_integral_value(ROUND_HALF_UP))
+    return rounded
+
+
+def _as_float(results: np.ndarray) -> np.ndarray:
+    if results.dtype == object:
+        return np.array([np.nan if r is None else float(r) for r in results])
+    return results
+
+
+def _summarize(values: np.ndarray, quantized: np.ndarray, reference: np.ndarray,
+               reference_quantized: np.ndarray, valid: np.ndarray) -> dict:
+    both = valid & np.isfinite(values)
+    summary = {'triples': int(len(values)),
+               'wrong_validity': int(np.count_nonzero(valid != np.isfinite(values))),
+               'steps': {}}
+    error = np.abs(values[both] - reference[both])
+    for j, step in enumerate(STEPS):
+        summary['steps'][step] = {
+            'max_error_steps': float(error.max() / float(step)) if error.size else 0.0,
+            'mismatches': int(np.count_nonzero(quantized[j][both] != reference_quantized[both, j])),
+        }
+    return summary
+
+
+def evaluate(corpus, backends: list = None, limit: int = None) -> dict:
+    """Run backends over the first limit triples of a loaded corpus, and return a report"""
+    pins = corpus['pins'][:limit]
+    reference = corpus['reference'][:limit]
+    reference_quantized = corpus['quantized'][:limit]
+    categories = corpus['categories'][:limit]
+    names = [str(n) for n in corpus['category_names']]
+    valid = np.isfinite(reference)
+    report = {'triples': int(len(pins)),
+              'categories': {n: int(np.count_nonzero(categories == i))
+                             for i, n in enumerate(names)},
+              'backends': {}}
+    for backend in backends or list(BACKENDS):
+        start = time.perf_counter()
+        results = BACKENDS[backend](pins)
+        elapsed = time.perf_counter() - start
+        quantized = [quantize(results, step) for step in STEPS]
+        values = _as_float(results)
+        summary = _summarize(values, quantized, reference, reference_quantized, valid)
+        summary['throughput_per_s'] = round(len(pins) / elapsed, 1) if elapsed else None
+        summary['categories'] = {}
+        for i, name in enumerate(names):
+            rows = categories == i
+            if rows.any():
+                summary['categories'][name] = _summarize(
+                    values[rows], [q[rows] for q in quantized], reference[rows],
+                    reference_quantized[rows], valid[rows])
+        report['backends'][backend] = summary
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    gen = commands.add_parser('generate', help="generate a reference corpus")
+    gen.add_argument('path', help="output .npz file")
+    gen.add_argument('--size', type=int, default=3000000, help="number of triples")
+    gen.add_argument('--seed', type=int, default=0)
+    gen.add_argument('--workers', type=int, help="worker processes, defaults to CPU count")
+    run = commands.add_parser('run', help="compare backends against a corpus")
+    run.add_argument('path', help="corpus .npz file")
+    run.add_argument('--backends', default=','.join(BACKENDS),
+                     help=f"comma separated list of {', '.join(BACKENDS)}")
+    run.add_argument('--limit', type=int, help="only use the first LIMIT triples")
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        generate(args.path, args.size, args.seed, args.workers)
+        return None
+    backends = args.backends.split(',')
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error(f"unknown backend {backend}")
+    with np.load(args.path) as corpus:
+        report = evaluate(corpus, backends, args.limit)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Export slices of the calculation audit log to CSV, and summarize it.
+
+The log is memory mapped, see auditlog.py, so slices of a time range are found with a binary
+search of the time column, and filters on kind, units and result are applied to blocks of
+records with numpy. Times are ISO 8601, in UTC unless they give an offset.
+
+Example usage:
+    python tools/audit.py export /app/data/holecalc-audit.log out.csv \\
+        --start 2021-03-01 --end 2021-03-31T23:59:59 --kind hole_size --min-result 0.5
+    python tools/audit.py summary /app/data/holecalc-audit.log
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+import auditlog  # noqa: E402
+
+
+def parse_time(text: str) -> float:
+    """Unix time of an ISO 8601 date or date and time, UTC unless it gives an offset"""
+    moment = datetime.datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+def summary(records: np.ndarray) -> dict:
+    """Number of records of the log in total and of each kind, and the times of the first and
+    last records"""
+    kinds = np.bincount(records['kind'], minlength=len(auditlog.KINDS) + 1)
+    return {'records': len(records),
+            'first': _iso(float(records['time'][0])) if len(records) else None,
+            'last': _iso(float(records['time'][-1])) if len(records) else None,
+            'kinds': {kind: int(count) for kind, count in zip(auditlog.KINDS, kinds[1:])},
+            'errors': int(np.count_nonzero(records['error'])) if len(records) else 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="export matching records to CSV")
+    export.add_argument('path', help="audit log file")
+    export.add_argument('output', help="output .csv file, or - for standard output")
+    export.add_argument('--start', type=parse_time, help="earliest time")
+    export.add_argument('--end', type=parse_time, help="latest time")
+    export.add_argument('--kind', choices=auditlog.KINDS)
+    export.add_argument('--units', choices=auditlog.UNITS)
+    export.add_argument('--min-result', type=float, help="smallest bore, pin or other result")
+    export.add_argument('--max-result', type=float, help="largest bore, pin or other result")
+    summarize = commands.add_parser('summary', help="print record counts and time span as JSON")
+    summarize.add_argument('path', help="audit log file")
+    args = parser.parse_args(argv)
+    records = auditlog.read_log(args.path)
+    if args.command == 'summary':
+        print(json.dumps(summary(records), indent=2))
+        return
+    blocks = auditlog.scan(records, args.start, args.end, args.kind, args.units,
+                           args.min_result, args.max_result)
+    if args.output == '-':
+        count = auditlog.write_csv(blocks, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            count = auditlog.write_csv(blocks, f)
+    print(f"Exported {count} of {len(records)} records", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Out-of-core generator of bore maps: the bore diameter described by every combination of pin
+diameters on a regular 3D grid of pin1 × pin2 × pin3 sizes, for process capability studies.
+
+The map is written chunk by chunk into a memory-mapped .npy file of shape (pin3, pin1, pin2),
+by a pool of worker processes, so memory use stays constant however large the grid is. Invalid
+pin combinations are NaN. Completed chunks are recorded in a progress file next to the map, so
+an interrupted run picks up where it left off when started again with the same grid.
+
+Example usage:
+    python tools/boremap.py generate map.npy --pin1 0.1 1.0 2000 --pin2 0.1 1.0 2000 \\
+        --pin3 0.1 1.0 100 --workers 4
+    python tools/boremap.py preview map.npy preview.pgm --size 256 --slice 50
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from holecalc.geometry import enclosing_diameter_batch  # noqa: E402
+
+# number of map cells computed per chunk, bounds the memory used by each worker
+DEFAULT_CHUNK_CELLS = 1 << 18
+
+
+def axis_values(axis: tuple) -> np.ndarray:
+    """Pin diameters along one grid axis, given as (start, stop, count) or a single diameter"""
+    if len(axis) == 1:
+        return np.array([float(axis[0])])
+    start, stop, count = axis
+    return np.linspace(float(start), float(stop), int(count))
+
+
+class GridSpec:
+    """Pin diameter axes, data type and chunking of a bore map"""
+
+    def __init__(self, pin1: tuple, pin2: tuple, pin3: tuple, dtype: str = 'float32',
+                 chunk_cells: int = DEFAULT_CHUNK_CELLS):
+        self.axes = tuple(tuple(a) for a in (pin1, pin2, pin3))
+        self.dtype = np.dtype(dtype).name
+        self.values = tuple(axis_values(a) for a in self.axes)
+        self.shape = (len(self.values[2]), len(self.values[0]), len(self.values[1]))
+        # each chunk is a block of pin1 rows for one pin3 value
+        self.chunk_rows = max(1, min(self.shape[1], chunk_cells // self.shape[2]))
+        self.chunks_per_slice = -(-self.shape[1] // self.chunk_rows)
+        self.chunks = self.shape[0] * self.chunks_per_slice
+
+    def to_dict(self) -> dict:
+        return {'pin1': self.axes[0], 'pin2': self.axes[1], 'pin3': self.axes[2],
+                'dtype': self.dtype, 'chunk_rows': self.chunk_rows}
+
+    def chunk(self, index: int) -> tuple:
+        """pin3 index and range of pin1 rows covered by a chunk"""
+        k, block = divmod(index, self.chunks_per_slice)
+        start = block * self.chunk_rows
+        return k, start, min(start + self.chunk_rows, self.shape[1])
+
+
+def _paths(path: str) -> tuple:
+    return path + '.json', path + '.progress.npy'
+
+
+def _open_outputs(path: str, spec: GridSpec, overwrite: bool) -> np.memmap:
+    """Open the progress array of an existing map with the same grid, or create a new map"""
+    spec_path, progress_path = _paths(path)
+    if not overwrite and all(os.path.exists(p) for p in (path, spec_path, progress_path)):
+        with open(spec_path) as f:
+            existing = json.load(f)
+        if existing != json.loads(json.dumps(spec.to_dict())):
+            raise ValueError(f"{path} was generated with a different grid, use --overwrite")
+        logging.info(f"Resuming bore map {path}")
+        return np.load(progress_path, mmap_mode='r+')
+    logging.info(f"Creating bore map {path} with shape {spec.shape}")
+    np.lib.format.open_memmap(path, mode='w+', dtype=spec.dtype, shape=spec.shape).flush()
+    progress = np.lib.format.open_memmap(progress_path, mode='w+', dtype=np.uint8,
+                                         shape=(spec.chunks,))
+    progress.flush()
+    # the spec is written last, a map without it is never resumed
+    with open(spec_path, 'w') as f:
+        json.dump(spec.to_dict(), f)
+    return progress
+
+
+# state of each worker process, set by _init_worker()
+_worker = {}
+
+
+def _init_worker(path: str, spec: GridSpec):
+    _worker['map'] = np.load(path, mmap_mode='r+')
+    _worker['spec'] = spec
+
+
+def _compute_chunk(index: int) -> int:
+    spec = _worker['spec']
+    k, start, stop = spec.chunk(index)
+    pin1, pin2, pin3 = spec.values
+    bore_map = _worker['map']
+    bore_map[k, start:stop] = enclosing_diameter_batch(
+        pin1[start:stop, None] / 2, pin2[None, :] / 2, pin3[k] / 2)
+    # data must reach the file before the chunk is recorded as done
+    bore_map.flush()
+    return index
+
+
+def generate(path: str, spec: GridSpec, workers: int = None, overwrite: bool = False) -> int:
+    """Generate the bore map for spec at path, resuming a previous run if there is one.
+
+    :returns: number of chunks computed by this call
+    """
+    progress = _open_outputs(path, spec, overwrite)
+    pending = np.flatnonzero(progress == 0).tolist()
+    if not pending:
+        logging.info(f"Bore map {path} is already complete")
+        return 0
+    logging.info(f"{len(pending)} of {spec.chunks} chunks to compute")
+    start = time.perf_counter()
+    computed = 0
+    with multiprocessing.Pool(workers or os.cpu_count(), initializer=_init_worker,
+                              initargs=(path, spec)) as pool:
+        for index in pool.imap_unordered(_compute_chunk, pending):
+            progress[index] = 1
+            progress.flush()
+            computed += 1
+            if computed % 100 == 0:
+                elapsed = time.perf_counter() - start
+                logging.info(f"{computed}/{len(pending)} chunks, "
+                             f"{computed / elapsed:.1f} chunks/s")
+    logging.info(f"Computed {computed} chunks in {time.perf_counter() - start:.1f} s")
+    return computed
+
+
+def preview(path: str, size: int = 256) -> np.ndarray:
+    """Downsampled copy of a bore map, with pin1 and pin2 axes of at most size values. Reads
+    only the sampled values from the memory-mapped file."""
+    bore_map = np.load(path, mmap_mode='r')
+    step = max(1, -(-max(bore_map.shape[1:]) // size))
+    return np.array(bore_map[:, ::step, ::step])
+
+
+def write_pgm(path: str, image: np.ndarray):
+    """Write a 2D array as a greyscale PGM image scaled to its range of values, NaN as black"""
+    finite = np.isfinite(image)
+    low, high = (image[finite].min(), image[finite].max()) if finite.any() else (0, 0)
+    scaled = np.zeros(image.shape, dtype=np.uint8)
+    scaled[finite] = 1 + (image[finite] - low) / ((high - low) or 1) * 254
+    with open(path, 'wb') as f:
+        f.write(f"P5\n{image.shape[1]} {image.shape[0]}\n255\n".encode())
+        f.write(scaled.tobytes())
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    gen = commands.add_parser('generate', help="generate or resume a bore map")
+    gen.add_argument('path', help="output .npy file")
+    for pin in ('pin1', 'pin2', 'pin3'):
+        gen.add_argument(f'--{pin}', nargs='+', required=True, metavar='DIA',
+                         help="start stop count, or a single diameter")
+    gen.add_argument('--dtype', default='float32', choices=('float32', 'float64'))
+    gen.add_argument('--chunk-cells', type=int, default=DEFAULT_CHUNK_CELLS)
+    gen.add_argument('--workers', type=int, help="worker processes, defaults to CPU count")
+    gen.add_argument('--overwrite', action='store_true', help="discard an existing map")
+    prev = commands.add_parser('preview', help="write a downsampled preview of a bore map")
+    prev.add_argument('path', help="bore map .npy file")
+    prev.add_argument('output', help="output .npy file, or .pgm image of one pin3 slice")
+    prev.add_argument('--size', type=int, default=256)
+    prev.add_argument('--slice', type=int, default=0, help="pin3 index for .pgm images")
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        for pin in ('pin1', 'pin2', 'pin3'):
+            if len(getattr(args, pin)) not in (1, 3):
+                parser.error(f"--{pin} takes start stop count, or a single diameter")
+        spec = GridSpec(args.pin1, args.pin2, args.pin3, args.dtype, args.chunk_cells)
+        generate(args.path, spec, args.workers, args.overwrite)
+    else:
+        downsampled = preview(args.path, args.size)
+        if args.output.endswith('.pgm'):
+            write_pgm(args.output, downsampled[args.slice])
+        else:
+            np.save(args.output, downsampled)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark of binding and validating the WTForms form of each calculator against the time of
+the whole POST request through the app, and prints the time of each and the share of the request
+spent on the form as JSON.
+
+Runs offline, example usage:
+    python tools/formbench.py --number 5000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+PINS = {"pin1": "0.2500", "pin2": "0.3125", "pin3": "0.5000", "units": "in",
+        "precision": "0.001"}
+# case name: (route, form class name in forms.py, submitted data)
+CASES = {
+    'three_pin': ('/', 'ThreePinForm', dict(PINS, tol_radio='tol', pin1_class='X',
+                                            pin1_sign='+', pin2_class='XX', pin2_sign='-',
+                                            pin3_class='ZZ', pin3_sign='+')),
+    'three_pin_invalid': ('/', 'ThreePinForm', dict(PINS, pin2='abc', tol_radio='nom')),
+    'reverse': ('/reverse', 'ReverseForm', dict(PINS, bore="1.5")),
+    'pin_size': ('/pinsize', 'PinSizeForm', {"pin_dia": "0.25", "pin_class": "XX",
+                                             "pin_sign": "+", "units": "in"}),
+    'optimize': ('/optimize', 'OptimizeForm', dict(PINS, tolerance_plus="0.0003",
+                                                   tolerance_minus="0.0001")),
+    'roundness': ('/roundness', 'RoundnessForm', {"readings": "1 2 3 0\n1 2 3 120\n1 2 3 240",
+                                                  "units": "in", "precision": "0.0001"}),
+    'gauge_set': ('/gaugeset', 'GaugeSetForm', {"sizes": "0.25 0.5 0.75",
+                                                "classes": ["ZZ", "XX"], "signs": ["+", "-"],
+                                                "units": "in", "output": "csv"}),
+}
+
+
+def per_call_us(func, number: int) -> float:
+    """Best of three average times of calling func, in microseconds"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1e6, 2)
+
+
+def run(number: int = 2000) -> dict:
+    import forms
+    from main import app, load_config
+    load_config('testing')
+    logging.getLogger().setLevel(logging.ERROR)
+    client = app.test_client()
+    results = {}
+    for case, (route, form_name, data) in CASES.items():
+        form_class = getattr(forms, form_name)
+        with app.test_request_context(method='POST', data=data):
+            valid = form_class(meta={'csrf': False}).validate()
+            form_us = per_call_us(lambda: form_class(meta={'csrf': False}).validate(), number)
+        request_us = per_call_us(lambda: client.post(route, data=data), number)
+        results[case] = {
+            'valid': valid,
+            'form_us': form_us,
+            'request_us': request_us,
+            'form_share': round(form_us / request_us, 3),
+        }
+    return {'number': number, 'cases': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=2000, help="calls per measurement")
+    args = parser.parse_args(argv)
+    report = run(args.number)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Load generator for the hole calc flask app. Drives a weighted mix of realistic requests
+against the app, either in-process through WSGI or over HTTP against a locally started gunicorn,
+and prints throughput, latency percentiles and error rates as JSON.
+
+Runs offline, example usage:
+    python tools/loadtest.py --mode wsgi --duration 10 --concurrency 4
+    python tools/loadtest.py --mode gunicorn --workers 4 --worker-class sync --duration 30
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+
+def _pin(rng: random.Random) -> str:
+    return f"{rng.uniform(0.05, 2.0):.4f}"
+
+
+def _three_pin_data(rng: random.Random, tol_radio: str) -> dict:
+    data = {"tol_radio": tol_radio, "units": rng.choice(("in", "mm")), "precision": "0.001"}
+    for i in (1, 2, 3):
+        data[f"pin{i}"] = _pin(rng)
+        data[f"pin{i}_class"] = rng.choice(("XX", "X", "Y", "Z", "ZZ"))
+        data[f"pin{i}_sign"] = rng.choice(("+", "-"))
+    return data
+
+
+def nominal_three_pin(rng):
+    return 'POST', '/', _three_pin_data(rng, 'nom')
+
+
+def tolerance_three_pin(rng):
+    return 'POST', '/', _three_pin_data(rng, 'tol')
+
+
+def reverse(rng):
+    pin1, pin2 = rng.uniform(0.05, 1.0), rng.uniform(0.05, 1.0)
+    bore = (pin1 + pin2) * rng.uniform(1.1, 2.0)
+    return 'POST', '/reverse', {"pin1": f"{pin1:.4f}", "pin2": f"{pin2:.4f}",
+                                "bore": f"{bore:.4f}", "units": "in", "precision": "0.001"}
+
+
+def pin_size(rng):
+    return 'POST', '/pinsize', {"pin_dia": _pin(rng), "pin_class": rng.choice(("XX", "ZZ")),
+                                "pin_sign": rng.choice(("+", "-")), "units": "in"}
+
+
+def static_page(rng):
+    return 'GET', rng.choice(('/', '/reverse', '/pinsize', '/about/', '/guide/')), None
+
+
+def invalid_input(rng):
+    data = _three_pin_data(rng, rng.choice(('nom', 'tol')))
+    data[rng.choice(("pin1", "pin2", "pin3"))] = rng.choice(("0", "-1", "abc", "", "1e400"))
+    return 'POST', '/', data
+
+
+# scenario name: (relative weight, request generator)
+DEFAULT_MIX = {
+    'nominal_three_pin': (30, nominal_three_pin),
+    'tolerance_three_pin': (20, tolerance_three_pin),
+    'reverse': (10, reverse),
+    'pin_size': (10, pin_size),
+    'static_page': (20, static_page),
+    'invalid_input': (10, invalid_input),
+}
+
+
+class WSGITarget:
+    """Sends requests to the flask app in this process, through its WSGI interface"""
+
+    def __init__(self):
+        from main import app, load_config
+        load_config('testing')
+        # logging from the test config would dominate the measurements
+        logging.getLogger().setLevel(logging.ERROR)
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, method: str, path: str, data: dict) -> int:
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPTarget:
+    """Sends requests over HTTP with one keep-alive connection per thread"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.local = threading.local()
+
+    def send(self, method: str, path: str, data: dict) -> int:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=30)
+        body = urlencode(data) if data is not None else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if data else {}
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.local.connection = None
+            connection.close()
+            raise
+        return response.status
+
+    def close(self):
+        pass
+
+
+class GunicornTarget(HTTPTarget):
+    """Starts gunicorn serving the app on a free local port, and sends requests to it"""
+
+    def __init__(self, workers: int, worker_class: str):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        super().__init__('127.0.0.1', port)
+        env = dict(os.environ, FLASK_ENV='testing')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_conf.py',
+             '--bind', f'127.0.0.1:{port}',
+             '--workers', str(workers), '--worker-class', worker_class,
+             '--log-level', 'warning', 'main:app'],
+            cwd=ROOT_DIR, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if self.send('GET', '/heartbeat', None) == 200:
+                    return
+            except OSError:
+                time.sleep(0.1)
+        self.close()
+        raise RuntimeError("gunicorn did not start within 30 seconds")
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[rank], 3)
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Aggregate (latency seconds, status or None on transport error) samples"""
+    latencies = sorted(s[0] * 1000 for s in samples)
+    errors = sum(1 for s in samples if s[1] is None or s[1] >= 500)
+    rejected = sum(1 for s in samples if s[1] == 429)
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 5) if samples else None,
+        'rejected': rejected,
+        'latency_ms': {name: percentile(latencies, p)
+                       for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))},
+    }
+
+
+def run(target, mix: dict = None, duration: float = 10, requests: int = None,
+        concurrency: int = 4, seed: int = 0) -> dict:
+    """Drive target with concurrency threads until duration seconds have passed, or requests
+    requests have been sent, and return a report dictionary"""
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    weights = [mix[n][0] for n in names]
+    samples = {n: [] for n in names}
+    lock = threading.Lock()
+    remaining = [requests]
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        while time.perf_counter() < deadline:
+            with lock:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            name = rng.choices(names, weights)[0]
+            method, path, data = mix[name][1](rng)
+            start = time.perf_counter()
+            try:
+                status = target.send(method, path, data)
+            except (http.client.HTTPException, OSError):
+                status = None
+            latency = time.perf_counter() - start
+            with lock:
+                samples[name].append((latency, status))
+
+    threads = [threading.Thread(target=worker, args=(seed + i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    report = summarize([s for n in names for s in samples[n]], elapsed)
+    report['elapsed_s'] = round(elapsed, 3)
+    report['concurrency'] = concurrency
+    report['scenarios'] = {n: summarize(samples[n], elapsed) for n in names if samples[n]}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('wsgi', 'gunicorn', 'http'), default='wsgi')
+    parser.add_argument('--url', default='127.0.0.1:8080', help="host:port for --mode http")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to run for")
+    parser.add_argument('--requests', type=int, help="stop after this many requests")
+    parser.add_argument('--concurrency', type=int, default=4, help="client threads")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--worker-class', default='sync', help="gunicorn worker class")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.mode == 'wsgi':
+        target = WSGITarget()
+    elif args.mode == 'gunicorn':
+        target = GunicornTarget(args.workers, args.worker_class)
+    else:
+        host, _, port = args.url.rpartition(':')
+        target = HTTPTarget(host, int(port))
+    try:
+        report = run(target, duration=args.duration, requests=args.requests,
+                     concurrency=args.concurrency, seed=args.seed)
+    finally:
+        target.close()
+    report['mode'] = args.mode
+    if args.mode == 'gunicorn':
+        report['workers'] = args.workers
+        report['worker_class'] = args.worker_class
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
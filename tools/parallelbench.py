@@ -0,0 +1,95 @@
+"""Benchmark of calculating one large bore map on the process pool of parallel.py with
+increasing numbers of processes, and prints the time, throughput and speedup over calculating
+it in-process for each as JSON.
+
+No route calculates on the pool yet, bore maps are the stand-in workload: the same grid that
+tools/boremap.py generates offline. Scaling is only near linear up to the number of CPUs, which
+is included in the report.
+
+Runs offline, example usage:
+    python tools/parallelbench.py --cells 4194304 --processes 1 2 4 8
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from holecalc.geometry import enclosing_diameter_batch  # noqa: E402
+
+
+def grid(cells: int) -> tuple:
+    """pin1, pin2 and pin3 axes of a cubic bore map of about cells bores"""
+    side = max(2, round(cells ** (1 / 3)))
+    return (np.linspace(0.05, 1.0, side), np.linspace(0.05, 1.0, side),
+            np.linspace(0.1, 2.0, side))
+
+
+def bore_map_rows(pin1, pin3, pin2, bores):
+    """Kernel of the bore map: the bores of rows of pin 1 and pin 3 diameters, against every
+    pin 2 diameter"""
+    bores[:] = enclosing_diameter_batch(pin1[:, None] / 2, pin2[None, :] / 2, pin3[:, None] / 2)
+
+
+def bore_map(pool, pin1, pin2, pin3) -> np.ndarray:
+    """A bore map of shape (pin3 × pin1, pin2), with a row per pin 3 and pin 1 diameter"""
+    bores, = pool.run(bore_map_rows,
+                      split=(np.tile(pin1, len(pin3)), np.repeat(pin3, len(pin1))),
+                      shared=(pin2,),
+                      outputs=(((len(pin3) * len(pin1), len(pin2)), 'float64'),))
+    return bores
+
+
+def run(cells: int = 1 << 22, processes: list = None, repeat: int = 3) -> dict:
+    from main import app, load_config, parallel_pool
+    import parallel
+    load_config('testing')
+    logging.getLogger().setLevel(logging.ERROR)
+    axes = grid(cells)
+    cells = len(axes[0]) * len(axes[1]) * len(axes[2])
+    results = []
+    reference = None
+    baseline = None
+    for count in processes or range(1, parallel.cpu_count() + 1):
+        app.config.update(PARALLEL_ENABLED=count > 1, PARALLEL_PROCESSES=count,
+                          PARALLEL_THRESHOLD=0)
+        parallel_pool.start()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bores = bore_map(parallel_pool, *axes)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if reference is None:
+            reference = bores
+        baseline = baseline or best
+        results.append({'processes': count,
+                        'seconds': round(best, 4),
+                        'cells_per_second': round(cells / best),
+                        'speedup': round(baseline / best, 2),
+                        'efficiency': round(baseline / best / count, 2),
+                        'matches': bool(np.array_equal(bores, reference, equal_nan=True))})
+    parallel_pool.close()
+    return {'cells': cells, 'cpus': parallel.cpu_count(), 'runs': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cells', type=int, default=1 << 22, help="bores in the map")
+    parser.add_argument('--processes', type=int, nargs='+',
+                        help="numbers of processes to run with, by default 1 to the CPU count")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of each, the best is kept")
+    args = parser.parse_args(argv)
+    report = run(args.cells, args.processes, args.repeat)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
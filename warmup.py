@@ -0,0 +1,75 @@
+"""Module containing the warm-up each gunicorn worker runs before it accepts requests.
+
+A fresh worker would otherwise make its first requests pay for compiling Jinja templates, setting
+up WTForms classes, opening the shared state files and first use of the calculation code. The
+warm-up compiles every template, requests every page that takes no arguments through a test
+client, then runs the tasks registered with WarmUp.task(), such as one calculation of each kind.
+Until it has finished, the heartbeat route reports the worker as not ready.
+
+Configuration keys read from the flask app config:
+- WARMUP_ENABLED: run the warm-up in gunicorn's post_worker_init hook, and report workers that
+  have not finished it as not ready
+"""
+
+import logging
+import time
+from flask import current_app
+
+# endpoints not requested during warm-up
+SKIP_ENDPOINTS = ('static', 'hashed_asset')
+
+
+class WarmUp:
+    """Flask extension holding the warm-up tasks of an app, and whether this worker process has
+    run them"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.tasks = []
+        self.ready = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['warmup'] = self
+
+    def task(self, func):
+        """Decorator registering a function to run during warm-up"""
+        self.tasks.append(func)
+        return func
+
+    def is_ready(self) -> bool:
+        """Whether this worker may be sent traffic, always true when warm-up is disabled"""
+        return self.ready or not current_app.config.get('WARMUP_ENABLED', False)
+
+    def _page_urls(self) -> list:
+        return [rule.rule for rule in self.app.url_map.iter_rules()
+                if 'GET' in rule.methods and not rule.arguments
+                and rule.endpoint not in SKIP_ENDPOINTS]
+
+    def run(self) -> bool:
+        """Run the warm-up, returns whether it succeeded. A worker whose warm-up failed still
+        serves requests, but keeps reporting itself as not ready."""
+        start = time.perf_counter()
+        try:
+            env = self.app.jinja_env
+            for name in env.list_templates():
+                env.get_template(name)
+            client = self.app.test_client()
+            for url in self._page_urls():
+                client.get(url).close()
+            for func in self.tasks:
+                func()
+        except Exception:
+            logging.exception("Worker warm-up failed")
+            return False
+        self.ready = True
+        logging.info(f"Worker warm-up finished in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return True
+
+
+def run(app):
+    """Warm up a worker if WARMUP_ENABLED is set, for use in gunicorn's post_worker_init hook"""
+    if app.config.get('WARMUP_ENABLED', False):
+        app.extensions['warmup'].run()